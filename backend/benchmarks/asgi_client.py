@@ -0,0 +1,120 @@
+"""Minimal in-process ASGI clients used by the benchmarks (no network, no extra deps)"""
+import asyncio
+import json
+from typing import Callable, Dict, Optional, Tuple
+
+
+async def asgi_request(app, method: str, path: str, payload: Dict = None,
+                       on_chunk: Optional[Callable[[bytes], None]] = None) -> Tuple[int, bytes]:
+    """Send a single HTTP request straight into an ASGI app and return (status, body)
+
+    ``on_chunk`` is called with each body chunk as it is sent, for timing streamed responses.
+    """
+    body = json.dumps(payload).encode() if payload is not None else b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"bench"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    sent = False
+    finished = asyncio.Event()
+    status = 0
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Streaming responses listen for a disconnect while they send; the
+        # client only goes away once the response is complete
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            chunks.append(chunk)
+            if on_chunk is not None and chunk:
+                on_chunk(chunk)
+            if not message.get("more_body", False):
+                finished.set()
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    return status, b"".join(chunks)
+
+
+class ASGIWebSocket:
+    """A WebSocket client connected straight to an ASGI app"""
+
+    def __init__(self, app, path: str, query_string: bytes = b""):
+        self.app = app
+        self.path = path
+        self.query_string = query_string
+        self._to_app: asyncio.Queue = asyncio.Queue()
+        self._from_app: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self.closed = False
+
+    async def connect(self) -> "ASGIWebSocket":
+        scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "scheme": "ws",
+            "path": self.path,
+            "raw_path": self.path.encode(),
+            "query_string": self.query_string,
+            "root_path": "",
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+            "subprotocols": [],
+        }
+        self._task = asyncio.create_task(self.app(scope, self._to_app.get, self._send))
+        await self._to_app.put({"type": "websocket.connect"})
+        accepted = await self._from_app.get()
+        if accepted is None:
+            raise ConnectionError(f"{self.path} was rejected")
+        return self
+
+    async def _send(self, message: Dict):
+        if message["type"] == "websocket.send":
+            await self._from_app.put(message.get("text") or message.get("bytes"))
+        elif message["type"] == "websocket.accept":
+            await self._from_app.put(True)
+        elif message["type"] == "websocket.close":
+            self.closed = True
+            await self._from_app.put(None)
+
+    async def send_json(self, data: Dict):
+        await self._to_app.put({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive_json(self) -> Optional[Dict]:
+        """The next message from the server; None once it closed the socket"""
+        text = await self._from_app.get()
+        return json.loads(text) if text is not None else None
+
+    async def close(self):
+        await self._to_app.put({"type": "websocket.disconnect", "code": 1000})
+        if self._task is not None:
+            await self._task
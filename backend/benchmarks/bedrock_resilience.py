@@ -0,0 +1,107 @@
+"""
+Chat latency through the real boto3 clients against the local Bedrock stub
+server, while it is healthy, failing and slow.
+
+Starts services.bedrock_stub.StubBedrockServer in-process, points
+ChatbotService at it (BEDROCK_ENDPOINT_URL, dummy credentials) and sends
+--requests follow-up messages per phase:
+
+- healthy: every call succeeds after --latency-ms
+- failing: every call gets a 503; the circuit breakers should open and
+  later requests go straight to the fallback
+- recovered: the stub is healthy again after the breakers' open period
+- slow: --slow-rate of KB retrievals take --slow-ms; hedging (--hedge-ms)
+  should keep them off the chat latency tail
+
+One JSON line per phase: latency percentiles, share of fallback replies,
+breaker states and hedging counts. Run from the backend directory:
+
+    python -m benchmarks.bedrock_resilience --requests 40 --hedge-ms 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+
+def pick(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))], 3) if values else None
+
+
+async def run_phase(service, name: str, requests: int) -> dict:
+    history = [{"role": "user", "content": "We are two adults"}, {"role": "assistant", "content": "Lovely! Where to?"}]
+    latencies, fallbacks = [], 0
+    for i in range(requests):
+        features_text = f"what should we see in kerala, option {name} {i}?"
+        began = time.perf_counter()
+        result = await service.process_message(features_text, history)
+        latencies.append((time.perf_counter() - began) * 1000)
+        fallbacks += not result["message"].startswith("Great question")
+    stats = service.bedrock_stats()
+    return {
+        "phase": name,
+        "requests": requests,
+        "p50_ms": pick(latencies, 0.5),
+        "p90_ms": pick(latencies, 0.9),
+        "p99_ms": pick(latencies, 0.99),
+        "fallback_share": round(fallbacks / requests, 3),
+        "llm_breaker": stats["circuit_breakers"]["llm"]["state"],
+        "kb_breaker": stats["circuit_breakers"]["kb"]["state"],
+        "short_circuited": stats["circuit_breakers"]["llm"]["short_circuited"] + stats["circuit_breakers"]["kb"]["short_circuited"],
+        "kb_hedging": stats["kb_hedging"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40, help="requests per phase")
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--slow-rate", type=float, default=0.2)
+    parser.add_argument("--slow-ms", type=float, default=500)
+    parser.add_argument("--hedge-ms", type=int, default=60, help="KB hedge delay (0 disables hedging)")
+    parser.add_argument("--open-seconds", type=float, default=1.0, help="circuit breaker open period")
+    args = parser.parse_args()
+
+    from services.bedrock_stub import StubBedrockServer
+
+    server = StubBedrockServer(
+        latency=args.latency_ms / 1000, slow_latency=args.slow_ms / 1000, slow_operations=["retrieve"]
+    ).start()
+    os.environ.update(
+        BEDROCK_STUB="false",
+        BEDROCK_ENDPOINT_URL=server.endpoint_url,
+        AWS_ACCESS_KEY_ID="stub",
+        AWS_SECRET_ACCESS_KEY="stub",
+        BEDROCK_KNOWLEDGE_BASE_ID="STUBKB0001",
+        KB_BACKEND="bedrock",
+        KB_CACHE_BACKEND="none",
+        RESPONSE_CACHE_BACKEND="none",
+        KB_HEDGE_AFTER_MS=str(args.hedge_ms),
+        BEDROCK_BREAKER_OPEN_SECONDS=str(args.open_seconds),
+        BEDROCK_MAX_ATTEMPTS="1",
+        BEDROCK_PREWARM_CONNECTIONS="0",
+        # The failing phase logs Bedrock errors; keep them out of the results
+        LOG_LEVEL="CRITICAL",
+    )
+    # Settings are read at import, after the environment is in place
+    from services.chatbot_service import ChatbotService
+
+    service = ChatbotService().start()
+    service.wait_ready()
+
+    print(json.dumps(asyncio.run(run_phase(service, "healthy", args.requests))))
+    server.error_rate = 1.0
+    print(json.dumps(asyncio.run(run_phase(service, "failing", args.requests))))
+    server.error_rate = 0.0
+    time.sleep(args.open_seconds)
+    print(json.dumps(asyncio.run(run_phase(service, "recovered", args.requests))))
+    server.slow_rate = args.slow_rate
+    print(json.dumps(asyncio.run(run_phase(service, "slow", args.requests))))
+    print(json.dumps({"stub": server.stats()}))
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Agent broadcast fan-out latency with slow and stalled consumers.
+
+Connects fake agent sockets to a ConnectionManager: most acknowledge each
+send immediately, some take --slow-delay per send, and a few "stalled" ones
+take --stalled-delay (a half-dead TCP peer). Broadcasts are sent at a fixed
+interval and the delivery latency is measured at the healthy agents, first
+for the old sequential loop and then for each outbound-queue policy. Run
+from the backend directory:
+
+    python -m benchmarks.broadcast --agents 500 --slow 25 --stalled 5
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from config import settings
+from routers.agent import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float, record: bool):
+        self.delay = delay
+        self.record = record
+        self.received = {}
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message: dict):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.record and "seq" in message:
+            self.received[message["seq"]] = time.perf_counter()
+
+    async def send_text(self, text: str):
+        # Outbound channels queue pre-encoded JSON
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.record:
+            message = json.loads(text)
+            if "seq" in message:
+                self.received[message["seq"]] = time.perf_counter()
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+def make_sockets(agents: int, slow: int, stalled: int, slow_delay: float, stalled_delay: float):
+    sockets = []
+    for i in range(agents):
+        if i < stalled:
+            sockets.append(FakeWebSocket(stalled_delay, record=False))
+        elif i < stalled + slow:
+            sockets.append(FakeWebSocket(slow_delay, record=False))
+        else:
+            sockets.append(FakeWebSocket(0, record=True))
+    return sockets
+
+
+async def sequential_broadcast(sockets, message: dict):
+    """The previous broadcast_to_agents: one awaited send after another"""
+    for socket in sockets:
+        await socket.send_json(message)
+
+
+def summarize(name: str, sockets, sent_at: dict, call_times: list) -> dict:
+    latencies = sorted(
+        (received - sent_at[seq]) * 1000
+        for socket in sockets if socket.record
+        for seq, received in socket.received.items()
+    )
+    expected = sum(1 for socket in sockets if socket.record) * len(sent_at)
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))], 2) if latencies else None
+    return {
+        "mode": name,
+        "delivered_to_healthy": f"{len(latencies)}/{expected}",
+        "p50_ms": pick(0.5),
+        "p99_ms": pick(0.99),
+        "max_ms": round(latencies[-1], 2) if latencies else None,
+        "broadcast_call_ms": round(max(call_times) * 1000, 3),
+    }
+
+
+async def run_sequential(args) -> dict:
+    sockets = make_sockets(args.agents, args.slow, args.stalled, args.slow_delay, args.stalled_delay)
+    sent_at, call_times = {}, []
+    for seq in range(args.baseline_broadcasts):
+        sent_at[seq] = time.perf_counter()
+        await sequential_broadcast(sockets, {"type": "customer_message", "seq": seq})
+        call_times.append(time.perf_counter() - sent_at[seq])
+    return summarize("sequential", sockets, sent_at, call_times)
+
+
+async def run_channels(args, policy: str) -> dict:
+    settings.agent_outbound_policy = policy
+    settings.agent_outbound_queue_size = args.queue_size
+    settings.agent_outbound_max_lag_ms = args.max_lag_ms
+    manager = ConnectionManager()
+    sockets = make_sockets(args.agents, args.slow, args.stalled, args.slow_delay, args.stalled_delay)
+    for i, socket in enumerate(sockets):
+        await manager.connect_agent(f"agent_{i}", socket)
+
+    sent_at, call_times = {}, []
+    for seq in range(args.broadcasts):
+        sent_at[seq] = time.perf_counter()
+        await manager.broadcast_to_agents({"type": "customer_message", "seq": seq})
+        call_times.append(time.perf_counter() - sent_at[seq])
+        # Queue-size updates are what the coalesce policy folds together
+        await manager.broadcast_to_agents({"type": "queue_update", "queue_size": seq}, coalesce_key="queue_update")
+        await asyncio.sleep(args.interval)
+    await asyncio.sleep(0.2)
+
+    result = summarize(policy, sockets, sent_at, call_times)
+    result.update({k: v for k, v in manager.outbound_stats().items() if k in ("dropped", "coalesced", "slow_disconnects")})
+    for agent_id in list(manager.active_agents):
+        manager.disconnect_agent(agent_id)
+    return result
+
+
+async def run(args) -> list:
+    results = []
+    if args.baseline_broadcasts:
+        results.append(await run_sequential(args))
+    for policy in ("drop_oldest", "coalesce", "disconnect"):
+        results.append(await run_channels(args, policy))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=500)
+    parser.add_argument("--slow", type=int, default=25, help="agents taking --slow-delay per send")
+    parser.add_argument("--stalled", type=int, default=5, help="agents taking --stalled-delay per send")
+    parser.add_argument("--slow-delay", type=float, default=0.05)
+    parser.add_argument("--stalled-delay", type=float, default=1.0)
+    parser.add_argument("--broadcasts", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between broadcasts")
+    parser.add_argument("--baseline-broadcasts", type=int, default=3, help="0 skips the slow sequential baseline")
+    parser.add_argument("--queue-size", type=int, default=16)
+    parser.add_argument("--max-lag-ms", type=int, default=500)
+    args = parser.parse_args()
+
+    for result in asyncio.run(run(args)):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
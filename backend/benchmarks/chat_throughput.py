@@ -0,0 +1,70 @@
+"""
+Concurrent /api/chat throughput for a single worker.
+
+Bedrock is replaced by the offline stub clients, which block for a fixed
+latency the way boto3 does while waiting on the network. Run from the backend directory:
+
+    python -m benchmarks.chat_throughput --requests 64 --concurrency 32 --latency 0.2
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from main import app
+from services.bedrock_stub import StubBedrockAgent, StubBedrockRuntime
+
+
+async def run(requests: int, concurrency: int, latency: float):
+    from benchmarks.asgi_client import asgi_request
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            status, _ = await asgi_request(app, "POST", "/api/chat", {
+                "message": f"Show me Kerala packages under 30000 ({i})",
+                "conversationHistory": [],
+            })
+            latencies.append(time.perf_counter() - start)
+            assert status == 200, status
+
+    async with app.router.lifespan_context(app):
+        chatbot_service = app.state.chatbot
+        chatbot_service.wait_ready()
+        chatbot_service.bedrock_runtime = StubBedrockRuntime(latency=latency)
+        chatbot_service.bedrock_agent = StubBedrockAgent(latency=latency)
+        chatbot_service.aws_enabled = True
+        chatbot_service.kb_id = "benchmark-kb"
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.2, help="simulated seconds per Bedrock call")
+    args = parser.parse_args()
+
+    print(json.dumps(asyncio.run(run(args.requests, args.concurrency, args.latency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Per-message CPU cost of the local (non-network) chat stages.
+
+Times analyze_message plus the stages that consume its MessageFeatures:
+package matching, form extraction and the templated fallback reply. Run
+from the backend directory:
+
+    python -m benchmarks.message_features --iterations 2000
+"""
+import argparse
+import json
+import time
+
+from services.chatbot_service import ChatbotService
+from services.features import analyze_message
+
+MESSAGES = [
+    "Show me Kerala packages under 30000 for 2 people in december",
+    "hi",
+    "I want to travel to dubai for 4 guests",
+    "Any romantic honeymoon trip ideas?",
+    "looking for an adventure trek in the mountains on 12/05",
+    "can I talk to a human agent",
+    "family vacation with kids around 60000",
+    "thanks",
+]
+
+
+def run(service: ChatbotService, iterations: int) -> dict:
+    messages = MESSAGES * iterations
+
+    start = time.perf_counter()
+    for message in messages:
+        analyze_message(message)
+    analyze_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+    start = time.perf_counter()
+    for message in messages:
+        features = analyze_message(message)
+        packages = service.match_packages(features)
+        service.extract_form_data(features)
+        service._generate_fallback_response(features, packages)
+    total_us = (time.perf_counter() - start) / len(messages) * 1e6
+
+    return {
+        "messages": len(messages),
+        "analyze_us_per_message": round(analyze_us, 2),
+        "local_stages_us_per_message": round(total_us, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    service = ChatbotService()
+    run(service, 100)  # warm up
+    print(json.dumps(run(service, args.iterations), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Local knowledge base index build, load and query latency.
+
+Generates --documents synthetic markdown documents (a few paragraphs each,
+drawn from a fixed travel vocabulary) plus the real catalog into a temporary
+directory, builds the BM25 index once, then times opening the saved index
+from a fresh LocalKnowledgeBase (what a new worker pays) and --queries top-k
+searches. Run from the backend directory:
+
+    python -m benchmarks.retrieval --documents 3000 --queries 5000
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from services.retrieval import LocalKnowledgeBase
+
+WORDS = (
+    "beach villa honeymoon trek monastery desert safari cruise visa flight hotel breakfast transfer "
+    "temple market island snorkel mountain valley lake houseboat spa resort tour guide family kids "
+    "refund cancellation insurance passport luggage weather season monsoon winter summer budget luxury "
+    "dubai bhutan bali goa kerala kashmir manali maldives thailand singapore vietnam europe"
+).split()
+
+
+def pick(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))], 3) if values else None
+
+
+def write_documents(root: Path, count: int, rnd: random.Random):
+    for i in range(count):
+        paragraphs = [f"# Topic {i}"]
+        for _ in range(rnd.randint(2, 6)):
+            paragraphs.append(" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(30, 120))))
+        (root / f"doc-{i:05d}.md").write_text("\n\n".join(paragraphs), encoding="utf-8")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=3000)
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    rnd = random.Random(5)
+    with tempfile.TemporaryDirectory() as tmp:
+        docs_dir, index_path = Path(tmp) / "kb", Path(tmp) / "index"
+        docs_dir.mkdir()
+        write_documents(docs_dir, args.documents, rnd)
+
+        builder = LocalKnowledgeBase(str(index_path), str(docs_dir))
+        started = time.perf_counter()
+        builder.load()
+        build_ms = (time.perf_counter() - started) * 1000
+
+        worker = LocalKnowledgeBase(str(index_path), str(docs_dir))
+        started = time.perf_counter()
+        worker.load()
+        load_ms = (time.perf_counter() - started) * 1000
+
+        queries = [" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 8))) for _ in range(args.queries)]
+        query_us, hits = [], 0
+        for query in queries:
+            began = time.perf_counter()
+            hits += len(worker.search(query, args.k))
+            query_us.append((time.perf_counter() - began) * 1e6)
+
+        stats = worker.stats()
+        print(json.dumps({
+            "documents": args.documents,
+            "passages": stats["passages"],
+            "terms": stats["terms"],
+            "postings": stats["postings"],
+            "index_bytes": sum(p.stat().st_size for p in index_path.iterdir()),
+            "build_ms": round(build_ms, 1),
+            "load_ms": round(load_ms, 2),
+            "rebuilt_on_load": worker.builds,
+            "query_p50_us": pick(query_us, 0.5),
+            "query_p99_us": pick(query_us, 0.99),
+            "avg_hits": round(hits / len(queries), 2) if queries else 0,
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Worker cold start: import time and time to the first responses.
+
+Each run starts a fresh process. First ``import main`` is timed on its own,
+then a uvicorn server is started and polled from the moment it is spawned:
+
+- live_ms: first 200 from /api/health (the worker is serving)
+- ready_ms: first 200 from /api/ready (Bedrock clients and KB index set up)
+- first_chat_ms: first successful /api/chat, sent once ready, and how long
+  that request itself took (first_chat_request_ms)
+
+--bedrock picks what the worker initializes: "http" creates the real boto3
+clients against services.bedrock_stub's HTTP server on 127.0.0.1 (the case
+that loads botocore's service models), "stub" the in-process stub, and
+"disabled" no Bedrock at all. Medians over --runs, as one JSON line. Run from
+the backend directory:
+
+    python -m benchmarks.startup --runs 5 --bedrock http
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def request(port: int, method: str, path: str, payload=None):
+    """(status, seconds) of one request; status 0 if the server isn't accepting yet"""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    started = time.perf_counter()
+    try:
+        body = json.dumps(payload) if payload is not None else None
+        connection.request(method, path, body=body, headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - started
+    except OSError:
+        return 0, time.perf_counter() - started
+    finally:
+        connection.close()
+
+
+def wait_for(port: int, path: str, began: float, timeout: float):
+    """Milliseconds from began until path answers 200; None if it never does (or doesn't exist)"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        status, _ = request(port, "GET", path)
+        if status == 200:
+            return (time.perf_counter() - began) * 1000
+        if status == 404:
+            return None
+        time.sleep(0.005)
+    return None
+
+
+def time_import(env: dict) -> float:
+    code = "import time; t = time.perf_counter(); import main; print((time.perf_counter() - t) * 1000)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def time_server(env: dict, timeout: float) -> dict:
+    port = free_port()
+    began = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        live = wait_for(port, "/api/health", began, timeout)
+        ready = wait_for(port, "/api/ready", began, timeout)
+        status, seconds = request(port, "POST", "/api/chat", {"message": "What is the best time to visit Ladakh?"})
+        first_chat = (time.perf_counter() - began) * 1000 if status == 200 else None
+        return {
+            "live_ms": live,
+            "ready_ms": ready,
+            "first_chat_ms": first_chat,
+            "first_chat_request_ms": seconds * 1000 if status == 200 else None,
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def median(values):
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 1) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--bedrock", choices=("http", "stub", "disabled"), default="http")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for each endpoint")
+    args = parser.parse_args()
+
+    server = None
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            TRANSCRIPT_PATH=str(Path(tmp) / "transcripts.db"),
+            METRICS_DIR="",
+            LOG_LEVEL="WARNING",
+            BEDROCK_STUB=str(args.bedrock == "stub").lower(),
+            BEDROCK_ENABLED=str(args.bedrock != "disabled").lower(),
+        )
+        if args.bedrock == "http":
+            from services.bedrock_stub import StubBedrockServer
+
+            server = StubBedrockServer().start()
+            env.update(
+                BEDROCK_ENDPOINT_URL=server.endpoint_url,
+                AWS_ACCESS_KEY_ID="stub",
+                AWS_SECRET_ACCESS_KEY="stub",
+            )
+        try:
+            imports = [time_import(env) for _ in range(args.runs)]
+            runs = [time_server(env, args.timeout) for _ in range(args.runs)]
+        finally:
+            if server is not None:
+                server.stop()
+
+    print(json.dumps({
+        "bedrock": args.bedrock,
+        "runs": args.runs,
+        "import_ms": median(imports),
+        **{name: median([run[name] for run in runs]) for name in runs[0]},
+    }))
+
+
+if __name__ == "__main__":
+    main()
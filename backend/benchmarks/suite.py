@@ -0,0 +1,423 @@
+"""
+Reproducible benchmark suite for the chat API and the agent WebSockets.
+
+Runs entirely in one process with no network: requests go straight into the
+ASGI app (middleware, routers, pipeline, transcripts, bus) and Bedrock is the
+offline stub, with --latency-ms per call and --token-interval-ms between
+streamed chunks. With --bedrock http the stub is served over HTTP on
+127.0.0.1 instead and reached through the real boto3 clients (connection
+pool, retries, event-stream parsing).
+
+Scenarios (--scenarios, default all):
+
+- chat: /api/chat at each --users level; every user is a session sending
+  --turns messages back to back. Throughput and latency percentiles.
+- stream: the same through /api/chat/stream, plus time to the first token.
+- websocket: --agents agents and --customers customers on the agent
+  WebSockets; customers send --rate messages per second in total for
+  --duration seconds and each agent replies to every message. Latency from
+  customer to agent and the customer's round trip.
+- micro: per-call CPU time of analyze_message, match_packages,
+  extract_form_data, intent routing and prompt building.
+
+Response and KB caches are off, so every run does the same work. Results go
+to --output (default benchmarks/results/<commit>.json) with the commit,
+Python and CPU details; --baseline prints the change of every latency and
+throughput figure against an earlier results file. Run from the backend
+directory:
+
+    python -m benchmarks.suite --users 1,8,32 --agents 20 --customers 100 --rate 200
+    python -m benchmarks.suite --scenarios micro --baseline benchmarks/results/abc1234.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+SCENARIOS = ("chat", "stream", "websocket", "micro")
+
+# Follow-up turns cycle through a mix of routed intents, LLM questions and package searches
+MESSAGES = [
+    "Show me Kerala packages under 30000 for 2 people in december",
+    "What is the best time to visit Ladakh?",
+    "I want to travel to dubai for 4 guests",
+    "Any romantic honeymoon trip ideas?",
+    "Is the Bhutan trip good for elderly parents, and are meals included?",
+    "family vacation with kids around 60000",
+    "thanks",
+    "Which package has the most adventure activities?",
+]
+
+KB_CONTEXT = "\n\n".join([
+    "Kerala Backwaters: 5 nights across Munnar, Thekkady and Alleppey with a private houseboat night, "
+    "daily breakfast and dinner, and airport transfers. Best from September to March.",
+    "Ladakh Adventure: 6 nights in Leh, Nubra and Pangong with acclimatisation days, inner line permits, "
+    "oxygen cylinders in every vehicle and a camp night by the lake. Roads open May to September.",
+    "Dubai Escape: 4 nights with a desert safari, Burj Khalifa tickets, a dhow cruise dinner and visa "
+    "assistance. Suits families and couples; prices are per person on twin sharing.",
+])
+
+
+def pick(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))], 3) if values else None
+
+
+def latency_summary(latencies_ms) -> dict:
+    return {
+        "p50_ms": pick(latencies_ms, 0.5),
+        "p90_ms": pick(latencies_ms, 0.9),
+        "p99_ms": pick(latencies_ms, 0.99),
+        "max_ms": round(max(latencies_ms), 3) if latencies_ms else None,
+    }
+
+
+def prepare_environment(args, tmp: str):
+    """Settings are read at import, so the environment is set before the app is loaded"""
+    os.environ.update(
+        RESPONSE_CACHE_BACKEND="none",
+        KB_CACHE_BACKEND="none",
+        TRANSCRIPT_BACKEND="sqlite",
+        TRANSCRIPT_PATH=str(Path(tmp) / "transcripts.db"),
+        AGENT_BUS_BACKEND="local",
+        AGENT_MAX_CUSTOMERS=str(max(1, math.ceil(args.customers / max(1, args.agents)))),
+        METRICS_DIR="",
+        LOG_LEVEL="WARNING",
+        BEDROCK_STUB_LATENCY_MS=str(args.latency_ms),
+        BEDROCK_STUB_TOKEN_INTERVAL_MS=str(args.token_interval_ms),
+    )
+    if args.bedrock == "http":
+        from services.bedrock_stub import StubBedrockServer
+
+        server = StubBedrockServer(latency=args.latency_ms / 1000, token_interval=args.token_interval_ms / 1000).start()
+        os.environ.update(
+            BEDROCK_STUB="false",
+            BEDROCK_ENDPOINT_URL=server.endpoint_url,
+            AWS_ACCESS_KEY_ID="stub",
+            AWS_SECRET_ACCESS_KEY="stub",
+            BEDROCK_KNOWLEDGE_BASE_ID="STUBKB0001",
+            KB_BACKEND="bedrock",
+            BEDROCK_PREWARM_CONNECTIONS="0",
+        )
+        return server
+    os.environ.update(BEDROCK_STUB="true")
+    return None
+
+
+# Chat
+
+async def chat_user(app, user: int, turns: int, stream: bool, latencies: list, first_tokens: list, errors: list):
+    from benchmarks.asgi_client import asgi_request
+
+    path = "/api/chat/stream" if stream else "/api/chat"
+    session = None
+    for turn in range(turns):
+        # A unique first message per user, so concurrent first turns aren't coalesced
+        if turn == 0:
+            message = f"Hi! We are {2 + user % 4} adults planning trip number {user}, what do you suggest?"
+        else:
+            message = MESSAGES[(user + turn) % len(MESSAGES)]
+        payload = {"message": message}
+        if session:
+            payload.update(sessionId=session["sessionId"], turn=session["turn"])
+
+        started = time.perf_counter()
+        first_token = []
+
+        def on_chunk(chunk: bytes):
+            if not first_token and b"event: token" in chunk:
+                first_token.append(time.perf_counter())
+
+        status, body = await asgi_request(app, "POST", path, payload, on_chunk if stream else None)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if first_token:
+            first_tokens.append((first_token[0] - started) * 1000)
+        if status != 200:
+            errors.append(status)
+            continue
+        if stream:
+            done = [block for block in body.decode().split("\n\n") if block.startswith("event: done")]
+            if not done:
+                errors.append("no done event")
+                continue
+            session = json.loads(done[-1].split("data: ", 1)[1])
+        else:
+            session = json.loads(body)
+
+
+async def chat_scenario(app, users_levels, turns: int, stream: bool) -> dict:
+    results = {}
+    for users in users_levels:
+        latencies, first_tokens, errors = [], [], []
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            chat_user(app, user, turns, stream, latencies, first_tokens, errors) for user in range(users)
+        ))
+        elapsed = time.perf_counter() - started
+        result = {
+            "users": users,
+            "requests": len(latencies),
+            "errors": len(errors),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(len(latencies) / elapsed, 2),
+            **latency_summary(latencies),
+        }
+        if stream:
+            result["first_token_p50_ms"] = pick(first_tokens, 0.5)
+            result["first_token_p99_ms"] = pick(first_tokens, 0.99)
+        results[f"users_{users}"] = result
+    return results
+
+
+# Agent WebSockets
+
+async def websocket_scenario(app, agents: int, customers: int, rate: float, duration: float) -> dict:
+    from benchmarks.asgi_client import ASGIWebSocket
+
+    to_agent, round_trip = [], []
+    assigned = asyncio.Event()
+    assigned_count = [0]
+    received = {"agent": 0, "customer": 0}
+
+    async def agent_reader(socket: ASGIWebSocket):
+        while True:
+            message = await socket.receive_json()
+            if message is None:
+                return
+            received["agent"] += 1
+            if message.get("type") == "customer_message":
+                seq, sent = message["content"].split()
+                to_agent.append((time.perf_counter() - float(sent)) * 1000)
+                await socket.send_json({
+                    "type": "send_message", "customer_id": message["customer_id"], "content": f"{seq} {sent}",
+                })
+
+    async def customer_reader(socket: ASGIWebSocket):
+        while True:
+            message = await socket.receive_json()
+            if message is None:
+                return
+            received["customer"] += 1
+            if message.get("type") == "agent_assigned":
+                assigned_count[0] += 1
+                if assigned_count[0] == customers:
+                    assigned.set()
+            elif message.get("type") == "agent_message":
+                round_trip.append((time.perf_counter() - float(message["content"].split()[1])) * 1000)
+
+    started = time.perf_counter()
+    agent_sockets = [await ASGIWebSocket(app, "/api/agent/ws/agent").connect() for _ in range(agents)]
+    readers = [asyncio.create_task(agent_reader(socket)) for socket in agent_sockets]
+    customer_sockets = [
+        await ASGIWebSocket(app, f"/api/agent/ws/customer/bench-{i}").connect() for i in range(customers)
+    ]
+    readers += [asyncio.create_task(customer_reader(socket)) for socket in customer_sockets]
+    try:
+        await asyncio.wait_for(assigned.wait(), timeout=10)
+    except asyncio.TimeoutError:
+        pass
+    connect_ms = (time.perf_counter() - started) * 1000
+
+    sent = 0
+    began = time.perf_counter()
+    total = int(rate * duration)
+    for seq in range(total):
+        delay = began + seq / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await customer_sockets[seq % customers].send_json({
+            "type": "message", "content": f"{seq} {time.perf_counter()!r}",
+        })
+        sent += 1
+    send_elapsed = time.perf_counter() - began
+    # Let the last replies arrive
+    deadline = time.perf_counter() + 2
+    while len(round_trip) < sent and time.perf_counter() < deadline:
+        await asyncio.sleep(0.02)
+
+    for socket in customer_sockets + agent_sockets:
+        await socket.close()
+    for reader in readers:
+        reader.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+
+    return {
+        "agents": agents,
+        "customers": customers,
+        "assigned": assigned_count[0],
+        "connect_ms": round(connect_ms, 3),
+        "target_rate": rate,
+        "achieved_rate": round(sent / send_elapsed, 2) if send_elapsed else None,
+        "messages_sent": sent,
+        "delivered_to_agent": len(to_agent),
+        "replies_delivered": len(round_trip),
+        "messages_received_by_agents": received["agent"],
+        "messages_received_by_customers": received["customer"],
+        "to_agent": latency_summary(to_agent),
+        "round_trip": latency_summary(round_trip),
+    }
+
+
+# Microbenchmarks
+
+def per_call_us(func, inputs, repeat: int) -> float:
+    """Best-of-repeat average microseconds per call over inputs"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in inputs:
+            func(*item)
+        best = min(best, time.perf_counter() - started)
+    return round(best / len(inputs) * 1e6, 3)
+
+
+def micro_scenario(service, iterations: int, repeat: int) -> dict:
+    from services.features import analyze_message
+
+    messages = MESSAGES * max(1, iterations // len(MESSAGES))
+    features = [analyze_message(message) for message in messages]
+    packages = [service.match_packages(f) for f in features]
+    history = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": MESSAGES[i % len(MESSAGES)]}
+        for i in range(6)
+    ]
+    return {
+        "calls": len(messages),
+        "analyze_message_us": per_call_us(analyze_message, [(m,) for m in messages], repeat),
+        "match_packages_us": per_call_us(service.match_packages, [(f,) for f in features], repeat),
+        "extract_form_data_us": per_call_us(service.extract_form_data, [(f,) for f in features], repeat),
+        "intent_route_us": per_call_us(
+            service.intent_router.classify, [(f, p, True) for f, p in zip(features, packages)], repeat
+        ),
+        "prompt_build_us": per_call_us(
+            service.prompt_builder.build,
+            [(f.text, history, KB_CONTEXT, p, "package_listing") for f, p in zip(features, packages)],
+            repeat,
+        ),
+    }
+
+
+# Results
+
+def run_metadata(args) -> dict:
+    def git(*command):
+        try:
+            return subprocess.run(
+                ["git", *command], cwd=BASE_DIR, capture_output=True, text=True, timeout=10
+            ).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or None,
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args),
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict):
+    """One JSON line per latency/throughput figure present in both runs"""
+    before, after = flatten(baseline["results"]), flatten(current["results"])
+    for name in sorted(before.keys() & after.keys()):
+        if not name.endswith(("_ms", "_us", "_rps")) or not before[name]:
+            continue
+        print(json.dumps({
+            "metric": name,
+            "baseline": before[name],
+            "current": after[name],
+            "change_pct": round((after[name] - before[name]) / before[name] * 100, 1),
+        }))
+
+
+async def run_async(args, scenarios) -> dict:
+    from main import app
+
+    # Requests go straight into the app, so run its lifespan here; on exit it
+    # commits queued transcript rows before the temporary database goes away
+    async with app.router.lifespan_context(app):
+        chatbot_service = app.state.chatbot
+        chatbot_service.wait_ready()
+        results = {}
+        if "chat" in scenarios:
+            results["chat"] = await chat_scenario(app, args.users, args.turns, stream=False)
+            print(json.dumps({"chat": results["chat"]}))
+        if "stream" in scenarios:
+            results["stream"] = await chat_scenario(app, args.users, args.turns, stream=True)
+            print(json.dumps({"stream": results["stream"]}))
+        if "websocket" in scenarios:
+            results["websocket"] = await websocket_scenario(app, args.agents, args.customers, args.rate, args.duration)
+            print(json.dumps({"websocket": results["websocket"]}))
+        if "micro" in scenarios:
+            results["micro"] = micro_scenario(chatbot_service, args.iterations, args.repeat)
+            print(json.dumps({"micro": results["micro"]}))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of " + ", ".join(SCENARIOS))
+    parser.add_argument("--bedrock", choices=("stub", "http"), default="stub", help="in-process stub clients or boto3 against the HTTP stub")
+    parser.add_argument("--latency-ms", type=int, default=50, help="stub latency per Bedrock call")
+    parser.add_argument("--token-interval-ms", type=int, default=5, help="stub delay between streamed chunks")
+    parser.add_argument("--users", default="1,8,32", help="concurrent chat users, one run per level")
+    parser.add_argument("--turns", type=int, default=6, help="messages per chat user")
+    parser.add_argument("--agents", type=int, default=20)
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=200, help="customer messages per second, in total")
+    parser.add_argument("--duration", type=float, default=5, help="seconds of customer messages")
+    parser.add_argument("--iterations", type=int, default=2000, help="calls per microbenchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="microbenchmark repeats (the best is kept)")
+    parser.add_argument("--output", help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    args = parser.parse_args()
+    args.users = [int(level) for level in args.users.split(",") if level]
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = prepare_environment(args, tmp)
+        try:
+            results = asyncio.run(run_async(args, scenarios))
+        finally:
+            if server is not None:
+                server.stop()
+
+    report = {"meta": run_metadata(args), "results": results}
+    output = Path(args.output) if args.output else (
+        BASE_DIR / "benchmarks" / "results" / f"{report['meta']['commit'] or 'unknown'}{'-dirty' if report['meta']['dirty'] else ''}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(json.dumps({"results": str(output)}))
+
+    if args.baseline:
+        compare(json.loads(Path(args.baseline).read_text()), report)
+
+
+if __name__ == "__main__":
+    main()
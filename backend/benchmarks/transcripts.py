@@ -0,0 +1,150 @@
+"""
+Transcript store append and tail-read throughput.
+
+Messages for --sessions sessions are appended from an asyncio loop at --rate
+messages per second (0 = as fast as possible), first with one committed
+INSERT per message on the calling thread (what an inline write on the relay
+path would cost), then through SQLiteTranscriptStore's queued, batched
+writer. Reported per mode: the time each append holds the event loop,
+sustained committed throughput, and the worst event-loop lag seen while
+writing. Tail reads of random sessions are timed against the filled store.
+Each run uses a fresh database in a temporary directory. Run from the
+backend directory:
+
+    python -m benchmarks.transcripts --messages 20000 --sessions 500 --rate 5000
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from services.transcripts import SQLiteTranscriptStore
+
+
+def pick(values, q):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))], 3) if values else None
+
+
+def make_messages(count: int, sessions: int):
+    rnd = random.Random(7)
+    return [
+        (f"support:customer-{rnd.randrange(sessions)}", rnd.choice(("customer", "agent")), f"message {i} " + "x" * rnd.randint(20, 200))
+        for i in range(count)
+    ]
+
+
+async def monitor_lag(stop: asyncio.Event, lags: list, interval: float = 0.005):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def drive(messages, rate: float, append) -> dict:
+    """Call append for every message at the target rate; returns timings"""
+    stop, lags, append_us = asyncio.Event(), [], []
+    monitor = asyncio.create_task(monitor_lag(stop, lags))
+    start = time.perf_counter()
+    for i, message in enumerate(messages):
+        began = time.perf_counter()
+        append(*message)
+        append_us.append((time.perf_counter() - began) * 1e6)
+        if rate:
+            delay = start + (i + 1) / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif i % 256 == 0:
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await monitor
+    return {"elapsed": elapsed, "append_us": append_us, "lags": lags}
+
+
+async def run_inline(messages, rate: float, path: Path) -> dict:
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE transcripts (id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, ts REAL NOT NULL, "
+        "role TEXT NOT NULL, sender TEXT NOT NULL, content TEXT NOT NULL, meta TEXT)"
+    )
+    conn.execute("CREATE INDEX transcripts_session ON transcripts (session_id, id)")
+
+    def append(session_id, role, content):
+        conn.execute(
+            "INSERT INTO transcripts (session_id, ts, role, sender, content, meta) VALUES (?, ?, ?, ?, ?, NULL)",
+            (session_id, time.time(), role, "", content),
+        )
+
+    result = await drive(messages, rate, append)
+    conn.close()
+    return {
+        "mode": "inline_commit_per_message",
+        "messages": len(messages),
+        "committed_per_s": round(len(messages) / result["elapsed"]),
+        "append_p50_us": pick(result["append_us"], 0.5),
+        "append_p99_us": pick(result["append_us"], 0.99),
+        "max_loop_lag_ms": round(max(result["lags"], default=0), 2),
+    }
+
+
+async def run_batched(messages, rate: float, path: Path, batch_size: int, flush_ms: int, tails: int, sessions: int) -> dict:
+    store = SQLiteTranscriptStore(path, batch_size=batch_size, flush_interval_ms=flush_ms)
+    result = await drive(messages, rate, store.append)
+    drain_start = time.perf_counter()
+    store.flush(timeout=60)
+    durable = result["elapsed"] + time.perf_counter() - drain_start
+
+    rnd = random.Random(11)
+    tail_ms, returned = [], 0
+    for _ in range(tails):
+        began = time.perf_counter()
+        returned += len(store.tail(f"support:customer-{rnd.randrange(sessions)}", 50))
+        tail_ms.append((time.perf_counter() - began) * 1000)
+    stats = store.stats()
+    store.close()
+    return {
+        "mode": "batched_writer",
+        "messages": len(messages),
+        "committed_per_s": round(stats["written"] / durable),
+        "append_p50_us": pick(result["append_us"], 0.5),
+        "append_p99_us": pick(result["append_us"], 0.99),
+        "max_loop_lag_ms": round(max(result["lags"], default=0), 2),
+        "batches": stats["batches"],
+        "avg_batch": stats["avg_batch"],
+        "avg_commit_ms": stats["avg_commit_ms"],
+        "dropped": stats["dropped"],
+        "tail50_p50_ms": pick(tail_ms, 0.5),
+        "tail50_p99_ms": pick(tail_ms, 0.99),
+        "tail_rows_avg": round(returned / tails, 1) if tails else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--sessions", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=5000, help="messages per second (0 = unthrottled)")
+    parser.add_argument("--batch-size", type=int, default=512)
+    parser.add_argument("--flush-ms", type=int, default=50)
+    parser.add_argument("--tails", type=int, default=1000, help="tail reads to time after writing")
+    parser.add_argument("--skip-inline", action="store_true")
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.sessions)
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.skip_inline:
+            print(json.dumps(asyncio.run(run_inline(messages, args.rate, Path(tmp) / "inline.db"))))
+        print(json.dumps(asyncio.run(run_batched(
+            messages, args.rate, Path(tmp) / "batched.db", args.batch_size, args.flush_ms, args.tails, args.sessions
+        ))))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
 # Configuration settings
 import os
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import Dict, List
+
+# Shipped default for SECRET_KEY; nothing is signed with it
+PLACEHOLDER_SECRET_KEY = "your-secret-key-change-in-production"
 
 class Settings(BaseSettings):
     # App settings
@@ -14,7 +17,7 @@ class Settings(BaseSettings):
     cors_origins: str = "http://localhost:3000,http://127.0.0.1:3000"
     
     # Security settings
-    secret_key: str = "your-secret-key-change-in-production"
+    secret_key: str = PLACEHOLDER_SECRET_KEY
     api_key: str = ""
     
     # Database (for future use)
@@ -26,11 +29,187 @@ class Settings(BaseSettings):
     aws_region: str = os.getenv("AWS_REGION", "us-east-1")
     bedrock_knowledge_base_id: str = os.getenv("BEDROCK_KNOWLEDGE_BASE_ID", "")
     
+    # Max concurrent Bedrock calls per worker (size of the dedicated executor)
+    bedrock_max_concurrency: int = 16
+    
+    # Use AWS Bedrock at all; when false, boto3 is never imported and chat replies
+    # come from the templates. Clients are created in the background after startup.
+    bedrock_enabled: bool = True
+    
+    # Bedrock clients: connection pool (0 = bedrock_max_concurrency, doubled when KB
+    # hedging is on), connect/read timeouts, attempts per call including retries, an
+    # optional endpoint override (e.g. the local stub server in services/bedrock_stub.py)
+    # and connections per client opened in the background at startup. Each client's
+    # attempts and timeouts are cut to fit the budget of the stage that calls it
+    bedrock_pool_size: int = 0
+    bedrock_connect_timeout_seconds: float = 2.0
+    bedrock_read_timeout_seconds: float = 15.0
+    bedrock_max_attempts: int = 2
+    bedrock_endpoint_url: str = ""
+    bedrock_prewarm_connections: int = 2
+    
+    # Circuit breaker per Bedrock client: opens once breaker_failure_rate of the last
+    # breaker_window calls (at least breaker_min_calls) failed, sends requests straight
+    # to the fallback for breaker_open_seconds, then lets one probe call through
+    bedrock_breaker_failure_rate: float = 0.5
+    bedrock_breaker_window: int = 20
+    bedrock_breaker_min_calls: int = 10
+    bedrock_breaker_open_seconds: float = 30
+    
+    # Chat pipeline stage budgets (seconds); a stage over budget uses its fallback
+    kb_timeout_seconds: float = 1.5
+    llm_timeout_seconds: float = 12.0
+    
+    # Package catalog (.json, .csv or .sqlite); relative paths are from the backend directory.
+    # The file is checked for changes every catalog_reload_interval_seconds (0 disables).
+    catalog_path: str = "data/packages.json"
+    catalog_reload_interval_seconds: int = 30
+    
+    # Pre-serialized /api/packages responses (keyed by catalog version)
+    packages_cache_ttl_seconds: int = 3600
+    packages_cache_max_entries: int = 2000
+    packages_cache_max_bytes: int = 32 * 1024 * 1024
+    
+    # Knowledge Base retrieval: "bedrock" (bedrock_knowledge_base_id), "local" (BM25 index
+    # over the catalog and kb_documents_dir, saved at kb_index_path), "none", or "auto"
+    # (bedrock when a Knowledge Base ID or the stub is configured, otherwise local)
+    kb_backend: str = "auto"
+    kb_documents_dir: str = "data/kb"
+    kb_index_path: str = "cache/kb_index"
+    kb_top_k: int = 3
+    # Send a second Bedrock KB retrieve if the first hasn't answered in this many ms (0 = off)
+    kb_hedge_after_ms: int = 0
+    
+    # Knowledge Base retrieval cache ("memory", "sqlite" to share across workers, or "none")
+    kb_cache_backend: str = "memory"
+    kb_cache_ttl_seconds: int = 900
+    kb_cache_max_entries: int = 1000
+    kb_cache_max_bytes: int = 8 * 1024 * 1024
+    cache_sqlite_path: str = "cache/tripscape_cache.db"
+    
+    # Optional cache of first-turn chat responses ("memory", "sqlite" or "none").
+    # Fallback (degraded) replies are kept only for the shorter fallback TTL.
+    response_cache_backend: str = "none"
+    response_cache_ttl_seconds: int = 300
+    response_cache_fallback_ttl_seconds: int = 30
+    response_cache_max_entries: int = 500
+    response_cache_max_bytes: int = 4 * 1024 * 1024
+    
+    # Answer deterministic intents (greetings, thanks, agent handoff, plain package
+    # listings) from templates when the router's confidence is at least the threshold
+    intent_router_enabled: bool = True
+    intent_router_threshold: float = 0.8
+    
+    # Claude prompt assembly: estimated input-token budget per call, caps for the KB
+    # context and package sections (history gets what is left, up to
+    # prompt_history_messages), and the reply's max_tokens per routed intent as
+    # "intent:tokens" (llm_max_tokens for any other intent)
+    prompt_token_budget: int = 1500
+    prompt_kb_max_tokens: int = 600
+    prompt_packages_max_tokens: int = 300
+    prompt_history_messages: int = 4
+    llm_max_tokens: int = 500
+    llm_max_tokens_by_intent: str = "package_listing:350,about:200,agent_handoff:150,greeting:120,thanks:80"
+    
+    # Agent/customer WebSocket outbound queues: per-connection bound and the
+    # slow-consumer policy ("drop_oldest", "coalesce" or "disconnect" after max lag)
+    agent_outbound_queue_size: int = 256
+    agent_outbound_policy: str = "coalesce"
+    agent_outbound_max_lag_ms: int = 5000
+    
+    # Bus keeping agent/customer queue state and routing consistent across workers:
+    # "local" (single process) or "unix" (Unix domain socket hub at agent_bus_path,
+    # relative to the backend directory; needed with gunicorn --workers > 1)
+    agent_bus_backend: str = "local"
+    agent_bus_path: str = "cache/agent_bus.sock"
+    
+    # Live-agent routing: customers each agent handles at once, and whether waiting
+    # customers are routed to the least-loaded free agent (otherwise agents accept them)
+    agent_max_customers: int = 5
+    agent_auto_assign: bool = True
+    # Window over which waiting-queue changes are batched into one delta per agent
+    agent_queue_update_interval_ms: int = 100
+    # Waiting-queue priority classes as "name:head start in seconds" (the first is the
+    # default); a customer who has waited longer than another's head start is still
+    # served first. Waits beyond agent_queue_sla_seconds count against the SLA.
+    agent_priority_classes: str = "standard:0,priority:60,vip:180"
+    agent_queue_sla_seconds: float = 120
+    
+    # Agent/customer WebSocket liveness: quiet connections get a {"type": "ping"}
+    # every heartbeat interval, and one that sends nothing (not even a pong) for
+    # the receive timeout is evicted and leaves the queue; 0 disables either
+    agent_heartbeat_interval_seconds: float = 20
+    agent_receive_timeout_seconds: float = 60
+    
+    # Conversation transcripts ("sqlite" or "none"): appends are queued in memory and
+    # a background thread commits them in batches of up to transcript_batch_size rows
+    # every transcript_flush_interval_ms; beyond transcript_max_pending the oldest drop
+    transcript_backend: str = "sqlite"
+    transcript_path: str = "cache/transcripts.db"
+    transcript_batch_size: int = 512
+    transcript_flush_interval_ms: int = 50
+    transcript_max_pending: int = 100000
+    
+    # Server-side chat sessions: recent messages kept per session (the model sees the
+    # last prompt_history_messages), idle TTL and sessions per worker; an evicted session
+    # reloads from transcripts, re-read for up to chat_session_stale_wait_ms while they
+    # are behind the client's turn (then 409)
+    chat_session_max_messages: int = 8
+    chat_session_ttl_seconds: int = 1800
+    chat_session_max_sessions: int = 10000
+    chat_session_stale_wait_ms: int = 500
+    
+    # Metrics served at /api/metrics: each worker writes a snapshot to metrics_dir
+    # (relative to the backend directory) every metrics_publish_interval_seconds so
+    # any worker's scrape covers them all; "" reports only the worker that answers
+    metrics_dir: str = "cache/metrics"
+    metrics_publish_interval_seconds: float = 5
+    
+    # Logging: JSON lines ("text" for local development) written by a background
+    # thread from a queue of up to log_queue_size records (beyond that they drop);
+    # each warning/error call site logs at most log_error_burst records per
+    # log_error_interval_seconds, then a count of those suppressed
+    log_level: str = "INFO"
+    log_format: str = "json"
+    log_queue_size: int = 10000
+    log_error_burst: int = 5
+    log_error_interval_seconds: float = 60
+    
+    # Offline Bedrock stub for local development and benchmarks
+    bedrock_stub: bool = False
+    bedrock_stub_latency_ms: int = 0
+    bedrock_stub_token_interval_ms: int = 0
+    
     @property
     def cors_origins_list(self) -> List[str]:
         """Convert comma-separated CORS origins to list"""
         return [origin.strip() for origin in self.cors_origins.split(",")]
     
+    @property
+    def agent_priority_boosts(self) -> Dict[str, float]:
+        """Parse agent_priority_classes into {class: head start seconds}, in order"""
+        boosts = {}
+        for item in self.agent_priority_classes.split(","):
+            name, _, head_start = item.strip().partition(":")
+            if name:
+                boosts[name] = float(head_start or 0)
+        return boosts
+    
+    @property
+    def llm_intent_max_tokens(self) -> Dict[str, int]:
+        """Parse llm_max_tokens_by_intent into {intent: max_tokens}"""
+        limits = {}
+        for item in self.llm_max_tokens_by_intent.split(","):
+            name, _, tokens = item.strip().partition(":")
+            if name and tokens:
+                limits[name] = int(tokens)
+        return limits
+    
+    @property
+    def secret_key_configured(self) -> bool:
+        """Whether SECRET_KEY was set to something other than the shipped placeholder"""
+        return bool(self.secret_key) and self.secret_key != PLACEHOLDER_SECRET_KEY
+    
     @property
     def is_production(self) -> bool:
         """Check if running in production"""
@@ -1,4 +1,7 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
@@ -8,10 +11,50 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from config import settings
-from routers import chat, agent
+from middleware.metrics import MetricsMiddleware
+from middleware.request_id import RequestIdMiddleware
+from routers import chat, agent, packages, metrics
+from routers.agent import ConnectionManager
+from services.chatbot_service import ChatbotService
+from services.metrics import registry
+from services.sessions import SessionStore
+from services.transcripts import create_transcript_store
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the worker's services at startup (not at import) and shut them down on exit"""
+    registry.configure(settings.metrics_dir, settings.metrics_publish_interval_seconds)
+    registry.start()
+    transcripts = create_transcript_store(settings.transcript_backend, settings.transcript_path)
+    # Returns at once: the Bedrock clients and the local index are set up on a
+    # background thread while the worker already answers liveness checks
+    chatbot = ChatbotService().start()
+    sessions = SessionStore(
+        transcripts,
+        max_messages=settings.chat_session_max_messages,
+        ttl_seconds=settings.chat_session_ttl_seconds,
+        max_sessions=settings.chat_session_max_sessions,
+        stale_wait_seconds=settings.chat_session_stale_wait_ms / 1000,
+    )
+    agents = ConnectionManager(transcripts=transcripts)
+    agents.register_metrics()
+    await agents.start()
+    app.state.transcripts = transcripts
+    app.state.chatbot = chatbot
+    app.state.sessions = sessions
+    app.state.agents = agents
+    try:
+        yield
+    finally:
+        await agents.stop()
+        chatbot.close()
+        # Commit whatever the background writer still has queued
+        transcripts.close()
+        registry.stop()
 
 # Create FastAPI app with conditional docs
 app = FastAPI(
+    lifespan=lifespan,
     title=settings.app_name,
     description="Tripscape - Travel application backend API",
     version="1.0.0",
@@ -39,9 +82,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request id on every log record and response (X-Request-ID)
+app.add_middleware(RequestIdMiddleware)
+
+# Request latency metrics; added last, so it is the outermost middleware and
+# the timing includes all the others
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(chat.router)
 app.include_router(agent.router)
+app.include_router(packages.router)
+app.include_router(metrics.router)
 
 @app.get("/")
 async def root():
@@ -53,12 +105,30 @@ async def root():
 
 @app.get("/api/health")
 async def health_check():
+    """Liveness: the worker is up and serving, whether or not its services are ready"""
     return {
         "status": "OK",
         "message": "Server is running",
         "environment": settings.environment
     }
 
+@app.get("/api/ready")
+async def readiness_check(request: Request):
+    """Readiness: 503 until the chat service has its Bedrock clients and KB index"""
+    service = request.app.state.chatbot
+    ready = service.ready.is_set()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "status": "ready" if ready else "starting",
+            "chat": {
+                "ready": ready,
+                "aws_enabled": service.aws_enabled,
+                "init_seconds": round(service.init_seconds, 3) if service.init_seconds is not None else None,
+            },
+        },
+    )
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,44 @@
+"""
+Latency of every HTTP request, by method, route template and status.
+
+A plain ASGI middleware rather than BaseHTTPMiddleware, so streaming
+responses pass through untouched and the timing covers the whole body
+(for /api/chat/stream, until the last event is sent). The route label is
+the matched path template (``/api/packages/{package_id}``), never the raw
+path, so ids don't create new series; WebSockets are measured by the agent
+router instead.
+"""
+import time
+
+from services.metrics import registry
+
+REQUEST_SECONDS = registry.histogram(
+    "http_request_seconds", "HTTP request latency until the response is fully sent",
+    ("method", "route", "status"),
+)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the shared scope
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], route, str(status))
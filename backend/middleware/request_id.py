@@ -0,0 +1,39 @@
+"""
+Request ids for log correlation.
+
+Every HTTP request and WebSocket gets an id: the caller's ``X-Request-ID``
+if it sends a sane one (a proxy or the frontend), otherwise a new one. It is
+set in the ``request_id`` context variable, so every record logged while
+handling the request carries it, and returned in the response's
+``X-Request-ID`` header.
+"""
+import re
+import uuid
+
+from services.log import request_id
+
+_VALID_ID = re.compile(rb"^[\w.:-]{1,64}$")
+
+
+class RequestIdMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        header = dict(scope["headers"]).get(b"x-request-id", b"")
+        value = header.decode() if _VALID_ID.match(header) else uuid.uuid4().hex[:16]
+        token = request_id.set(value)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-request-id", value.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
@@ -1,114 +1,619 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, HTTPException
-from typing import Dict, List
+from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect, HTTPException
+from starlette.requests import HTTPConnection
+from typing import Dict, List, Optional, Set, Tuple
+import uuid
+from datetime import datetime, timezone
 import json
 import asyncio
+import os
+import resource
+import time
+
+from config import settings
+from services.assignment import Assignment, AssignmentEngine
+from services.auth import priority_from_token, require_agent_key
+from services.bus import BusPublishError, MessageBus, create_bus
+from services.log import get_logger
+from services.metrics import FAST_BUCKETS, registry
+from services.outbound import FANOUT_SECONDS, OutboundChannel
+from services.queue_feed import QueueFeed
+from services.transcripts import TranscriptStore, get_transcript_store
 
 router = APIRouter(prefix="/api/agent", tags=["Agent"])
+logger = get_logger(__name__)
+
+BUS_DELAY = registry.histogram(
+    "agent_bus_delay_seconds", "Time from a bus event being sequenced to this worker applying it", buckets=FAST_BUCKETS
+)
+WS_MESSAGES = registry.counter("ws_messages_received_total", "WebSocket messages received", ("kind",))
+
+def _rss_bytes() -> int:
+    """Current resident set size of this worker (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
 
 # Store active connections
 class ConnectionManager:
-    def __init__(self):
+    """Agent/customer connections for one worker, kept consistent across workers by a message bus.
+    
+    ``engine`` holds the host-wide view (agents, customers, the waiting queue
+    and assignments) and is updated only by applying bus events, in the same
+    order in every worker, so every replica makes the same assignments.
+    ``active_agents``/``active_customers`` are the sockets this worker owns,
+    and only those are ever written to here.
+    """
+    
+    def __init__(self, bus: Optional[MessageBus] = None, transcripts: Optional[TranscriptStore] = None):
+        self.bus = bus or create_bus(settings.agent_bus_backend, settings.agent_bus_path)
+        self.transcripts = transcripts or get_transcript_store()
+        self.worker_id = self.bus.worker_id
+        self._started = False
+        self._start_lock: Optional[asyncio.Lock] = None
+        self._pending_publishes: Set[asyncio.Task] = set()
+        
+        # Host-wide state
+        self.engine = AssignmentEngine(
+            capacity=settings.agent_max_customers,
+            auto_assign=settings.agent_auto_assign,
+            priorities=settings.agent_priority_boosts,
+            sla_seconds=settings.agent_queue_sla_seconds,
+        )
+        
+        # Sockets owned by this worker
         self.active_agents: Dict[str, WebSocket] = {}
         self.active_customers: Dict[str, WebSocket] = {}
-        self.customer_queue: List[str] = []
+        # Each socket is written only by its own outbound channel's writer task
+        self.agent_channels: Dict[str, OutboundChannel] = {}
+        self.customer_channels: Dict[str, OutboundChannel] = {}
+        self.outbound_totals = {"dropped": 0, "coalesced": 0, "slow_disconnects": 0, "idle_evictions": 0}
+        
+        # Heartbeats and idle eviction for the sockets above
+        self.heartbeat_interval = settings.agent_heartbeat_interval_seconds
+        self.receive_timeout = settings.agent_receive_timeout_seconds
+        self.pings_sent = 0
+        self._reaper: Optional[asyncio.Task] = None
+        self._rss_at_start: Optional[int] = None
+        
+        # Queue changes reach agents as batched, sequence-numbered deltas
+        self.queue_feed = QueueFeed(
+            settings.agent_queue_update_interval_ms,
+            waiting=lambda: self.engine.waiting,
+            channels=lambda: self.agent_channels,
+        )
+    
+    async def start(self):
+        """Join the bus (idempotent); called at startup and before the first connection"""
+        if self._started:
+            return
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if not self._started:
+                self._rss_at_start = _rss_bytes()
+                await self.bus.start(self)
+                if self.heartbeat_interval > 0 or self.receive_timeout > 0:
+                    self._reaper = asyncio.create_task(self._reap_idle(), name="agent-idle-reaper")
+                self._started = True
+    
+    async def stop(self):
+        if self._started:
+            if self._reaper is not None:
+                self._reaper.cancel()
+                self._reaper = None
+            await self.bus.close()
+            self._started = False
+    
+    async def _reap_idle(self):
+        """Ping quiet sockets and evict those silent for longer than the receive timeout"""
+        sweep = min(t for t in (self.heartbeat_interval / 2, self.receive_timeout / 4) if t > 0)
+        while True:
+            await asyncio.sleep(sweep)
+            try:
+                self.reap_idle()
+            except Exception as e:
+                logger.exception("Idle reaper error: %s", e)
+    
+    def reap_idle(self):
+        now = time.monotonic()
+        channels = list(self.agent_channels.values()) + list(self.customer_channels.values())
+        for channel in channels:
+            silent = now - channel.last_seen
+            if self.receive_timeout > 0 and silent > self.receive_timeout:
+                # Closing the channel runs its on_close, which publishes the disconnect
+                # so every worker drops the connection from the queue and assignments
+                channel.evict_idle()
+            elif self.heartbeat_interval > 0 and silent >= self.heartbeat_interval and (
+                channel.pinged_at is None or now - channel.pinged_at >= self.heartbeat_interval
+            ):
+                channel.send({"type": "ping", "timestamp": datetime.now(timezone.utc).isoformat()}, coalesce_key="ping")
+                channel.pinged_at = now
+                self.pings_sent += 1
+    
+    # Replica interface used by the bus
+    
+    def apply(self, event: Dict):
+        """Apply one bus event: update the shared view, then act on sockets owned here"""
+        op = event["op"]
+        engine = self.engine
+        if "ts" in event:
+            BUS_DELAY.observe(max(time.time() - event["ts"], 0.0))
+        engine.tick(event.get("ts"))
+        if op == "agent_connected":
+            self._notify_assigned(engine.add_agent(event["agent_id"], event["worker"]))
+        
+        elif op == "agent_disconnected":
+            agent_id = event["agent_id"]
+            orphaned = sorted(engine.agent_customers.get(agent_id, ()))
+            if engine.agents.get(agent_id) != event["worker"]:
+                return
+            assignments = engine.remove_agent(agent_id, event["worker"])
+            for customer_id in orphaned:
+                self._local_customer(customer_id, {"type": "agent_left", "agent_id": agent_id})
+            self._notify_assigned(assignments)
+            self._announce_waiting([c for c in orphaned if c in engine.waiting])
+        
+        elif op == "customer_connected":
+            customer_id = event["customer_id"]
+            assignments = engine.add_customer(customer_id, event["worker"], event.get("priority"))
+            if customer_id in engine.waiting:
+                self._announce_waiting([customer_id])
+            # Routed straight to an agent: other agents never saw it queued
+            self._notify_assigned(assignments, unannounced=(customer_id,))
+        
+        elif op == "customer_disconnected":
+            self._drop_customer(event["customer_id"], *engine.remove_customer(event["customer_id"], event["worker"]))
+        
+        elif op == "claim":
+            assignment, reason = engine.claim(event["agent_id"], event["customer_id"])
+            if assignment is None:
+                self._local_agent(event["agent_id"], {
+                    "type": "accept_failed",
+                    "customer_id": event["customer_id"],
+                    "reason": reason
+                })
+            else:
+                self._notify_assigned([assignment])
+        
+        elif op == "release":
+            customer_id = event["customer_id"]
+            assignments = engine.release(event["agent_id"], customer_id)
+            if customer_id in engine.waiting:
+                self._announce_waiting([customer_id])
+            self._notify_assigned(assignments)
+        
+        elif op == "customer_message":
+            # Only the assigned agent hears it; while waiting it is kept for whoever accepts
+            agent_id = engine.customer_message(event["customer_id"], event["message"])
+            if agent_id is not None:
+                self._local_agent(agent_id, event["message"])
+            if event["customer_id"] in self.active_customers:
+                self._record(event["customer_id"], "customer", event["message"])
+        
+        elif op == "agent_message":
+            if engine.assignments.get(event["customer_id"]) == event["agent_id"]:
+                self._local_customer(event["customer_id"], event["message"])
+                if event["agent_id"] in self.active_agents:
+                    self._record(event["customer_id"], "agent", event["message"])
+            else:
+                self._local_agent(event["agent_id"], {
+                    "type": "error",
+                    "customer_id": event["customer_id"],
+                    "reason": "not_assigned"
+                })
+        
+        elif op == "broadcast_agents":
+            self._deliver_to_agents(event["message"], event.get("coalesce_key"))
+        
+        elif op == "to_agent":
+            self._local_agent(event["agent_id"], event["message"], event.get("coalesce_key"))
+        
+        elif op == "to_customer":
+            self._local_customer(event["customer_id"], event["message"], event.get("coalesce_key"))
+        
+        elif op == "worker_sync":
+            self._notify_assigned(engine.sync_worker(
+                event["worker"], event["agents"], event["customers"], event["assignments"]
+            ))
+            self.queue_feed.resync()
+        
+        elif op == "worker_left":
+            removed, assignments = engine.forget_worker(event["worker"])
+            for customer_id, was_waiting, agent_id in removed:
+                self._drop_customer(customer_id, was_waiting, agent_id, [])
+            self._notify_assigned(assignments)
+            self.queue_feed.resync()
+    
+    def snapshot(self) -> Dict:
+        return self.engine.snapshot()
+    
+    def restore(self, state: Dict):
+        self.engine.restore(state)
+        self.queue_feed.resync()
+    
+    def sync_event(self) -> Dict:
+        """Announce the sockets this worker owns, after (re)joining the bus"""
+        engine = self.engine
+        return {
+            "op": "worker_sync",
+            "worker": self.worker_id,
+            "agents": list(self.active_agents),
+            "customers": engine.describe_customers(list(self.active_customers)),
+            "assignments": {
+                customer_id: agent_id for customer_id, agent_id in engine.assignments.items()
+                if agent_id in self.active_agents or customer_id in self.active_customers
+            },
+        }
+    
+    def _record(self, customer_id: str, role: str, message: dict):
+        # Only the worker owning the sender's socket records a message, so it is
+        # stored once; the append never waits on disk
+        self.transcripts.append(
+            f"support:{customer_id}",
+            role,
+            str(message.get("content") or ""),
+            sender=message.get("from", "")
+        )
+    
+    def _local_agent(self, agent_id: str, message: dict, coalesce_key=None):
+        channel = self.agent_channels.get(agent_id)
+        if channel is not None:
+            channel.send(message, coalesce_key)
+    
+    def _local_customer(self, customer_id: str, message: dict, coalesce_key=None):
+        channel = self.customer_channels.get(customer_id)
+        if channel is not None:
+            channel.send(message, coalesce_key)
+    
+    def _deliver_to_agents(self, message: dict, coalesce_key=None):
+        # Enqueue only: each agent's writer task delivers concurrently, so a slow
+        # agent can't hold up the others or the caller's receive loop
+        started = time.perf_counter()
+        for channel in list(self.agent_channels.values()):
+            channel.send(message, coalesce_key)
+        FANOUT_SECONDS.observe(time.perf_counter() - started, "broadcast")
+    
+    def _announce_waiting(self, customer_ids: List[str]):
+        # Agents hear about queue changes in the next batched delta
+        for customer_id in customer_ids:
+            self.queue_feed.added(customer_id)
+    
+    def _notify_assigned(self, assignments: List[Assignment], unannounced: Tuple[str, ...] = ()):
+        """Tell the assigned agent (with any backlog) and the customer; the queue shrank for everyone else"""
+        for assignment in assignments:
+            self._local_agent(assignment.agent_id, {
+                "type": "customer_assigned",
+                "customer_id": assignment.customer_id,
+                "messages": assignment.backlog,
+                "queue_size": len(self.engine.waiting)
+            })
+            self._local_customer(assignment.customer_id, {
+                "type": "agent_assigned",
+                "agent_id": assignment.agent_id
+            })
+            if assignment.customer_id not in unannounced:
+                self.queue_feed.removed(assignment.customer_id)
+    
+    def _drop_customer(self, customer_id: str, was_waiting: bool, agent_id: Optional[str], assignments: List[Assignment]):
+        if was_waiting:
+            self.queue_feed.removed(customer_id)
+        elif agent_id is not None:
+            self._local_agent(agent_id, {
+                "type": "customer_disconnected",
+                "customer_id": customer_id,
+                "queue_size": len(self.engine.waiting)
+            })
+        self._notify_assigned(assignments)
+    
+    def send_queue_snapshot(self, agent_id: str):
+        channel = self.agent_channels.get(agent_id)
+        if channel is not None:
+            self.queue_feed.send_snapshot(agent_id, channel)
+    
+    def _publish_soon(self, event: Dict):
+        """Publish from synchronous code (disconnect callbacks)"""
+        task = asyncio.get_running_loop().create_task(self._announce(event))
+        self._pending_publishes.add(task)
+        task.add_done_callback(self._pending_publishes.discard)
+    
+    async def _announce(self, event: Dict):
+        """Publish a connection change; one the hub loses is corrected when this worker re-syncs"""
+        try:
+            await self.bus.publish(event)
+        except BusPublishError as e:
+            logger.warning("Connection change not confirmed: %s", e)
+    
+    async def relay(self, channel: OutboundChannel, event: Dict) -> bool:
+        """Publish a sender's action; if the bus can't confirm it, tell the sender so it can retry"""
+        try:
+            await self.bus.publish(event)
+            return True
+        except BusPublishError:
+            channel.send({
+                "type": "error",
+                "customer_id": event.get("customer_id"),
+                "reason": "not_delivered",
+                "op": event["op"]
+            })
+            return False
+    
+    def _open_channel(self, name: str, websocket: WebSocket, on_close) -> OutboundChannel:
+        return OutboundChannel(
+            websocket,
+            name,
+            max_queue=settings.agent_outbound_queue_size,
+            policy=settings.agent_outbound_policy,
+            max_lag_ms=settings.agent_outbound_max_lag_ms,
+            on_close=on_close,
+        )
+    
+    def _retire_channel(self, channel: OutboundChannel):
+        channel.close()
+        self.outbound_totals["dropped"] += channel.dropped
+        self.outbound_totals["coalesced"] += channel.coalesced
+        self.outbound_totals["slow_disconnects"] += int(channel.slow_disconnect)
+        self.outbound_totals["idle_evictions"] += int(channel.idle_evicted)
     
     async def connect_agent(self, agent_id: str, websocket: WebSocket):
+        await self.start()
         await websocket.accept()
         self.active_agents[agent_id] = websocket
-        print(f"Agent {agent_id} connected. Total agents: {len(self.active_agents)}")
+        self.agent_channels[agent_id] = self._open_channel(
+            agent_id, websocket, lambda channel: self.disconnect_agent(agent_id)
+        )
+        await self._announce({"op": "agent_connected", "agent_id": agent_id, "worker": self.worker_id})
+        logger.info("Agent connected", extra={"agent_id": agent_id, "agents": len(self.engine.agents)})
     
-    async def connect_customer(self, customer_id: str, websocket: WebSocket):
+    async def connect_customer(self, customer_id: str, websocket: WebSocket, priority: Optional[str] = None):
+        await self.start()
         await websocket.accept()
+        replaced = self.customer_channels.pop(customer_id, None)
+        if replaced is not None:
+            # Reconnect under the same ID replaces the old socket's writer
+            replaced.on_close = None
+            self._retire_channel(replaced)
         self.active_customers[customer_id] = websocket
-        self.customer_queue.append(customer_id)
-        print(f"Customer {customer_id} connected. Queue size: {len(self.customer_queue)}")
+        self.customer_channels[customer_id] = self._open_channel(
+            f"customer {customer_id}", websocket, lambda channel: self.disconnect_customer(customer_id, websocket)
+        )
+        await self._announce({
+            "op": "customer_connected",
+            "customer_id": customer_id,
+            "worker": self.worker_id,
+            "priority": priority
+        })
+        logger.info("Customer connected", extra={"customer_id": customer_id, "queue_size": len(self.engine.waiting)})
     
     def disconnect_agent(self, agent_id: str):
-        if agent_id in self.active_agents:
-            del self.active_agents[agent_id]
-        print(f"Agent {agent_id} disconnected. Total agents: {len(self.active_agents)}")
-    
-    def disconnect_customer(self, customer_id: str):
-        if customer_id in self.active_customers:
-            del self.active_customers[customer_id]
-        if customer_id in self.customer_queue:
-            self.customer_queue.remove(customer_id)
-        print(f"Customer {customer_id} disconnected. Queue size: {len(self.customer_queue)}")
-    
-    async def send_to_agent(self, agent_id: str, message: dict):
-        if agent_id in self.active_agents:
-            await self.active_agents[agent_id].send_json(message)
-    
-    async def send_to_customer(self, customer_id: str, message: dict):
-        if customer_id in self.active_customers:
-            await self.active_customers[customer_id].send_json(message)
-    
-    async def broadcast_to_agents(self, message: dict):
-        for agent_id, connection in self.active_agents.items():
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                print(f"Error broadcasting to agent {agent_id}: {e}")
+        if agent_id not in self.active_agents:
+            return
+        del self.active_agents[agent_id]
+        self._retire_channel(self.agent_channels.pop(agent_id))
+        self._publish_soon({"op": "agent_disconnected", "agent_id": agent_id, "worker": self.worker_id})
+        logger.info("Agent disconnected", extra={"agent_id": agent_id})
+    
+    def disconnect_customer(self, customer_id: str, websocket: Optional[WebSocket] = None):
+        if customer_id not in self.active_customers:
+            return
+        if websocket is not None and self.active_customers[customer_id] is not websocket:
+            # An older socket for a customer who has since reconnected
+            return
+        del self.active_customers[customer_id]
+        self._retire_channel(self.customer_channels.pop(customer_id))
+        self._publish_soon({"op": "customer_disconnected", "customer_id": customer_id, "worker": self.worker_id})
+        logger.info("Customer disconnected", extra={"customer_id": customer_id})
+    
+    async def send_to_agent(self, agent_id: str, message: dict, coalesce_key=None):
+        if agent_id in self.agent_channels:
+            self.agent_channels[agent_id].send(message, coalesce_key)
+        elif agent_id in self.engine.agents:
+            await self.bus.publish({"op": "to_agent", "agent_id": agent_id, "message": message, "coalesce_key": coalesce_key})
+    
+    async def send_to_customer(self, customer_id: str, message: dict, coalesce_key=None):
+        if customer_id in self.customer_channels:
+            self.customer_channels[customer_id].send(message, coalesce_key)
+        elif customer_id in self.engine.customers:
+            await self.bus.publish({"op": "to_customer", "customer_id": customer_id, "message": message, "coalesce_key": coalesce_key})
+    
+    async def broadcast_to_agents(self, message: dict, coalesce_key=None):
+        # Every worker delivers the broadcast to its own agents
+        await self.bus.publish({"op": "broadcast_agents", "message": message, "coalesce_key": coalesce_key})
+    
+    def outbound_stats(self) -> Dict:
+        channels = list(self.agent_channels.values()) + list(self.customer_channels.values())
+        return {
+            "policy": settings.agent_outbound_policy,
+            "max_queue": settings.agent_outbound_queue_size,
+            "queued": sum(len(channel) for channel in channels),
+            "max_queued": max((len(channel) for channel in channels), default=0),
+            "dropped": self.outbound_totals["dropped"] + sum(channel.dropped for channel in channels),
+            "coalesced": self.outbound_totals["coalesced"] + sum(channel.coalesced for channel in channels),
+            "slow_disconnects": self.outbound_totals["slow_disconnects"],
+        }
+    
+    def connection_stats(self, detail: bool = False) -> Dict:
+        """Liveness and memory accounting for the sockets owned by this worker"""
+        now = time.monotonic()
+        channels = [("agent", agent_id, channel) for agent_id, channel in self.agent_channels.items()]
+        channels += [("customer", customer_id, channel) for customer_id, channel in self.customer_channels.items()]
+        rss = _rss_bytes()
+        growth = rss - self._rss_at_start if self._rss_at_start is not None else None
+        stats = {
+            "worker": self.worker_id,
+            "connections": len(channels),
+            "heartbeat_interval_seconds": self.heartbeat_interval,
+            "receive_timeout_seconds": self.receive_timeout,
+            "pings_sent": self.pings_sent,
+            "idle_evictions": self.outbound_totals["idle_evictions"],
+            "longest_silence_seconds": round(max((now - channel.last_seen for _, _, channel in channels), default=0), 1),
+            "memory": {
+                "rss_bytes": rss,
+                "rss_growth_bytes": growth,
+                # Worker growth since the bus started, spread over the open sockets:
+                # the figure to multiply by a target socket count when sizing workers
+                "rss_growth_per_connection_bytes": growth // len(channels) if channels and growth is not None else None,
+                "queued_bytes": sum(channel.queued_bytes for _, _, channel in channels),
+                "max_queued_bytes": max((channel.queued_bytes for _, _, channel in channels), default=0),
+                "waiting_backlog_messages": sum(len(entry.backlog) for entry in self.engine.waiting.values()),
+            },
+        }
+        if detail:
+            stats["per_connection"] = [
+                {
+                    "kind": kind,
+                    "id": connection_id,
+                    "age_seconds": round(now - channel.connected_at, 1),
+                    "silent_seconds": round(now - channel.last_seen, 1),
+                    **channel.stats(),
+                }
+                for kind, connection_id, channel in channels
+            ]
+        return stats
+    
+    def register_metrics(self):
+        """Scrape-time gauges over this manager's existing state (nothing is recorded per message)"""
+        def channels() -> List[OutboundChannel]:
+            return list(self.agent_channels.values()) + list(self.customer_channels.values())
+        
+        registry.gauge_callback(
+            "ws_connections", "Open WebSocket connections",
+            lambda: {("agent",): len(self.agent_channels), ("customer",): len(self.customer_channels)},
+            ("kind",),
+        )
+        # The engine is replicated in every worker, so these take the max rather than the sum
+        registry.gauge_callback(
+            "agent_queue_waiting", "Customers waiting for an agent (host-wide)",
+            lambda: len(self.engine.waiting), aggregate="max",
+        )
+        registry.gauge_callback(
+            "agents_online", "Connected agents (host-wide)",
+            lambda: len(self.engine.agents), aggregate="max",
+        )
+        registry.gauge_callback(
+            "ws_send_queue_messages", "Messages queued on outbound channels",
+            lambda: sum(len(channel) for channel in channels()),
+        )
+        registry.gauge_callback(
+            "ws_send_queue_bytes", "Bytes queued on outbound channels",
+            lambda: sum(channel.queued_bytes for channel in channels()),
+        )
+        registry.gauge_callback(
+            "ws_send_queue_max_messages", "Longest outbound channel queue",
+            lambda: max((len(channel) for channel in channels()), default=0), aggregate="max",
+        )
+        
+        def lost() -> Dict:
+            stats = self.outbound_stats()
+            return {("dropped",): stats["dropped"], ("coalesced",): stats["coalesced"]}
+        
+        registry.counter_callback(
+            "ws_outbound_messages_lost_total", "Outbound messages dropped or replaced by the slow-consumer policy",
+            lost, ("reason",),
+        )
+        registry.counter_callback(
+            "ws_disconnects_forced_total", "Connections closed by the server",
+            lambda: {
+                ("slow_consumer",): self.outbound_totals["slow_disconnects"],
+                ("idle",): self.outbound_totals["idle_evictions"],
+            },
+            ("reason",),
+        )
 
-manager = ConnectionManager()
+def get_manager(connection: HTTPConnection) -> ConnectionManager:
+    """The worker's ConnectionManager, created and joined to the bus by the app lifespan"""
+    return connection.app.state.agents
 
 @router.websocket("/ws/agent")
-async def agent_websocket(websocket: WebSocket):
+async def agent_websocket(websocket: WebSocket, manager: ConnectionManager = Depends(get_manager)):
     """WebSocket endpoint for agents"""
-    agent_id = f"agent_{len(manager.active_agents) + 1}"
+    agent_id = f"agent_{uuid.uuid4().hex[:12]}"
     await manager.connect_agent(agent_id, websocket)
+    channel = manager.agent_channels[agent_id]
     
     try:
         # Send welcome message
-        await websocket.send_json({
+        await manager.send_to_agent(agent_id, {
             "type": "connected",
             "agent_id": agent_id,
-            "queue_size": len(manager.customer_queue)
+            "queue_size": len(manager.engine.waiting),
+            "capacity": manager.engine.capacity
         })
+        manager.send_queue_snapshot(agent_id)
         
         # Listen for messages
         while True:
             data = await websocket.receive_text()
+            channel.touch(len(data))
+            WS_MESSAGES.inc("agent")
             message = json.loads(data)
+            # The console sends "action"; older clients send "type"
+            kind = message.get("type") or message.get("action")
             
             # Handle different message types
-            if message.get("type") == "get_queue":
-                await websocket.send_json({
-                    "type": "queue_update",
-                    "queue": manager.customer_queue,
-                    "queue_size": len(manager.customer_queue)
+            if kind == "pong":
+                continue
+            
+            elif kind == "ping":
+                channel.send({"type": "pong"})
+            
+            elif kind == "get_queue":
+                manager.send_queue_snapshot(agent_id)
+            
+            elif kind == "accept_customer":
+                # Claims are decided in bus order, so two agents can't both win
+                await manager.relay(channel, {
+                    "op": "claim",
+                    "agent_id": agent_id,
+                    "customer_id": message.get("customer_id")
                 })
             
-            elif message.get("type") == "message_to_customer":
-                customer_id = message.get("customer_id")
-                content = message.get("content")
-                await manager.send_to_customer(customer_id, {
-                    "type": "agent_message",
-                    "from": agent_id,
-                    "content": content
+            elif kind == "release_customer":
+                await manager.relay(channel, {
+                    "op": "release",
+                    "agent_id": agent_id,
+                    "customer_id": message.get("customer_id")
                 })
             
+            elif kind in ("message_to_customer", "send_message"):
+                content = message.get("content", message.get("message"))
+                await manager.relay(channel, {
+                    "op": "agent_message",
+                    "agent_id": agent_id,
+                    "customer_id": message.get("customer_id"),
+                    "message": {
+                        "type": "agent_message",
+                        "from": agent_id,
+                        "content": content,
+                        "message": content,
+                        "timestamp": datetime.now(timezone.utc).isoformat()
+                    }
+                })
+    
     except WebSocketDisconnect:
         manager.disconnect_agent(agent_id)
     except Exception as e:
-        print(f"Agent websocket error: {e}")
+        logger.warning("Agent websocket error: %s", e, extra={"agent_id": agent_id})
         manager.disconnect_agent(agent_id)
 
 @router.websocket("/ws/customer/{customer_id}")
-async def customer_websocket(websocket: WebSocket, customer_id: str):
-    """WebSocket endpoint for customers"""
-    await manager.connect_customer(customer_id, websocket)
+async def customer_websocket(
+    websocket: WebSocket, customer_id: str, token: Optional[str] = None,
+    manager: ConnectionManager = Depends(get_manager),
+):
+    """WebSocket endpoint for customers (``?token=`` from ``services.auth.sign_priority`` sets the priority class)"""
+    # The class comes only from a token signed server-side for this customer
+    priority = priority_from_token(customer_id, token)
+    if token and priority is None:
+        logger.warning("Ignoring invalid priority token", extra={"customer_id": customer_id})
+    # Queued (and routed to an agent if one is free) when the connection is applied
+    await manager.connect_customer(customer_id, websocket, priority)
+    channel = manager.customer_channels[customer_id]
     
     try:
-        # Notify agents about new customer
-        await manager.broadcast_to_agents({
-            "type": "new_customer",
-            "customer_id": customer_id,
-            "queue_size": len(manager.customer_queue)
-        })
-        
         # Send welcome message
-        await websocket.send_json({
+        await manager.send_to_customer(customer_id, {
             "type": "connected",
             "customer_id": customer_id,
             "message": "Connected to Tripscape support"
@@ -117,35 +622,61 @@ async def customer_websocket(websocket: WebSocket, customer_id: str):
         # Listen for messages
         while True:
             data = await websocket.receive_text()
+            channel.touch(len(data))
+            WS_MESSAGES.inc("customer")
             message = json.loads(data)
             
-            # Broadcast customer messages to all agents
-            if message.get("type") == "message":
-                await manager.broadcast_to_agents({
-                    "type": "customer_message",
-                    "from": customer_id,
-                    "content": message.get("content")
-                })
+            if message.get("type") == "ping":
+                channel.send({"type": "pong"})
             
+            # Route customer messages to the assigned agent
+            elif message.get("type") == "message":
+                content = message.get("content", message.get("message"))
+                await manager.relay(channel, {
+                    "op": "customer_message",
+                    "customer_id": customer_id,
+                    "message": {
+                        "type": "customer_message",
+                        "customer_id": customer_id,
+                        "from": customer_id,
+                        "content": content,
+                        "message": content,
+                        "timestamp": datetime.now(timezone.utc).isoformat()
+                    }
+                })
+    
     except WebSocketDisconnect:
-        manager.disconnect_customer(customer_id)
-        # Notify agents
-        await manager.broadcast_to_agents({
-            "type": "customer_disconnected",
-            "customer_id": customer_id,
-            "queue_size": len(manager.customer_queue)
-        })
+        manager.disconnect_customer(customer_id, websocket)
     except Exception as e:
-        print(f"Customer websocket error: {e}")
-        manager.disconnect_customer(customer_id)
+        logger.warning("Customer websocket error: %s", e, extra={"customer_id": customer_id})
+        manager.disconnect_customer(customer_id, websocket)
 
 @router.get("/stats")
-async def get_agent_stats():
-    """Get current agent statistics"""
+async def get_agent_stats(detail: bool = False, manager: ConnectionManager = Depends(get_manager)):
+    """Get current agent statistics (host-wide when the bus spans workers; connections are this worker's)"""
+    await manager.start()
+    engine = manager.engine
     return {
-        "active_agents": len(manager.active_agents),
-        "active_customers": len(manager.active_customers),
-        "queue_size": len(manager.customer_queue),
-        "agents": list(manager.active_agents.keys()),
-        "customers": list(manager.active_customers.keys())
+        "active_agents": len(engine.agents),
+        "active_customers": len(engine.customers),
+        "queue_size": len(engine.waiting),
+        "agents": list(engine.agents.keys()),
+        "customers": list(engine.customers.keys()),
+        "workers": len(set(engine.agents.values()) | set(engine.customers.values())),
+        "assignment": engine.stats(),
+        "wait_times": engine.wait_stats(),
+        "queue_feed": manager.queue_feed.stats(),
+        "bus": manager.bus.stats(),
+        "outbound": manager.outbound_stats(),
+        "transcripts": manager.transcripts.stats(),
+        "connections": manager.connection_stats(detail)
     }
+
+@router.get("/transcripts/{customer_id}", dependencies=[Depends(require_agent_key)])
+async def get_transcript(customer_id: str, limit: int = 50, manager: ConnectionManager = Depends(get_manager)):
+    """Latest messages between a customer and the agents, oldest first (agents only: ``X-API-Key``)"""
+    limit = max(1, min(limit, 500))
+    messages = await asyncio.get_running_loop().run_in_executor(
+        None, manager.transcripts.tail, f"support:{customer_id}", limit
+    )
+    return {"customer_id": customer_id, "messages": messages}
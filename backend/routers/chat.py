@@ -1,12 +1,31 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+import asyncio
+import json
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.requests import HTTPConnection
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 from services.chatbot_service import ChatbotService
+from services.log import get_logger
+from services.auth import require_agent_key
+from services.sessions import ChatSession, SessionStore, StaleSessionError
+from services.transcripts import TranscriptStore
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
+logger = get_logger(__name__)
 
-# Initialize chatbot service
-chatbot_service = ChatbotService()
+
+# The service, sessions and transcript store are built by the app lifespan (main.py)
+def get_chatbot(connection: HTTPConnection) -> ChatbotService:
+    return connection.app.state.chatbot
+
+
+def get_sessions(connection: HTTPConnection) -> SessionStore:
+    return connection.app.state.sessions
+
+
+def get_transcripts(connection: HTTPConnection) -> TranscriptStore:
+    return connection.app.state.transcripts
 
 
 class ConversationMessage(BaseModel):
@@ -16,6 +35,12 @@ class ConversationMessage(BaseModel):
 
 class ChatRequest(BaseModel):
     message: str
+    # Issued by the first response; with it the server keeps the history (ids the
+    # server didn't issue start a new session)
+    sessionId: Optional[str] = Field(default=None, max_length=64, pattern=r"^[A-Za-z0-9_-]+$")
+    # The turn count from the previous response, so another worker can tell its copy is stale
+    turn: Optional[int] = None
+    # Only for clients without a session: seeds a new session
     conversationHistory: Optional[List[ConversationMessage]] = []
 
 
@@ -39,10 +64,25 @@ class ChatResponse(BaseModel):
     message: str
     packages: Optional[List[Dict]] = None
     formData: Optional[Dict] = None
+    sessionId: Optional[str] = None
+    turn: Optional[int] = None
+
+
+async def _load_session(sessions: SessionStore, request: ChatRequest) -> ChatSession:
+    seed = [(msg.role, msg.content) for msg in request.conversationHistory or []]
+    try:
+        return await sessions.load(request.sessionId, request.turn, seed)
+    except StaleSessionError as e:
+        logger.warning("Chat session behind the client: %s", e)
+        raise HTTPException(status_code=409, detail="Session history is not available yet; retry")
 
 
 @router.post("", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(
+    request: ChatRequest,
+    chatbot_service: ChatbotService = Depends(get_chatbot),
+    sessions: SessionStore = Depends(get_sessions),
+):
     """
     Process chat messages with AI-powered responses
     """
@@ -50,24 +90,24 @@ async def chat(request: ChatRequest):
         if not request.message or not request.message.strip():
             raise HTTPException(status_code=400, detail="Message cannot be empty")
         
-        # Convert conversation history to dict format
-        conversation_history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in request.conversationHistory
-        ]
+        # History comes from the server-side session, not the request
+        session = await _load_session(sessions, request)
         
         # Process the message
         result = await chatbot_service.process_message(
             message=request.message,
-            conversation_history=conversation_history
+            conversation_history=session.history()
         )
+        sessions.record(session, request.message, result["message"])
+        result["sessionId"] = session.session_id
+        result["turn"] = session.turn
         
         return result
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Chat error: {e}")
+        logger.exception("Chat error: %s", e)
         # Return friendly error message
         return ChatResponse(
             message="I apologize, but I'm experiencing technical difficulties. Please try again or contact our support team for assistance.",
@@ -76,11 +116,77 @@ async def chat(request: ChatRequest):
         )
 
 
+@router.post("/stream")
+async def chat_stream(
+    request: ChatRequest,
+    chatbot_service: ChatbotService = Depends(get_chatbot),
+    sessions: SessionStore = Depends(get_sessions),
+):
+    """
+    Stream chat responses as Server-Sent Events.
+
+    Events, in order: ``packages`` and ``formData`` (only when present),
+    ``token`` for each chunk of the reply, then ``done`` with the full message,
+    ``sessionId`` and ``turn``.
+    Non-streaming callers keep using ``POST /api/chat``.
+    """
+    if not request.message or not request.message.strip():
+        raise HTTPException(status_code=400, detail="Message cannot be empty")
+    
+    session = await _load_session(sessions, request)
+    
+    async def event_source():
+        try:
+            async for event, data in chatbot_service.stream_message(
+                message=request.message,
+                conversation_history=session.history()
+            ):
+                if event == "done":
+                    sessions.record(session, request.message, data["message"])
+                    data = {**data, "sessionId": session.session_id, "turn": session.turn}
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            logger.exception("Chat stream error: %s", e)
+            data = {"message": "I apologize, but I'm experiencing technical difficulties. Please try again or contact our support team for assistance."}
+            yield f"event: error\ndata: {json.dumps(data)}\n\n"
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        # identity encoding keeps GZipMiddleware from buffering tokens
+        headers={"Cache-Control": "no-cache", "Content-Encoding": "identity", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/sessions/{session_id}", dependencies=[Depends(require_agent_key)])
+async def get_session(session_id: str, limit: int = 50, transcripts: TranscriptStore = Depends(get_transcripts)):
+    """A session's latest transcript messages, oldest first; agents only"""
+    limit = max(1, min(limit, 500))
+    messages = await asyncio.get_running_loop().run_in_executor(
+        None, transcripts.tail, f"chat:{session_id}", limit
+    )
+    return {"sessionId": session_id, "messages": messages}
+
+
 @router.get("/health")
-async def chat_health():
+async def chat_health(
+    chatbot_service: ChatbotService = Depends(get_chatbot),
+    sessions: SessionStore = Depends(get_sessions),
+    transcripts: TranscriptStore = Depends(get_transcripts),
+):
     """Health check for chat service"""
     return {
         "status": "OK",
         "service": "chatbot",
-        "aws_enabled": chatbot_service.aws_enabled
+        "ready": chatbot_service.ready.is_set(),
+        "aws_enabled": chatbot_service.aws_enabled,
+        "kb_backend": chatbot_service.local_kb.stats() if chatbot_service.local_kb else {"backend": chatbot_service.kb_backend},
+        "kb_cache": chatbot_service.kb_cache.stats(),
+        "response_cache": chatbot_service.response_cache.stats(),
+        "coalescing": chatbot_service.coalescer.stats(),
+        "intent_routing": chatbot_service.intent_router.stats(),
+        "prompts": chatbot_service.prompt_builder.stats(),
+        "bedrock": chatbot_service.bedrock_stats(),
+        "transcripts": transcripts.stats(),
+        "sessions": sessions.stats()
     }
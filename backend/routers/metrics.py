@@ -0,0 +1,22 @@
+import asyncio
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services.metrics import merge, registry, render
+
+# The registry's snapshot publisher is started and stopped by the app lifespan
+router = APIRouter(prefix="/api", tags=["Metrics"])
+
+def _render_all(local: dict) -> str:
+    others = registry.other_snapshots()
+    return render(merge([local] + others), 1 + len(others))
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics merged across the host's workers"""
+    # Callback gauges read event-loop state, so this worker's snapshot is taken
+    # here; reading the other workers' files and rendering go to a thread
+    local = registry.snapshot()
+    text = await asyncio.get_running_loop().run_in_executor(None, _render_all, local)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
@@ -0,0 +1,154 @@
+import base64
+import gzip
+import hashlib
+import json
+from bisect import bisect_right
+from typing import Optional, Sequence, Set, Tuple
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from config import settings
+from services.cache import MemoryCache
+from services.catalog import CatalogSnapshot, get_catalog
+
+router = APIRouter(prefix="/api/packages", tags=["Packages"])
+
+# Pre-serialized response bodies keyed by the catalog's content fingerprint +
+# query, so repeat browsing costs a dict lookup; a changed file retires them.
+# The fingerprint (not the per-process version counter) keeps cursors and
+# ETags identical across workers serving the same file.
+response_cache = MemoryCache(
+    ttl_seconds=settings.packages_cache_ttl_seconds,
+    max_entries=settings.packages_cache_max_entries,
+    max_bytes=settings.packages_cache_max_bytes,
+)
+
+
+def _encode_cursor(snapshot: CatalogSnapshot, position: int) -> str:
+    raw = json.dumps({"v": snapshot.fingerprint, "p": position, "id": snapshot.packages[position].id})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(snapshot: CatalogSnapshot, cursor: str) -> int:
+    """Position to continue after; survives catalog reloads as long as the package still exists"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        position = data["p"]
+        # The position is only a shortcut: it must point at the package the cursor names
+        if not (data["v"] == snapshot.fingerprint and type(position) is int
+                and 0 <= position < len(snapshot) and snapshot.packages[position].id == data["id"]):
+            position = snapshot.by_id.get(data["id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if position is None:
+        raise HTTPException(status_code=400, detail="Cursor is no longer valid, restart from the first page")
+    return position
+
+
+def _matching_keys(index: dict, term: str) -> Set[int]:
+    """Union of index entries whose key contains ``term`` (e.g. 'kerala' -> 'kerala, india')"""
+    term = term.strip().lower()
+    ids: Set[int] = set()
+    for key, positions in index.items():
+        if term in key:
+            ids |= positions
+    return ids
+
+
+def _filter(
+    snapshot: CatalogSnapshot,
+    destination: Optional[str],
+    min_price: Optional[int],
+    max_price: Optional[int],
+    suitable_for: Optional[str],
+) -> Sequence[int]:
+    """Resolve filters against the catalog indexes and return matching positions in catalog order"""
+    candidates: Optional[Set[int]] = None
+    if destination:
+        candidates = _matching_keys(snapshot.by_destination, destination)
+    if suitable_for:
+        ids = _matching_keys(snapshot.by_suitability, suitable_for)
+        candidates = ids if candidates is None else candidates & ids
+    if min_price is not None or max_price is not None:
+        in_range = snapshot.price_range(min_price, max_price)
+        if candidates is None:
+            candidates = set(in_range)
+        else:
+            candidates = {i for i in candidates if (min_price is None or snapshot.packages[i].price >= min_price)
+                          and (max_price is None or snapshot.packages[i].price <= max_price)}
+    if candidates is None:
+        return range(len(snapshot))
+    return sorted(candidates)
+
+
+def _etag(body: bytes) -> str:
+    return f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+
+def _respond(request: Request, cached: Tuple) -> Response:
+    etag, body, gzipped = cached
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if gzipped is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        # Pre-compressed variant: its own strong ETag, and GZipMiddleware leaves it alone
+        body = gzipped
+        headers["ETag"] = etag[:-1] + '-gzip"'
+        headers["Content-Encoding"] = "gzip"
+        etag = headers["ETag"]
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def _serialize(payload: dict) -> Tuple:
+    """(etag, body, gzipped body or None) computed once per catalog version and query"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    gzipped = gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= 1000 else None
+    return _etag(body), body, gzipped
+
+
+@router.get("")
+async def list_packages(
+    request: Request,
+    destination: Optional[str] = None,
+    min_price: Optional[int] = Query(None, ge=0),
+    max_price: Optional[int] = Query(None, ge=0),
+    suitable_for: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+):
+    """List catalog packages with filters, cursor pagination and ETag revalidation"""
+    snapshot = get_catalog().snapshot()
+    key = json.dumps([snapshot.fingerprint, destination, min_price, max_price, suitable_for, limit, cursor])
+    cached = response_cache.get(key)
+    if cached is None:
+        after = _decode_cursor(snapshot, cursor) if cursor else -1
+        positions = _filter(snapshot, destination, min_price, max_price, suitable_for)
+        start = bisect_right(positions, after)
+        page = positions[start:start + limit]
+        cached = _serialize({
+            "packages": [snapshot.packages[i].to_dict() for i in page],
+            "count": len(page),
+            "total": len(positions),
+            "next_cursor": _encode_cursor(snapshot, page[-1]) if start + limit < len(positions) else None,
+            "catalog_version": snapshot.fingerprint,
+        })
+        response_cache.set(key, cached)
+    return _respond(request, cached)
+
+
+@router.get("/{package_id}")
+async def get_package(request: Request, package_id: str):
+    """Get a single package by ID"""
+    snapshot = get_catalog().snapshot()
+    key = json.dumps([snapshot.fingerprint, "id", package_id])
+    cached = response_cache.get(key)
+    if cached is None:
+        package = snapshot.get(package_id)
+        if package is None:
+            raise HTTPException(status_code=404, detail="Package not found")
+        cached = _serialize(package.to_dict())
+        response_cache.set(key, cached)
+    return _respond(request, cached)
@@ -0,0 +1,372 @@
+"""
+Customer-to-agent assignment engine for the live support console.
+
+A deterministic state machine: every worker's ConnectionManager feeds it the
+same bus events in the same order, so all replicas reach the same
+assignments without further coordination.
+
+- Waiting customers sit in a priority queue (``services.wait_queue``):
+  configurable classes get a head start in seconds and everyone ages at the
+  same rate, with O(log n) enqueue/dequeue and O(1) removal on disconnect.
+  Times come from the bus events (``tick``), never the local clock, so
+  replicas agree on every key.
+- Agents are bucketed by current load, so the least-loaded agent with spare
+  capacity is found in O(capacity); within a bucket the agent that has been
+  at that load longest goes first.
+- An agent may claim (accept) a specific waiting customer; with auto-assign
+  on, waiting customers are also routed to free agents as capacity appears.
+- Once assigned, a customer's messages go to that one agent only. Messages
+  sent while waiting are kept (bounded) and handed over on assignment.
+- Recent waits (connect or requeue to assignment) and abandonments are kept
+  for the wait-time percentiles and SLA figures in ``stats``.
+- After a hub failover each worker re-announces its connections. A customer
+  whose agent lives on a worker that has not re-announced yet is held back
+  from auto-assign for ``PAIR_HOLD_SECONDS`` so the chat resumes with that
+  agent instead of going to whoever is free first.
+"""
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from services.wait_queue import WaitQueue
+
+# Completed waits kept for percentiles
+MAX_WAIT_SAMPLES = 2000
+# How long a re-announced assignment waits for its agent's worker to rejoin
+PAIR_HOLD_SECONDS = 5.0
+
+
+def _percentiles(values: List[float]) -> Dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    pick = lambda q: round(values[min(len(values) - 1, int(len(values) * q))], 2)
+    return {"count": len(values), "p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(values[-1], 2)}
+
+
+@dataclass
+class Assignment:
+    customer_id: str
+    agent_id: str
+    backlog: List[Dict] = field(default_factory=list)
+
+
+class AssignmentEngine:
+    """Waiting queue, agent loads and customer -> agent assignments"""
+
+    def __init__(
+        self,
+        capacity: int = 5,
+        auto_assign: bool = True,
+        priorities: Optional[Dict[str, float]] = None,
+        sla_seconds: float = 120,
+    ):
+        self.capacity = capacity
+        self.auto_assign = auto_assign
+        self.priorities = priorities or {"standard": 0.0}  # class -> head start (seconds)
+        self.default_priority = next(iter(self.priorities))
+        self.sla_seconds = sla_seconds
+        self.now = 0.0  # wall clock of the latest event applied
+        self.agents: Dict[str, str] = {}  # agent_id -> owning worker
+        self.customers: Dict[str, str] = {}  # customer_id -> owning worker
+        self.waiting = WaitQueue()
+        self.customer_priority: Dict[str, str] = {}
+        self.queue_keys: Dict[str, float] = {}  # customer_id -> key from first connect
+        self.assignments: Dict[str, str] = {}  # customer_id -> agent_id
+        self.held: Dict[str, Tuple[str, float]] = {}  # customer_id -> (agent_id, until), see sync_worker
+        self.agent_customers: Dict[str, Set[str]] = {}
+        self._by_load: Dict[int, "OrderedDict[str, None]"] = {}
+        self.waits: Deque[Tuple[str, float]] = deque(maxlen=MAX_WAIT_SAMPLES)  # (class, seconds)
+        self.abandoned: Dict[str, int] = {}
+
+    def tick(self, ts: Optional[float]):
+        """Advance the clock to a bus event's timestamp"""
+        if ts is not None and ts > self.now:
+            self.now = ts
+
+    # Agent load buckets
+
+    def _set_load(self, agent_id: str, old: Optional[int], new: Optional[int]):
+        if old is not None:
+            bucket = self._by_load[old]
+            del bucket[agent_id]
+            if not bucket:
+                del self._by_load[old]
+        if new is not None:
+            self._by_load.setdefault(new, OrderedDict())[agent_id] = None
+
+    def load(self, agent_id: str) -> int:
+        return len(self.agent_customers.get(agent_id, ()))
+
+    def least_loaded_agent(self) -> Optional[str]:
+        for load in range(self.capacity):
+            bucket = self._by_load.get(load)
+            if bucket:
+                return next(iter(bucket))
+        return None
+
+    # Connections
+
+    def add_agent(self, agent_id: str, worker: str) -> List[Assignment]:
+        if agent_id in self.agents:
+            self.agents[agent_id] = worker
+            return []
+        self.agents[agent_id] = worker
+        self.agent_customers[agent_id] = set()
+        self._set_load(agent_id, None, 0)
+        return self.route()
+
+    def remove_agent(self, agent_id: str, worker: Optional[str] = None, reroute: bool = True) -> List[Assignment]:
+        """Drop an agent; its customers go back to the front of the queue and are rerouted"""
+        if agent_id not in self.agents or (worker is not None and self.agents[agent_id] != worker):
+            return []
+        del self.agents[agent_id]
+        customers = self.agent_customers.pop(agent_id)
+        self._set_load(agent_id, len(customers), None)
+        for customer_id in sorted(customers):
+            del self.assignments[customer_id]
+            self._enqueue(customer_id)
+        return self.route() if reroute else []
+
+    def add_customer(self, customer_id: str, worker: str, priority: Optional[str] = None) -> List[Assignment]:
+        self.customers[customer_id] = worker
+        if customer_id not in self.waiting and customer_id not in self.assignments:
+            priority = priority if priority in self.priorities else self.default_priority
+            self.customer_priority[customer_id] = priority
+            self.queue_keys[customer_id] = self.now - self.priorities[priority]
+            self._enqueue(customer_id)
+        return self.route()
+
+    def _enqueue(self, customer_id: str, since: Optional[float] = None):
+        """(Re)queue a connected customer under the key from its first connect.
+
+        A customer requeued by a release or a departing agent keeps that key,
+        so it goes back near the front instead of behind later arrivals.
+        """
+        priority = self.customer_priority.get(customer_id, self.default_priority)
+        key = self.queue_keys.setdefault(customer_id, self.now - self.priorities.get(priority, 0.0))
+        self.waiting.push(customer_id, priority, key, self.now if since is None else since)
+
+    def remove_customer(self, customer_id: str, worker: Optional[str] = None, reroute: bool = True) -> Tuple[bool, Optional[str], List[Assignment]]:
+        """Drop a customer: (was waiting, agent it was assigned to, assignments made with the freed capacity)"""
+        if customer_id not in self.customers or (worker is not None and self.customers[customer_id] != worker):
+            return False, None, []
+        del self.customers[customer_id]
+        self.queue_keys.pop(customer_id, None)
+        self.held.pop(customer_id, None)
+        priority = self.customer_priority.pop(customer_id, self.default_priority)
+        was_waiting = self.waiting.remove(customer_id) is not None
+        if was_waiting:
+            self.abandoned[priority] = self.abandoned.get(priority, 0) + 1
+        agent_id = self.assignments.pop(customer_id, None)
+        if agent_id is None:
+            return was_waiting, None, []
+        self._release(agent_id, customer_id)
+        return was_waiting, agent_id, self.route() if reroute else []
+
+    # Assignment
+
+    def _assign(self, customer_id: str, agent_id: str) -> Assignment:
+        self.held.pop(customer_id, None)
+        entry = self.waiting.remove(customer_id)
+        self.waits.append((entry.priority, max(0.0, self.now - entry.since)))
+        load = self.load(agent_id)
+        self.agent_customers[agent_id].add(customer_id)
+        self._set_load(agent_id, load, load + 1)
+        self.assignments[customer_id] = agent_id
+        return Assignment(customer_id, agent_id, list(entry.backlog))
+
+    def _release(self, agent_id: str, customer_id: str):
+        load = self.load(agent_id)
+        self.agent_customers[agent_id].discard(customer_id)
+        self._set_load(agent_id, load, load - 1)
+
+    def claim(self, agent_id: str, customer_id: str) -> Tuple[Optional[Assignment], str]:
+        """An agent accepts a specific waiting customer: (assignment, "") or (None, reason)"""
+        if agent_id not in self.agents:
+            return None, "unknown_agent"
+        owner = self.assignments.get(customer_id)
+        if owner == agent_id:
+            return None, "already_yours"
+        if owner is not None:
+            return None, "already_assigned"
+        if customer_id not in self.waiting:
+            return None, "not_waiting"
+        if self.load(agent_id) >= self.capacity:
+            return None, "at_capacity"
+        return self._assign(customer_id, agent_id), ""
+
+    def release(self, agent_id: str, customer_id: str) -> List[Assignment]:
+        """An agent finished with a customer who stays connected (back to the queue's front)"""
+        if self.assignments.get(customer_id) != agent_id:
+            return []
+        del self.assignments[customer_id]
+        self._release(agent_id, customer_id)
+        self._enqueue(customer_id)
+        return self.route()
+
+    def route(self) -> List[Assignment]:
+        """Auto-assign waiting customers, in priority order, to the least-loaded free agents"""
+        made = self._settle_holds()
+        if not self.auto_assign:
+            return made
+        while self.waiting:
+            agent_id = self.least_loaded_agent()
+            if agent_id is None:
+                break
+            customer_id = self.waiting.peek() if not self.held else next(
+                (c for c in self.waiting if c not in self.held), None
+            )
+            if customer_id is None:
+                break
+            made.append(self._assign(customer_id, agent_id))
+        return made
+
+    def _settle_holds(self) -> List[Assignment]:
+        """Give held customers to their agent once it is back; let go of holds that lapsed"""
+        made = []
+        for customer_id, (agent_id, until) in list(self.held.items()):
+            if customer_id not in self.waiting:
+                del self.held[customer_id]
+            elif agent_id in self.agents:
+                if self.load(agent_id) < self.capacity:
+                    made.append(self._assign(customer_id, agent_id))
+                else:
+                    del self.held[customer_id]
+            elif self.now >= until:
+                del self.held[customer_id]
+        return made
+
+    def customer_message(self, customer_id: str, message: Dict) -> Optional[str]:
+        """Agent to deliver a customer's message to; None if it was kept in the waiting backlog"""
+        agent_id = self.assignments.get(customer_id)
+        entry = self.waiting.get(customer_id)
+        if agent_id is None and entry is not None:
+            entry.backlog.append(message)
+        return agent_id
+
+    # Replication
+
+    def forget_worker(self, worker: str) -> Tuple[List[Tuple[str, bool, Optional[str]]], List[Assignment]]:
+        """Drop a worker that went away: ([(customer, was waiting, agent)], reassignments)"""
+        for agent_id in [a for a, w in self.agents.items() if w == worker]:
+            self.remove_agent(agent_id, reroute=False)
+        removed = []
+        for customer_id in [c for c, w in self.customers.items() if w == worker]:
+            was_waiting, agent_id, _ = self.remove_customer(customer_id, reroute=False)
+            removed.append((customer_id, was_waiting, agent_id))
+        return removed, self.route()
+
+    def describe_customers(self, customer_ids: List[str]) -> List[List]:
+        """[customer_id, class, key, waiting since] rows for a worker_sync announcement"""
+        rows = []
+        for customer_id in customer_ids:
+            entry = self.waiting.get(customer_id)
+            rows.append([
+                customer_id,
+                self.customer_priority.get(customer_id, self.default_priority),
+                self.queue_keys.get(customer_id),
+                entry.since if entry is not None else None,
+            ])
+        return rows
+
+    def sync_worker(self, worker: str, agents: List[str], customers: List[List], pairs: Dict[str, str]) -> List[Assignment]:
+        """Replace a worker's entries with what it announced after (re)joining.
+
+        ``customers`` are ``describe_customers`` rows, so waiting customers
+        keep their place across a hub failover. ``pairs`` are assignments it
+        knew about for its own agents and customers; they are restored when
+        both sides are known, so a failover does not reshuffle ongoing chats.
+        A customer whose agent is not known yet is held for that agent's
+        worker to rejoin (up to ``PAIR_HOLD_SECONDS``). Restored pairs are
+        not returned: both sides already know about them.
+        """
+        for agent_id in [a for a, w in self.agents.items() if w == worker]:
+            self.remove_agent(agent_id, reroute=False)
+        for customer_id in [c for c, w in self.customers.items() if w == worker]:
+            self.remove_customer(customer_id, reroute=False)
+        for agent_id in agents:
+            self.agents[agent_id] = worker
+            self.agent_customers[agent_id] = set()
+            self._set_load(agent_id, None, 0)
+        for customer_id, priority, key, since in customers:
+            self.customers[customer_id] = worker
+            self.customer_priority[customer_id] = priority if priority in self.priorities else self.default_priority
+            if key is not None:
+                self.queue_keys[customer_id] = key
+            if customer_id not in self.assignments and customer_id not in self.waiting:
+                self._enqueue(customer_id, since)
+        for customer_id, agent_id in pairs.items():
+            if customer_id in self.waiting and agent_id not in self.agents:
+                self.held[customer_id] = (agent_id, self.now + PAIR_HOLD_SECONDS)
+            elif customer_id in self.waiting and self.load(agent_id) < self.capacity:
+                self._assign(customer_id, agent_id)
+        self._settle_holds()
+        return self.route()
+
+    def snapshot(self) -> Dict:
+        return {
+            "agents": dict(self.agents),
+            "customers": dict(self.customers),
+            "waiting": self.waiting.snapshot(),
+            "customer_priority": dict(self.customer_priority),
+            "queue_keys": dict(self.queue_keys),
+            "assignments": dict(self.assignments),
+            "held": {customer_id: list(hold) for customer_id, hold in self.held.items()},
+            "load_order": [agent_id for load in sorted(self._by_load) for agent_id in self._by_load[load]],
+            "now": self.now,
+            "waits": [list(sample) for sample in self.waits],
+            "abandoned": dict(self.abandoned),
+        }
+
+    def restore(self, state: Dict):
+        self.agents = dict(state.get("agents", {}))
+        self.customers = dict(state.get("customers", {}))
+        self.waiting = WaitQueue.restore(state.get("waiting", []))
+        self.customer_priority = dict(state.get("customer_priority", {}))
+        self.queue_keys = dict(state.get("queue_keys", {}))
+        self.now = max(self.now, state.get("now", 0.0))
+        self.waits = deque((tuple(sample) for sample in state.get("waits", [])), maxlen=MAX_WAIT_SAMPLES)
+        self.abandoned = dict(state.get("abandoned", {}))
+        self.assignments = dict(state.get("assignments", {}))
+        self.held = {customer_id: tuple(hold) for customer_id, hold in state.get("held", {}).items()}
+        self.agent_customers = {agent_id: set() for agent_id in self.agents}
+        for customer_id, agent_id in self.assignments.items():
+            self.agent_customers[agent_id].add(customer_id)
+        # Rebuild the load buckets in the same within-bucket order as the source replica
+        self._by_load = {}
+        for agent_id in state.get("load_order", list(self.agents)):
+            self._set_load(agent_id, None, self.load(agent_id))
+
+    def stats(self) -> Dict:
+        return {
+            "capacity_per_agent": self.capacity,
+            "auto_assign": self.auto_assign,
+            "waiting": len(self.waiting),
+            "assigned": len(self.assignments),
+            "agents_by_load": {load: len(bucket) for load, bucket in sorted(self._by_load.items())},
+        }
+
+    def wait_stats(self, now: Optional[float] = None) -> Dict:
+        """Wait-time percentiles (seconds), overall and per priority class"""
+        now = time.time() if now is None else now
+        by_class = {}
+        for priority in self.priorities:
+            waited = [seconds for p, seconds in self.waits if p == priority]
+            by_class[priority] = {
+                "head_start_seconds": self.priorities[priority],
+                "waiting": sum(1 for entry in self.waiting.values() if entry.priority == priority),
+                "abandoned": self.abandoned.get(priority, 0),
+                "waited": _percentiles(waited),
+            }
+        waited = [seconds for _, seconds in self.waits]
+        return {
+            "sla_seconds": self.sla_seconds,
+            # Recent waits (connect or requeue to assignment) that met the SLA
+            "within_sla": round(sum(1 for seconds in waited if seconds <= self.sla_seconds) / len(waited), 3) if waited else None,
+            "waited": _percentiles(waited),
+            # How long the customers still in the queue have been waiting so far
+            "waiting_now": _percentiles([max(0.0, now - entry.since) for entry in self.waiting.values()]),
+            "by_class": by_class,
+        }
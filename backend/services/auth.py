@@ -0,0 +1,91 @@
+"""
+Server-issued credentials for the live support WebSockets.
+
+A customer's waiting-queue priority class is never taken from what the client
+asks for. Whatever knows the customer's account (booking system, CRM) issues a
+token with ``sign_priority`` and hands it to the client, which connects with
+``/ws/customer/{id}?token=...``; ``priority_from_token`` accepts it only if it
+was signed with this deployment's ``SECRET_KEY`` for that same customer id
+and has not expired. Anything else gets the default class. While ``SECRET_KEY``
+is unset (still the shipped placeholder) anyone could sign a token, so every
+token is refused and a warning logged.
+
+Tokens are ``<class>.<expires at, unix seconds>.<HMAC-SHA256 hex>`` over the
+customer id, class and expiry.
+
+Chat session ids are issued by the server as ``<random hex>-<HMAC>``;
+``session_id_valid`` rejects any id a client made up.
+
+Agent-only HTTP endpoints (e.g. transcripts) depend on ``require_agent_key``:
+the request must send the deployment's ``API_KEY`` as ``X-API-Key``. With no
+``API_KEY`` configured they refuse every request.
+"""
+import hashlib
+import hmac
+import secrets
+import time
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from config import settings
+from services.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def _signature(customer_id: str, priority: str, expires_at: int) -> str:
+    payload = f"{customer_id}\n{priority}\n{expires_at}".encode()
+    return hmac.new(settings.secret_key.encode(), payload, hashlib.sha256).hexdigest()
+
+
+def sign_priority(customer_id: str, priority: str, ttl_seconds: float = 3600) -> str:
+    """Token granting ``customer_id`` the ``priority`` class for ``ttl_seconds``"""
+    expires_at = int(time.time() + ttl_seconds)
+    return f"{priority}.{expires_at}.{_signature(customer_id, priority, expires_at)}"
+
+
+def priority_from_token(customer_id: str, token: Optional[str]) -> Optional[str]:
+    """The class a valid, unexpired token grants this customer; None otherwise"""
+    if not token:
+        return None
+    if not settings.secret_key_configured:
+        logger.warning("SECRET_KEY is not configured; ignoring priority token for customer %s", customer_id)
+        return None
+    try:
+        priority, expires_at, signature = token.rsplit(".", 2)
+        expires_at = int(expires_at)
+    except ValueError:
+        return None
+    if expires_at < time.time():
+        return None
+    # Bytes, so a non-ASCII signature is just a mismatch rather than a TypeError
+    if not hmac.compare_digest(signature.encode(), _signature(customer_id, priority, expires_at).encode()):
+        return None
+    return priority
+
+
+def _session_signature(nonce: str) -> str:
+    return hmac.new(settings.secret_key.encode(), f"session\n{nonce}".encode(), hashlib.sha256).hexdigest()[:24]
+
+
+def new_session_id() -> str:
+    """A fresh chat session id, signed so the server can tell it issued it"""
+    nonce = secrets.token_hex(16)
+    return f"{nonce}-{_session_signature(nonce)}"
+
+
+def session_id_valid(session_id: Optional[str]) -> bool:
+    """Whether ``session_id`` came from ``new_session_id`` on this deployment"""
+    if not session_id:
+        return False
+    nonce, _, signature = session_id.partition("-")
+    return bool(nonce) and hmac.compare_digest(signature.encode(), _session_signature(nonce).encode())
+
+
+def require_agent_key(x_api_key: Optional[str] = Header(default=None)):
+    """FastAPI dependency for agent-only endpoints"""
+    if not settings.api_key:
+        raise HTTPException(status_code=403, detail="Agent API key not configured")
+    if not x_api_key or not hmac.compare_digest(x_api_key.encode(), settings.api_key.encode()):
+        raise HTTPException(status_code=401, detail="Invalid agent API key")
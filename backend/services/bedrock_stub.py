@@ -0,0 +1,275 @@
+"""
+Offline stand-ins for the Bedrock runtime and agent-runtime clients.
+
+Enabled with BEDROCK_STUB=true for local development and benchmarks. They
+mirror the boto3 response shapes used by ChatbotService (including the
+invoke_model_with_response_stream event stream) and block for a configurable
+latency the way a real network call would.
+
+``StubBedrockServer`` serves the same responses over HTTP, speaking the
+Bedrock REST API (including the binary event-stream framing), so the real
+boto3 clients, their connection pool, timeouts and retries, the circuit
+breaker and KB hedging can be exercised with BEDROCK_ENDPOINT_URL pointed at
+it. It can inject errors and latency spikes. Run it from the backend
+directory (boto3 still signs requests, so any dummy credentials will do):
+
+    python -m services.bedrock_stub --port 8089 --latency-ms 300 --error-rate 0.2
+"""
+import argparse
+import base64
+import binascii
+import io
+import json
+import random
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator
+
+from services.log import get_logger
+
+logger = get_logger(__name__)
+
+
+def _last_user_message(body: str) -> str:
+    request = json.loads(body)
+    messages = request.get("messages") or [{}]
+    content = messages[-1].get("content", "")
+    if isinstance(content, list):
+        content = " ".join(block.get("text", "") for block in content)
+    text = content.rsplit("User's latest message:", 1)[-1].strip()
+    return text.splitlines()[0] if text else ""
+
+
+def _reply_for(body: str) -> str:
+    question = _last_user_message(body)[:80]
+    return (
+        f"Great question about \"{question}\"! Tripscape has curated packages across India "
+        "and abroad, from Bhutan Bliss at ₹25,999 to the Exotic Dubai Escape at ₹95,999. "
+        "Tell me your dates, group size and budget and I'll find the perfect fit."
+    )
+
+
+class StubBedrockRuntime:
+    """Fake bedrock-runtime client returning canned Claude responses"""
+
+    def __init__(self, latency: float = 0.0, token_interval: float = 0.0):
+        self.latency = latency
+        self.token_interval = token_interval
+
+    def invoke_model(self, modelId: str, body: str, **kwargs) -> Dict:
+        time.sleep(self.latency)
+        payload = {
+            "id": "msg_stub",
+            "type": "message",
+            "role": "assistant",
+            "content": [{"type": "text", "text": _reply_for(body)}],
+            "stop_reason": "end_turn",
+        }
+        return {"body": io.BytesIO(json.dumps(payload).encode()), "contentType": "application/json"}
+
+    def invoke_model_with_response_stream(self, modelId: str, body: str, **kwargs) -> Dict:
+        return {"body": self._stream_events(_reply_for(body)), "contentType": "application/json"}
+
+    def _stream_events(self, text: str) -> Iterator[Dict]:
+        def event(payload: Dict) -> Dict:
+            return {"chunk": {"bytes": json.dumps(payload).encode()}}
+
+        time.sleep(self.latency)
+        yield event({"type": "message_start", "message": {"id": "msg_stub", "role": "assistant"}})
+        yield event({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            if i and self.token_interval:
+                time.sleep(self.token_interval)
+            piece = word if i == len(words) - 1 else word + " "
+            yield event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}})
+        yield event({"type": "content_block_stop", "index": 0})
+        yield event({"type": "message_delta", "delta": {"stop_reason": "end_turn"}})
+        yield event({"type": "message_stop"})
+
+
+class StubBedrockAgent:
+    """Fake bedrock-agent-runtime client returning canned Knowledge Base chunks"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def retrieve(self, knowledgeBaseId: str, retrievalQuery: Dict, retrievalConfiguration: Dict = None, **kwargs) -> Dict:
+        time.sleep(self.latency)
+        count = (retrievalConfiguration or {}).get("vectorSearchConfiguration", {}).get("numberOfResults", 3)
+        query = retrievalQuery.get("text", "")
+        return {
+            "retrievalResults": [
+                {"content": {"text": f"Tripscape knowledge base excerpt {i + 1} for: {query}"}, "score": 1.0 - i / 10}
+                for i in range(count)
+            ]
+        }
+
+
+def _event_stream_message(payload: Dict) -> bytes:
+    """One application/vnd.amazon.eventstream frame carrying a response stream chunk"""
+    headers = b""
+    for name, value in ((":event-type", "chunk"), (":content-type", "application/json"), (":message-type", "event")):
+        encoded = value.encode()
+        headers += bytes([len(name)]) + name.encode() + b"\x07" + struct.pack(">H", len(encoded)) + encoded
+    body = json.dumps({"bytes": base64.b64encode(json.dumps(payload).encode()).decode()}).encode()
+    prelude = struct.pack(">II", 16 + len(headers) + len(body), len(headers))
+    prelude += struct.pack(">I", binascii.crc32(prelude))
+    message = prelude + headers + body
+    return message + struct.pack(">I", binascii.crc32(message))
+
+
+class StubBedrockServer:
+    """Local HTTP endpoint for the bedrock-runtime and bedrock-agent-runtime APIs"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, token_interval: float = 0.0,
+                 error_rate: float = 0.0, slow_rate: float = 0.0, slow_latency: float = 1.0, slow_operations=None, seed: int = 0):
+        self.runtime = StubBedrockRuntime(latency=0.0, token_interval=token_interval)
+        self.agent = StubBedrockAgent(latency=0.0)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        # Operations the slow_rate applies to (None = all)
+        self.slow_operations = set(slow_operations) if slow_operations else None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.errors = 0
+        self.connections = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _roll(self, operation: str):
+        """(fail, delay) for the next request"""
+        with self._lock:
+            fail = self._random.random() < self.error_rate
+            slow = self._random.random() < self.slow_rate and (
+                self.slow_operations is None or operation in self.slow_operations
+            )
+        return fail, self.slow_latency if slow else self.latency
+
+    def _count(self, operation: str, failed: bool):
+        with self._lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+            self.errors += failed
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Headers and body go out as separate writes; don't let Nagle hold the body
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with stub._lock:
+                    stub.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, payload: Dict, error_type: str = None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if error_type:
+                    self.send_header("x-amzn-ErrorType", error_type)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+                path = self.path.split("?", 1)[0]
+                if path.endswith("/invoke-with-response-stream"):
+                    operation = "invoke_model_with_response_stream"
+                elif path.endswith("/invoke"):
+                    operation = "invoke_model"
+                elif path.endswith("/retrieve"):
+                    operation = "retrieve"
+                else:
+                    self._send_json(404, {"message": f"Unknown operation {path}"}, "UnknownOperationException")
+                    return
+                fail, delay = stub._roll(operation)
+                stub._count(operation, fail)
+                time.sleep(delay)
+                if fail:
+                    self._send_json(503, {"message": "Injected stub failure"}, "ServiceUnavailableException")
+                    return
+                if operation == "invoke_model":
+                    response = stub.runtime.invoke_model(modelId="", body=body)
+                    self._send_json(200, json.loads(response["body"].read()))
+                elif operation == "retrieve":
+                    request = json.loads(body or "{}")
+                    self._send_json(200, stub.agent.retrieve(
+                        knowledgeBaseId="",
+                        retrievalQuery=request.get("retrievalQuery", {}),
+                        retrievalConfiguration=request.get("retrievalConfiguration"),
+                    ))
+                else:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/vnd.amazon.eventstream")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for event in stub.runtime.invoke_model_with_response_stream(modelId="", body=body)["body"]:
+                        frame = _event_stream_message(json.loads(event["chunk"]["bytes"]))
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(frame), frame))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+    def start(self) -> "StubBedrockServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="bedrock-stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"requests": dict(self.requests), "errors": self.errors, "connections": self.connections}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Bedrock HTTP stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--token-interval-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests answered with a 503")
+    parser.add_argument("--slow-rate", type=float, default=0, help="share of requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=1000)
+    parser.add_argument("--slow-ops", default="", help="comma-separated operations to slow down (default: all)")
+    args = parser.parse_args()
+    server = StubBedrockServer(
+        args.host, args.port,
+        latency=args.latency_ms / 1000,
+        token_interval=args.token_interval_ms / 1000,
+        error_rate=args.error_rate,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_ms / 1000,
+        slow_operations=[op for op in args.slow_ops.split(",") if op],
+    )
+    logger.info("Bedrock stub listening", extra={"endpoint": server.endpoint_url})
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Host-local message bus behind the agent ConnectionManager.
+
+Every worker keeps a replica of the shared agent/customer state and applies
+the same totally ordered stream of events to it; each worker then performs
+only the side effects for sockets it owns (e.g. a broadcast is delivered by
+every worker to its own agents). A bus only has to deliver events to all
+workers in one order:
+
+- ``LocalMessageBus``: a single process, events are applied as published
+- ``UnixSocketBus``: the worker holding an flock on ``<path>.lock`` is the
+  hub; it serves a Unix domain socket, sequences every event and fans it out
+  to the other workers. A joining worker gets a state snapshot, then announces
+  its own connections. If the hub dies its lock is released and the first
+  worker to take it becomes the new hub; everyone rejoins and re-announces.
+
+Events are stamped with a sequence number and the sequencer's wall clock
+(``ts``), which replicas use instead of their own clocks.
+
+The replica passed to ``start`` provides ``apply(event)``, ``snapshot()``,
+``restore(state)`` and ``sync_event()``.
+
+``publish`` raises ``BusPublishError`` when the hub doesn't confirm an event in
+time (e.g. during failover), so the sender can be told its message may not
+have been delivered. A worker's own connections survive such a loss: it
+re-announces them with ``sync_event()`` whenever it joins a hub.
+"""
+import abc
+import asyncio
+import fcntl
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from services.log import get_logger
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+logger = get_logger(__name__)
+
+# Largest single event line and how far a peer may fall behind before it is dropped
+MAX_FRAME_BYTES = 4 * 1024 * 1024
+MAX_PEER_BUFFER_BYTES = 16 * 1024 * 1024
+
+
+class BusPublishError(Exception):
+    """The hub did not confirm a published event; it may or may not be applied"""
+
+
+class MessageBus(abc.ABC):
+    """Delivers every published event to every worker's replica in one total order"""
+
+    backend = "none"
+
+    def __init__(self):
+        self.worker_id = str(os.getpid())
+        self.replica = None
+        self.seq = 0
+
+    async def start(self, replica):
+        self.replica = replica
+
+    @abc.abstractmethod
+    async def publish(self, event: Dict):
+        """Publish an event; returns once it has been applied in this worker"""
+
+    async def close(self):
+        pass
+
+    def _apply(self, event: Dict):
+        try:
+            self.replica.apply(event)
+        except Exception as e:
+            logger.exception("Failed to apply bus event: %s", e, extra={"op": event.get("op")})
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend, "worker": self.worker_id, "seq": self.seq}
+
+
+class LocalMessageBus(MessageBus):
+    """Single-process bus: events are applied immediately, in publish order"""
+
+    backend = "local"
+
+    async def publish(self, event: Dict):
+        self.seq += 1
+        event["seq"] = self.seq
+        event["ts"] = time.time()
+        self._apply(event)
+
+
+class UnixSocketBus(MessageBus):
+    """Cross-worker bus over a Unix domain socket with an flock-elected hub"""
+
+    backend = "unix"
+
+    def __init__(self, path: str, publish_timeout: float = 2.0):
+        super().__init__()
+        path = Path(path)
+        self.path = path if path.is_absolute() else BASE_DIR / path
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.publish_timeout = publish_timeout
+        self.role = "starting"
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._peers: Dict[asyncio.StreamWriter, Optional[str]] = {}
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._outbox: List[bytes] = []
+        self._waiters: Dict[int, asyncio.Future] = {}
+        self._nonce = 0
+        self._runner: Optional[asyncio.Task] = None
+        self.failovers = 0
+        self.unconfirmed = 0
+
+    async def start(self, replica):
+        self.replica = replica
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        await self._join()
+        self._runner = asyncio.create_task(self._run(), name="agent-bus")
+
+    def _try_lock(self) -> bool:
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _join(self):
+        """Become the hub if no live worker holds the lock, otherwise connect to it"""
+        while True:
+            if self._try_lock():
+                await self._become_hub()
+                return
+            try:
+                reader, writer = await asyncio.open_unix_connection(str(self.path), limit=MAX_FRAME_BYTES)
+            except (FileNotFoundError, ConnectionRefusedError):
+                # Hub elected but not listening yet
+                await asyncio.sleep(0.05)
+                continue
+            try:
+                line = await reader.readline()
+                snapshot = json.loads(line) if line else None
+                seq, state = (snapshot["seq"], snapshot["state"]) if snapshot else (None, None)
+            except (ConnectionError, asyncio.IncompleteReadError, ValueError, KeyError, TypeError) as e:
+                # The hub died (or sent garbage) mid-snapshot: same as a lost hub
+                logger.warning("Agent bus: bad snapshot from hub, re-electing: %s", e)
+                snapshot = None
+            if not snapshot:
+                writer.close()
+                await asyncio.sleep(0.05)
+                continue
+            # Describe our own connections before the hub's snapshot replaces
+            # what this replica knew about them (their places and assignments)
+            event = self.replica.sync_event()
+            self.seq = seq
+            self.replica.restore(state)
+            self._reader, self._writer = reader, writer
+            self.role = "client"
+            self._write(self._tag(event))
+            outbox, self._outbox = self._outbox, []
+            for frame in outbox:
+                self._writer.write(frame)
+            logger.info("Agent bus: joined hub", extra={"worker": self.worker_id, "path": str(self.path)})
+            return
+
+    async def _become_hub(self):
+        if self.path.exists():
+            self.path.unlink()
+        self._server = await asyncio.start_unix_server(self._serve_peer, path=str(self.path), limit=MAX_FRAME_BYTES)
+        self.role = "hub"
+        # Whatever a previous hub knew is stale; peers re-announce themselves on
+        # rejoin. Our own announcement is taken before the reset wipes it.
+        event = self.replica.sync_event()
+        self.replica.restore({})
+        self._sequence(event)
+        outbox, self._outbox = self._outbox, []
+        for frame in outbox:
+            self._sequence(json.loads(frame))
+        logger.info("Agent bus: this worker is the hub", extra={"worker": self.worker_id, "path": str(self.path)})
+
+    async def _run(self):
+        while True:
+            if self.role == "hub":
+                await self._server.serve_forever()
+                return
+            try:
+                line = await self._reader.readline()
+            except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+                line = b""
+            if not line:
+                logger.warning("Agent bus: lost the hub, re-electing")
+                self.failovers += 1
+                self._writer.close()
+                self._reader = self._writer = None
+                self.role = "rejoining"
+                await self._join()
+                continue
+            event = json.loads(line)
+            self.seq = event["seq"]
+            self._apply(event)
+            self._resolve(event)
+
+    def _resolve(self, event: Dict):
+        if event.get("origin") != self.worker_id:
+            return
+        waiter = self._waiters.get(event.get("nonce"))
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    def _sequence(self, event: Dict):
+        """Hub only: assign the next sequence number, apply locally and fan out"""
+        self.seq += 1
+        event["seq"] = self.seq
+        event["ts"] = time.time()
+        self._apply(event)
+        self._resolve(event)
+        frame = (json.dumps(event, separators=(",", ":")) + "\n").encode()
+        for writer in list(self._peers):
+            writer.write(frame)
+            if writer.transport.get_write_buffer_size() > MAX_PEER_BUFFER_BYTES:
+                # It will rejoin and resync from a fresh snapshot
+                logger.warning("Agent bus: dropping worker, too far behind", extra={"worker": self._peers[writer]})
+                writer.close()
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Snapshot and registration happen without yielding, so the peer sees
+        # exactly the events sequenced after its snapshot
+        snapshot = {"seq": self.seq, "state": self.replica.snapshot()}
+        writer.write((json.dumps(snapshot, separators=(",", ":")) + "\n").encode())
+        self._peers[writer] = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                event = json.loads(line)
+                if event.get("op") == "worker_sync":
+                    self._peers[writer] = event["worker"]
+                self._sequence(event)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.warning("Agent bus: peer connection error: %s", e)
+        finally:
+            worker = self._peers.pop(writer, None)
+            writer.close()
+            if worker is not None and self.role == "hub":
+                self._sequence({"op": "worker_left", "worker": worker})
+
+    def _tag(self, event: Dict) -> Dict:
+        self._nonce += 1
+        event["origin"] = self.worker_id
+        event["nonce"] = self._nonce
+        return event
+
+    def _write(self, event: Dict) -> bytes:
+        frame = (json.dumps(event, separators=(",", ":")) + "\n").encode()
+        if self._writer is not None:
+            self._writer.write(frame)
+        else:
+            self._outbox.append(frame)
+        return frame
+
+    async def publish(self, event: Dict):
+        if self.role == "hub":
+            self._sequence(event)
+            return
+        event = self._tag(event)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[event["nonce"]] = waiter
+        frame = self._write(event)
+        try:
+            await asyncio.wait_for(waiter, timeout=self.publish_timeout)
+        except asyncio.TimeoutError:
+            # Not replayed on rejoin: the sender is told now and may retry
+            if frame in self._outbox:
+                self._outbox.remove(frame)
+            self.unconfirmed += 1
+            logger.warning("Agent bus: event not confirmed in time", extra={"op": event["op"], "timeout": self.publish_timeout})
+            raise BusPublishError(f"{event['op']} not confirmed within {self.publish_timeout}s") from None
+        finally:
+            self._waiters.pop(event["nonce"], None)
+
+    async def close(self):
+        if self._runner is not None:
+            self._runner.cancel()
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._peers):
+                writer.close()
+            if self.path.exists():
+                self.path.unlink()
+        if self._writer is not None:
+            self._writer.close()
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self.role = "closed"
+
+    def stats(self) -> Dict:
+        stats = super().stats()
+        stats.update({"role": self.role, "failovers": self.failovers, "unconfirmed": self.unconfirmed})
+        if self.role == "hub":
+            stats["peers"] = len(self._peers)
+        return stats
+
+
+def create_bus(backend: str, path: str) -> MessageBus:
+    """Build the bus named by the AGENT_BUS_BACKEND setting"""
+    if backend == "unix":
+        return UnixSocketBus(path)
+    if backend == "local":
+        return LocalMessageBus()
+    raise ValueError(f"Unknown agent bus backend: {backend}")
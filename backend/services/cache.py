@@ -0,0 +1,290 @@
+"""
+Bounded TTL + LRU caches with pluggable storage backends, plus a
+single-flight coalescer for concurrent identical work.
+
+``MemoryCache`` is per-process; ``SQLiteCache`` stores entries in a local
+SQLite file so every gunicorn worker on the host shares them. Values must be
+JSON-serializable (``MemoryCache`` also accepts bytes and tuples of them).
+Both are thread-safe, since Bedrock calls (and therefore cache lookups) run
+on executor threads.
+"""
+import asyncio
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Fold case, punctuation and whitespace so near-identical questions share a cache key"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text.lower())).strip()
+
+
+def _sizeof(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, tuple):
+        return sum(_sizeof(item) for item in value)
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+class CacheBackend:
+    """Interface shared by all cache backends"""
+    backend = "none"
+
+    def __init__(self, ttl_seconds: float = 0, max_entries: int = 0, max_bytes: int = 0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self) -> int:
+        return 0
+
+    @property
+    def size_bytes(self) -> int:
+        return 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": len(self),
+            "bytes": self.size_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class NullCache(CacheBackend):
+    """Cache that stores nothing (caching disabled)"""
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache bounded by entry count and total value size"""
+    backend = "memory"
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_bytes: int):
+        super().__init__(ttl_seconds, max_entries, max_bytes)
+        # key -> (expires_at, size, value), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, size, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        size = _sizeof(value)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.monotonic() + ttl, size, value)
+            self._bytes += size
+            while self._entries and (
+                (self.max_entries and len(self._entries) > self.max_entries)
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+class SQLiteCache(CacheBackend):
+    """LRU cache in a local SQLite file, shared by every worker process on the host"""
+    backend = "sqlite"
+
+    def __init__(self, path: str, table: str, ttl_seconds: float, max_entries: int, max_bytes: int):
+        super().__init__(ttl_seconds, max_entries, max_bytes)
+        if not re.fullmatch(r"\w+", table):
+            raise ValueError(f"Invalid cache table name: {table!r}")
+        self.path = path
+        self.table = table
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_lru ON {table} (last_access)")
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, expires_at = row
+            if expires_at <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode("utf-8"))
+        if self.max_bytes and size > self.max_bytes:
+            return
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, size, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, encoded, size, now + ttl, now),
+                )
+                self._evict(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict(self, now: float):
+        expired = self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,)).rowcount
+        self.expirations += max(expired, 0)
+        count, total = self._conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        while count and (
+            (self.max_entries and count > self.max_entries)
+            or (self.max_bytes and total > self.max_bytes)
+        ):
+            key, size = self._conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    @property
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+
+def create_cache(backend: str, name: str, ttl_seconds: float, max_entries: int, max_bytes: int, path: str = "") -> CacheBackend:
+    """Build a cache from settings; ``name`` namespaces entries in shared backends"""
+    backend = (backend or "none").lower()
+    if backend == "memory":
+        return MemoryCache(ttl_seconds, max_entries, max_bytes)
+    if backend == "sqlite":
+        return SQLiteCache(path, name, ttl_seconds, max_entries, max_bytes)
+    if backend == "none":
+        return NullCache(ttl_seconds, max_entries, max_bytes)
+    raise ValueError(f"Unknown cache backend: {backend!r}")
+
+
+class SingleFlight:
+    """Coalesces concurrent async calls with the same key into one shared execution.
+
+    The work runs in its own task, so a caller that disconnects does not cancel
+    it for the others still waiting on the result.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Mark the exception retrieved even if every waiter went away
+            task.exception()
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._inflight),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,226 @@
+"""
+Indexed travel package catalog loaded from a JSON, CSV or SQLite file.
+
+The catalog is held in an immutable ``CatalogSnapshot``: compact slotted
+records plus a price-sorted index and destination/suitability/matching
+indexes. Hot reload builds a new snapshot off to the side and swaps the
+reference, so readers never wait on a reload and always see one consistent
+version for the duration of a request.
+"""
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from config import settings
+from services.log import get_logger
+from services.matching import PackageMatcher
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class Package:
+    id: str
+    name: str
+    destination: str
+    price: int
+    dates: str
+    type: str
+    description: str
+    duration: str = ""
+    suitable_for: Tuple[str, ...] = ()
+    inclusions: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "Package":
+        return cls(
+            id=str(data["id"]),
+            name=data["name"],
+            destination=data["destination"],
+            price=int(data["price"]),
+            dates=data.get("dates", ""),
+            type=data.get("type", "tour"),
+            description=data.get("description", ""),
+            duration=data.get("duration", ""),
+            suitable_for=tuple(_as_list(data.get("suitable_for"))),
+            inclusions=tuple(_as_list(data.get("inclusions"))),
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "destination": self.destination,
+            "price": self.price,
+            "dates": self.dates,
+            "type": self.type,
+            "description": self.description,
+            "duration": self.duration,
+            "suitable_for": list(self.suitable_for),
+            "inclusions": list(self.inclusions),
+        }
+
+
+def _as_list(value) -> List[str]:
+    """List fields may arrive as lists, JSON text or '|'-separated strings (CSV/SQLite)"""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [str(v) for v in value]
+    value = str(value).strip()
+    if value.startswith("["):
+        return [str(v) for v in json.loads(value)]
+    return [part.strip() for part in value.split("|") if part.strip()]
+
+
+def _load_json(path: Path) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data["packages"] if isinstance(data, dict) else data
+
+
+def _load_csv(path: Path) -> List[Dict]:
+    with open(path, encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def _load_sqlite(path: Path) -> List[Dict]:
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        conn.row_factory = sqlite3.Row
+        return [dict(row) for row in conn.execute("SELECT * FROM packages ORDER BY rowid")]
+    finally:
+        conn.close()
+
+
+LOADERS = {
+    ".json": _load_json,
+    ".csv": _load_csv,
+    ".db": _load_sqlite,
+    ".sqlite": _load_sqlite,
+    ".sqlite3": _load_sqlite,
+}
+
+
+class CatalogSnapshot:
+    """One immutable, fully indexed version of the catalog"""
+
+    def __init__(self, packages: Sequence[Package], version: int, fingerprint: str):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.packages: Tuple[Package, ...] = tuple(packages)
+        self.by_id: Dict[str, int] = {p.id: i for i, p in enumerate(self.packages)}
+
+        # Positions sorted by price, with the matching sorted prices for bisect
+        self.price_order: Tuple[int, ...] = tuple(sorted(range(len(self.packages)), key=lambda i: self.packages[i].price))
+        self.sorted_prices: Tuple[int, ...] = tuple(self.packages[i].price for i in self.price_order)
+
+        self.by_destination = self._index((i, p.destination.lower()) for i, p in enumerate(self.packages))
+        self.by_suitability = self._index(
+            (i, tag.lower()) for i, p in enumerate(self.packages) for tag in p.suitable_for
+        )
+        self.matcher = PackageMatcher(self.packages, self.price_range)
+
+    @staticmethod
+    def _index(pairs: Iterable[Tuple[int, str]]) -> Dict[str, FrozenSet[int]]:
+        index: Dict[str, set] = {}
+        for i, key in pairs:
+            index.setdefault(key, set()).add(i)
+        return {key: frozenset(ids) for key, ids in index.items()}
+
+    def __len__(self) -> int:
+        return len(self.packages)
+
+    def get(self, package_id: str) -> Optional[Package]:
+        i = self.by_id.get(package_id)
+        return self.packages[i] if i is not None else None
+
+    def price_range(self, min_price: Optional[int] = None, max_price: Optional[int] = None) -> Tuple[int, ...]:
+        """Positions of packages priced within [min_price, max_price], cheapest first"""
+        lo = bisect_left(self.sorted_prices, min_price) if min_price is not None else 0
+        hi = bisect_right(self.sorted_prices, max_price) if max_price is not None else len(self.sorted_prices)
+        return self.price_order[lo:hi]
+
+
+class PackageCatalog:
+    """Holds the current snapshot and swaps in a new one when the data file changes"""
+
+    def __init__(self, path: str, reload_interval: float = 0):
+        path = Path(path)
+        self.path = path if path.is_absolute() else BASE_DIR / path
+        self.reload_interval = reload_interval
+        self._version = 0
+        self._mtime = None
+        self._last_check = time.monotonic()
+        self._reload_lock = threading.Lock()
+        self._reloading = False
+        self._snapshot = self._build()
+
+    def _build(self) -> CatalogSnapshot:
+        loader = LOADERS.get(self.path.suffix.lower())
+        if loader is None:
+            raise ValueError(f"Unsupported catalog format: {self.path.suffix}")
+        mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, "rb") as f:
+            fingerprint = hashlib.sha1(f.read()).hexdigest()[:16]
+        packages = [Package.from_dict(row) for row in loader(self.path)]
+        self._version += 1
+        self._mtime = mtime
+        return CatalogSnapshot(packages, self._version, fingerprint)
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Current snapshot; lazily kicks off a background reload check, never waits on it"""
+        if self.reload_interval and not self._reloading:
+            now = time.monotonic()
+            if now - self._last_check >= self.reload_interval:
+                self._last_check = now
+                self._reloading = True
+                threading.Thread(target=self._background_reload, name="catalog-reload", daemon=True).start()
+        return self._snapshot
+
+    def _background_reload(self):
+        try:
+            self.reload_if_changed()
+        except Exception as e:
+            logger.error("Catalog reload failed, keeping the current version: %s", e, extra={"version": self._snapshot.version})
+        finally:
+            self._reloading = False
+
+    def reload_if_changed(self) -> bool:
+        """Reload if the data file's mtime changed; returns True when a new snapshot was swapped in"""
+        if os.stat(self.path).st_mtime_ns == self._mtime:
+            return False
+        self.reload()
+        return True
+
+    def reload(self) -> CatalogSnapshot:
+        """Build a new snapshot and atomically make it current"""
+        with self._reload_lock:
+            snapshot = self._build()
+            self._snapshot = snapshot
+        logger.info("Package catalog loaded", extra={"version": snapshot.version, "packages": len(snapshot), "file": self.path.name})
+        return snapshot
+
+
+_catalog: Optional[PackageCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> PackageCatalog:
+    """Process-wide catalog, loaded on first use"""
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = PackageCatalog(settings.catalog_path, settings.catalog_reload_interval_seconds)
+    return _catalog
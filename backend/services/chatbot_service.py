@@ -1,315 +1,535 @@
+import asyncio
+import contextvars
+import functools
 import json
 import os
-from typing import List, Dict, Optional
-import boto3
-from botocore.exceptions import ClientError
-
-# Tripscape Travel Packages - Actual Data
-MOCK_PACKAGES = [
-    {
-        "id": "pkg-001",
-        "name": "Exotic Dubai Escape",
-        "destination": "Dubai, UAE",
-        "price": 95999,
-        "dates": "Available year-round",
-        "type": "tour",
-        "description": "5N/6D - Discover glitz and glamour with desert safaris, Burj Khalifa visits, and luxury shopping. Includes flights, 4-star hotel, meals, visa, city tours.",
-        "duration": "5 Nights / 6 Days",
-        "suitable_for": ["Couples", "Families", "Youth"],
-        "inclusions": ["Return flights", "4-star hotel", "Breakfast & dinner", "Visa assistance", "City tours", "Desert safari"],
-    },
-    {
-        "id": "pkg-002",
-        "name": "Bhutan Bliss Tour",
-        "destination": "Bhutan",
-        "price": 25999,
-        "dates": "Fixed departure: Nov 2, 2025",
-        "type": "tour",
-        "description": "6N/7D - Explore serene landscapes with Thimphu, Paro, and Phuntsholing. Ideal for cultural immersion. Includes 3-star hotels, all meals, guided tours.",
-        "duration": "6 Nights / 7 Days",
-        "suitable_for": ["Solo Travelers", "Families"],
-        "inclusions": ["3-star accommodation", "All meals", "Guided sightseeing", "Entry fees", "Transport"],
-    },
-    {
-        "id": "pkg-003",
-        "name": "Ladakh Adventure",
-        "destination": "Ladakh, India",
-        "price": 45000,
-        "dates": "May-September 2025",
-        "type": "tour",
-        "description": "7N/8D - High-altitude thrills in Leh with Pangong Lake, Nubra Valley, and monastery tours. Perfect for thrill-seekers. 4x4 vehicles included.",
-        "duration": "7 Nights / 8 Days",
-        "suitable_for": ["Adventure Seekers", "Youth"],
-        "inclusions": ["Accommodation", "Meals", "Inner line permits", "4x4 vehicles", "Sightseeing"],
-    },
-    {
-        "id": "pkg-004",
-        "name": "Kerala Backwaters",
-        "destination": "Kerala, India",
-        "price": 28500,
-        "dates": "October-March 2026",
-        "type": "tour",
-        "description": "4N/5D - Relax in God's Own Country with houseboat cruises, Ayurvedic spas, and wildlife sanctuaries. Romantic getaway with houseboat stay.",
-        "duration": "4 Nights / 5 Days",
-        "suitable_for": ["Couples", "Families"],
-        "inclusions": ["Houseboat stay", "Hotel accommodation", "Meals", "Houseboat cruise"],
-    },
-    {
-        "id": "pkg-005",
-        "name": "Rajasthan Royals",
-        "destination": "Rajasthan, India",
-        "price": 55000,
-        "dates": "October-March 2026",
-        "type": "tour",
-        "description": "8N/9D - Journey through palaces and forts of Jaipur, Udaipur, and Jodhpur. History and heritage focus with heritage hotel stays.",
-        "duration": "8 Nights / 9 Days",
-        "suitable_for": ["History Buffs", "Families"],
-        "inclusions": ["Heritage hotels", "All meals", "Guided tours", "Train transfers"],
-    },
-    {
-        "id": "pkg-006",
-        "name": "Himachal Hill Retreat",
-        "destination": "Himachal Pradesh, India",
-        "price": 35000,
-        "dates": "Year-round",
-        "type": "tour",
-        "description": "6N/7D - Snow-capped mountains and apple orchards in Manali, Shimla, and Dharamshala. Nature escape with hill resort stays.",
-        "duration": "6 Nights / 7 Days",
-        "suitable_for": ["Nature Lovers", "Couples"],
-        "inclusions": ["Hill resort accommodation", "Meals", "Local transfers"],
-    },
-    {
-        "id": "pkg-007",
-        "name": "Northeast Wonders",
-        "destination": "Northeast India",
-        "price": 60000,
-        "dates": "October-April 2026",
-        "type": "tour",
-        "description": "9N/10D - Vibrant cultures and tea gardens in Assam, Meghalaya, and Arunachal Pradesh. Offbeat exploration with luxury camps and tribal visits.",
-        "duration": "9 Nights / 10 Days",
-        "suitable_for": ["Explorers", "Groups"],
-        "inclusions": ["Luxury camps", "Meals", "Tribal village visits", "Sightseeing"],
-    },
-]
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+
+from config import settings
+from services.cache import SingleFlight, create_cache, normalize_query
+from services.catalog import PackageCatalog, get_catalog
+from services.features import MessageFeatures, analyze_message
+from services.intent_router import IntentRouter, RouteDecision
+from services.log import get_logger
+from services.metrics import registry
+from services.pipeline import Stage, StageGraph
+from services.prompt_builder import PromptBuilder, PromptPlan
+from services.resilience import CircuitBreaker, CircuitOpenError, HedgeStats, hedged_call
+
+# Use Claude 3 Haiku - fast, cost-effective, and supports on-demand invocation
+# Claude 3.5 Sonnet and Claude 4 require inference profiles
+CLAUDE_MODEL_ID = "anthropic.claude-3-haiku-20240307-v1:0"
+
+# Sentinel marking the end of a Bedrock response stream
+_STREAM_END = object()
+
+logger = get_logger(__name__)
+
+STAGE_SECONDS = registry.histogram(
+    "chat_stage_seconds", "Chat pipeline stage latency, from dependencies ready to result", ("stage", "outcome")
+)
+BEDROCK_CALLS = registry.counter("bedrock_calls_total", "Bedrock API calls by outcome", ("operation", "outcome"))
+BEDROCK_SECONDS = registry.histogram("bedrock_call_seconds", "Bedrock API call latency by outcome", ("operation", "outcome"))
+BEDROCK_FIRST_TOKEN = registry.histogram("bedrock_stream_first_token_seconds", "Time from a streaming call to its first text chunk")
+PROMPT_TOKENS = registry.histogram(
+    "chat_prompt_tokens", "Estimated input tokens per Claude call",
+    buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 4000),
+)
+THROTTLING_CODES = frozenset({"ThrottlingException", "ServiceQuotaExceededException", "TooManyRequestsException"})
+
+THANKS_RESPONSE = "You're welcome! 😊 Happy to help anytime. Let me know if you'd like to explore more packages or plan your next trip with Tripscape!"
+
+
+class _NotRaised(Exception):
+    """Stand-in for a botocore exception class; nothing raises it"""
+
+
+class BotoErrors:
+    """botocore's exception classes, bound when the AWS clients are created.
+
+    Until then (stub, Bedrock disabled) they are placeholders that match no
+    exception, so botocore is never imported just to name them.
+    """
+    BotoCoreError = ClientError = ConnectTimeoutError = EndpointConnectionError = ReadTimeoutError = _NotRaised
+
+    @classmethod
+    def load(cls):
+        from botocore import exceptions
+
+        for name in ("BotoCoreError", "ClientError", "ConnectTimeoutError", "EndpointConnectionError", "ReadTimeoutError"):
+            setattr(cls, name, getattr(exceptions, name))
+
+
+def _bedrock_outcome(error: Exception) -> str:
+    """Metric label for a failed Bedrock call"""
+    if isinstance(error, CircuitOpenError):
+        return "short_circuited"
+    if isinstance(error, BotoErrors.ClientError):
+        return "throttled" if error.response.get("Error", {}).get("Code") in THROTTLING_CODES else "error"
+    if isinstance(error, (BotoErrors.ReadTimeoutError, BotoErrors.ConnectTimeoutError)):
+        return "timeout"
+    if isinstance(error, BotoErrors.EndpointConnectionError):
+        return "connection_error"
+    return "error"
+
+
+def bedrock_call_limits(budget: float) -> Dict:
+    """Botocore timeouts and attempts whose worst case fits a pipeline stage's budget.
+
+    Retries are kept only while every attempt still fits at the configured
+    timeouts; a single attempt has its timeouts cut to the budget. So a call
+    never outlives its stage and keeps an executor thread busy for nothing.
+    """
+    connect, read = settings.bedrock_connect_timeout_seconds, settings.bedrock_read_timeout_seconds
+    attempts = max(1, settings.bedrock_max_attempts)
+    while attempts > 1 and attempts * (connect + read) > budget:
+        attempts -= 1
+    if connect + read > budget:
+        connect = min(connect, budget / 4)
+        read = budget - connect
+    return {
+        "connect_timeout": connect,
+        "read_timeout": read,
+        "retries": {"total_max_attempts": attempts, "mode": "standard"},
+    }
+
+
+def _observe_stage(stage: str, seconds: float, outcome: str):
+    STAGE_SECONDS.observe(seconds, stage, outcome)
 
 
 class ChatbotService:
-    def __init__(self):
+    def __init__(self, catalog: Optional[PackageCatalog] = None):
         self.aws_region = os.getenv("AWS_REGION", "us-east-1")
         self.kb_id = os.getenv("BEDROCK_KNOWLEDGE_BASE_ID")
         
-        # Initialize Bedrock clients if credentials are available
+        # Indexed package catalog; matching indexes are rebuilt per catalog version
+        self.catalog = catalog or get_catalog()
+        
+        # boto3 calls block, so they run on a dedicated bounded executor instead of
+        # the event loop. The connection pool is sized to match (plus the hedge
+        # executor's threads) so threads never wait on (or discard) pooled connections.
+        self.max_concurrency = settings.bedrock_max_concurrency
+        self.bedrock_executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency,
+            thread_name_prefix="bedrock",
+        )
+        self.kb_hedge_after = settings.kb_hedge_after_ms / 1000
+        self.kb_hedges = HedgeStats()
+        self.hedge_executor = (
+            ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="kb-hedge")
+            if self.kb_hedge_after else None
+        )
+        
+        # Once a client's error rate trips its breaker, requests go straight to the fallback
+        breaker_options = dict(
+            failure_rate=settings.bedrock_breaker_failure_rate,
+            window=settings.bedrock_breaker_window,
+            min_calls=settings.bedrock_breaker_min_calls,
+            open_seconds=settings.bedrock_breaker_open_seconds,
+        )
+        self.llm_breaker = CircuitBreaker("bedrock-runtime", **breaker_options)
+        self.kb_breaker = CircuitBreaker("bedrock-kb", **breaker_options)
+        self.prewarmed = 0
+        
+        # Cache of KB retrievals keyed on the normalized query
+        self.kb_cache = create_cache(
+            settings.kb_cache_backend,
+            name="kb_retrievals",
+            ttl_seconds=settings.kb_cache_ttl_seconds,
+            max_entries=settings.kb_cache_max_entries,
+            max_bytes=settings.kb_cache_max_bytes,
+            path=settings.cache_sqlite_path,
+        )
+        
+        # Stateless first-turn messages: optional response cache, and coalescing
+        # of concurrent identical requests into one upstream call
+        self.response_cache = create_cache(
+            settings.response_cache_backend,
+            name="chat_responses",
+            ttl_seconds=settings.response_cache_ttl_seconds,
+            max_entries=settings.response_cache_max_entries,
+            max_bytes=settings.response_cache_max_bytes,
+            path=settings.cache_sqlite_path,
+        )
+        self.coalescer = SingleFlight()
+        
+        # Deterministic intents are answered from templates without calling the LLM
+        self.intent_router = IntentRouter(
+            threshold=settings.intent_router_threshold,
+            enabled=settings.intent_router_enabled,
+        )
+        
+        # Static instructions compiled once; per-request context fitted to a token budget
+        self.prompt_builder = PromptBuilder(
+            budget_tokens=settings.prompt_token_budget,
+            kb_max_tokens=settings.prompt_kb_max_tokens,
+            packages_max_tokens=settings.prompt_packages_max_tokens,
+            history_messages=settings.prompt_history_messages,
+            max_tokens_by_intent=settings.llm_intent_max_tokens,
+            default_max_tokens=settings.llm_max_tokens,
+        )
+        
+        # Knowledge Base: Bedrock retrieval, or the local BM25 index (works offline)
+        self.kb_backend = settings.kb_backend.lower()
+        if self.kb_backend == "auto":
+            self.kb_backend = "bedrock" if self.kb_id or settings.bedrock_stub else "local"
+        self.local_kb = None
+        
+        # Clients and the local index are set up by start(), on a background thread,
+        # so app startup and liveness checks never wait on boto3.
+        # Until ready is set, replies come from the fallback templates.
+        self.aws_enabled = False
+        self.bedrock_runtime = None
+        self.bedrock_agent = None
+        self.ready = threading.Event()
+        self.init_seconds: Optional[float] = None
+        self._init_thread: Optional[threading.Thread] = None
+
+    def start(self) -> "ChatbotService":
+        """Initialize clients and the local index in the background (idempotent)"""
+        if self._init_thread is None:
+            self._init_thread = threading.Thread(target=self._initialize, name="chatbot-init", daemon=True)
+            self._init_thread.start()
+        return self
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self.ready.wait(timeout)
+
+    def close(self):
+        """Stop the Bedrock and hedge executors; queued calls are cancelled, running ones finish"""
+        self.bedrock_executor.shutdown(wait=False, cancel_futures=True)
+        if self.hedge_executor is not None:
+            self.hedge_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _initialize(self):
+        started = time.perf_counter()
+        try:
+            if self.kb_backend == "local":
+                from services.retrieval import get_local_kb
+                
+                self.local_kb = get_local_kb()
+                try:
+                    self.local_kb.load()
+                except Exception as e:
+                    # Searches retry opening it
+                    logger.exception("Local KB index failed to open: %s", e)
+            if settings.bedrock_stub:
+                self._init_stub_clients()
+            elif settings.bedrock_enabled:
+                self._init_aws_clients()
+            else:
+                logger.info("Bedrock disabled; replies come from templates")
+        finally:
+            self.init_seconds = time.perf_counter() - started
+            self.ready.set()
+            logger.info("Chat service ready", extra={"ms": round(self.init_seconds * 1000), "aws_enabled": self.aws_enabled})
+
+    def _init_aws_clients(self):
+        """Create the Bedrock clients; boto3 and botocore are only imported here"""
         try:
-            print(f"Initializing AWS Bedrock in region: {self.aws_region}")
+            import boto3
+            from botocore.config import Config
+            
+            BotoErrors.load()
+            
+            logger.info("Initializing AWS Bedrock", extra={"region": self.aws_region})
+            pool_size = settings.bedrock_pool_size or self.max_concurrency * (2 if self.hedge_executor else 1)
+            # Chat can't wait out botocore's defaults (60s timeouts, legacy retries), so
+            # calls fail fast and the circuit breakers see the failures. Each client's
+            # timeouts and retries fit the budget of the stage that calls it.
+            def client_config(budget: float):
+                return Config(max_pool_connections=pool_size, tcp_keepalive=True, **bedrock_call_limits(budget))
+            
+            endpoint_url = settings.bedrock_endpoint_url or None
             self.bedrock_runtime = boto3.client(
                 service_name="bedrock-runtime",
                 region_name=self.aws_region,
+                endpoint_url=endpoint_url,
+                config=client_config(settings.llm_timeout_seconds),
             )
             self.bedrock_agent = boto3.client(
                 service_name="bedrock-agent-runtime",
                 region_name=self.aws_region,
+                endpoint_url=endpoint_url,
+                config=client_config(settings.kb_timeout_seconds),
             )
             self.aws_enabled = True
-            print(f"✅ AWS Bedrock initialized successfully. KB ID: {self.kb_id}")
+            logger.info("AWS Bedrock initialized", extra={"kb_id": self.kb_id})
         except Exception as e:
-            print(f"❌ AWS Bedrock not configured: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("AWS Bedrock not configured: %s", e)
             self.aws_enabled = False
+            return
+        if settings.bedrock_prewarm_connections:
+            self._prewarm_connections(settings.bedrock_prewarm_connections)
+
+    def _init_stub_clients(self):
+        """Use the offline Bedrock stub instead of real AWS clients"""
+        from services.bedrock_stub import StubBedrockAgent, StubBedrockRuntime
+        
+        latency = settings.bedrock_stub_latency_ms / 1000
+        self.bedrock_runtime = StubBedrockRuntime(
+            latency=latency,
+            token_interval=settings.bedrock_stub_token_interval_ms / 1000,
+        )
+        self.bedrock_agent = StubBedrockAgent(latency=latency)
+        self.kb_id = self.kb_id or "stub-kb"
+        self.aws_enabled = True
+        logger.info("Using offline Bedrock stub")
+
+    def _prewarm_connections(self, count: int):
+        """Open pooled connections (DNS, TCP, TLS) before the first chat request needs them"""
+        # Deliberately invalid requests: they are rejected without running a model
+        # or a retrieval, and leave their connection in the pool
+        calls = [functools.partial(
+            self.bedrock_runtime.invoke_model,
+            modelId=CLAUDE_MODEL_ID, contentType="application/json", accept="application/json", body=b"{}",
+        )] * count
+        if self.kb_backend == "bedrock" and self.kb_id:
+            calls += [functools.partial(
+                self.bedrock_agent.retrieve, knowledgeBaseId=self.kb_id, retrievalQuery={"text": ""},
+            )] * count
+        
+        def touch(call) -> bool:
+            try:
+                call()
+            except BotoErrors.ClientError:
+                pass  # the service answered, so the connection is up
+            except Exception:
+                return False
+            return True
+        
+        started = time.perf_counter()
+        # One thread per call so each opens its own connection
+        self.prewarmed = sum(self.bedrock_executor.map(touch, calls))
+        logger.info("Pre-warmed Bedrock connections", extra={
+            "connections": self.prewarmed, "attempted": len(calls), "ms": round((time.perf_counter() - started) * 1000),
+        })
+
+    @staticmethod
+    def _metered(operation: str, func):
+        """Call func, counting and timing it as one Bedrock call"""
+        started = time.perf_counter()
+        try:
+            result = func()
+        except Exception as e:
+            outcome = _bedrock_outcome(e)
+            BEDROCK_CALLS.inc(operation, outcome)
+            BEDROCK_SECONDS.observe(time.perf_counter() - started, operation, outcome)
+            raise
+        BEDROCK_CALLS.inc(operation, "success")
+        BEDROCK_SECONDS.observe(time.perf_counter() - started, operation, "success")
+        return result
+
+    async def _run_blocking(self, func, *args):
+        """Run a blocking Bedrock call on the dedicated executor without stalling the event loop"""
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context so its logs keep the request id
+        return await loop.run_in_executor(self.bedrock_executor, functools.partial(contextvars.copy_context().run, func, *args))
+
+    def _kb_context(self, query: str):
+        """KB context for the pipeline: an open local index answers inline, anything else runs on the executor"""
+        if self.local_kb is not None and self.local_kb.ready:
+            return self.retrieve_from_kb(query)
+        return self._run_blocking(self.retrieve_from_kb, query)
 
     def retrieve_from_kb(self, query: str) -> str:
         """Retrieve context from Knowledge Base"""
-        if not self.aws_enabled or not self.kb_id:
+        if self.local_kb is not None:
+            return self.local_kb.retrieve(query, settings.kb_top_k)
+        if self.kb_backend != "bedrock" or not self.aws_enabled or not self.kb_id:
             return ""
         
+        cache_key = normalize_query(query)
+        cached = self.kb_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        fetch = functools.partial(
+            self.kb_breaker.call, self._metered, "retrieve", functools.partial(self._retrieve_remote, query)
+        )
         try:
-            response = self.bedrock_agent.retrieve(
-                knowledgeBaseId=self.kb_id,
-                retrievalQuery={"text": query},
-                retrievalConfiguration={
-                    "vectorSearchConfiguration": {"numberOfResults": 3}
-                },
-            )
+            if self.hedge_executor is not None:
+                response = hedged_call(self.hedge_executor, fetch, self.kb_hedge_after, self.kb_hedges)
+            else:
+                response = fetch()
             
             if "retrievalResults" in response:
                 contexts = [
                     result.get("content", {}).get("text", "")
                     for result in response["retrievalResults"]
                 ]
-                return "\n\n".join(contexts)
-        except ClientError as e:
-            print(f"KB retrieval error: {e}")
+                kb_context = "\n\n".join(contexts)
+                self.kb_cache.set(cache_key, kb_context)
+                return kb_context
+        except CircuitOpenError:
+            BEDROCK_CALLS.inc("retrieve", "short_circuited")
+        except (BotoErrors.ClientError, BotoErrors.BotoCoreError) as e:
+            logger.warning("KB retrieval error: %s", e, extra={"outcome": _bedrock_outcome(e)})
         
         return ""
 
-    def match_packages(self, message: str) -> List[Dict]:
+    def _retrieve_remote(self, query: str) -> Dict:
+        return self.bedrock_agent.retrieve(
+            knowledgeBaseId=self.kb_id,
+            retrievalQuery={"text": query},
+            retrievalConfiguration={
+                "vectorSearchConfiguration": {"numberOfResults": settings.kb_top_k}
+            },
+        )
+
+    def match_packages(self, features: MessageFeatures) -> List[Dict]:
         """Match packages based on user message - only return if explicitly requested"""
-        lower_message = message.lower()
-        matched = []
-        
-        # Only show packages if user is asking about packages, destinations, or specific travel queries
-        package_intent_keywords = [
-            "package", "packages", "show", "suggest", "recommend", "looking for",
-            "want to", "planning", "trip", "tour", "vacation", "holiday", 
-            "destination", "travel", "visit", "going to", "budget"
-        ]
-        
-        # Check if user is actually asking about packages
-        has_package_intent = any(keyword in lower_message for keyword in package_intent_keywords)
-        
-        # Don't show packages for generic greetings or questions
-        generic_queries = ["hi", "hello", "hey", "what are you", "who are you", "help", "thanks", "thank you"]
-        is_generic = any(lower_message.strip() == query or lower_message.strip() == query + "?" for query in generic_queries)
-        
-        if is_generic:
-            return []  # No packages for generic queries
-        
-        if not has_package_intent:
-            return []  # No packages if not asking about travel
-        
-        # Now match packages based on specific criteria
-        matched = MOCK_PACKAGES.copy()
-        
-        # Filter by specific destinations
-        if any(word in lower_message for word in ["dubai", "uae", "emirates"]):
-            matched = [p for p in matched if "dubai" in p["destination"].lower()]
-        elif any(word in lower_message for word in ["bhutan", "himalayan"]):
-            matched = [p for p in matched if "bhutan" in p["destination"].lower()]
-        elif any(word in lower_message for word in ["ladakh", "leh"]):
-            matched = [p for p in matched if "ladakh" in p["destination"].lower()]
-        elif any(word in lower_message for word in ["kerala", "backwater", "houseboat"]):
-            matched = [p for p in matched if "kerala" in p["destination"].lower()]
-        elif any(word in lower_message for word in ["rajasthan", "jaipur", "udaipur", "jodhpur", "palace", "fort"]):
-            matched = [p for p in matched if "rajasthan" in p["destination"].lower()]
-        elif any(word in lower_message for word in ["himachal", "manali", "shimla", "dharamshala"]):
-            matched = [p for p in matched if "himachal" in p["destination"].lower()]
-        elif any(word in lower_message for word in ["northeast", "assam", "meghalaya", "arunachal"]):
-            matched = [p for p in matched if "northeast" in p["destination"].lower()]
-        
-        # Filter by vibe/type if no destination match
-        if len(matched) == len(MOCK_PACKAGES):
-            if any(word in lower_message for word in ["beach", "water", "backwater", "cruise"]):
-                matched = [p for p in matched if any(kw in p["description"].lower() 
-                          for kw in ["backwater", "cruise", "houseboat"])]
-            elif any(word in lower_message for word in ["city", "urban", "luxury", "shopping"]):
-                matched = [p for p in matched if any(kw in p["description"].lower()
-                          for kw in ["city", "luxury", "shopping", "dubai"])]
-            elif any(word in lower_message for word in ["adventure", "mountain", "trek", "high-altitude"]):
-                matched = [p for p in matched if any(kw in p["description"].lower()
-                          for kw in ["adventure", "mountain", "trek", "high-altitude"])]
-            elif any(word in lower_message for word in ["romantic", "honeymoon", "couple"]):
-                matched = [p for p in matched if "Couples" in str(p.get("suitable_for", []))]
-            elif any(word in lower_message for word in ["cultural", "heritage", "history"]):
-                matched = [p for p in matched if any(kw in p["description"].lower()
-                          for kw in ["cultural", "heritage", "history", "palace", "fort"])]
-            elif any(word in lower_message for word in ["nature", "serene", "peaceful"]):
-                matched = [p for p in matched if any(kw in p["description"].lower()
-                          for kw in ["serene", "nature", "peaceful"])]
-            elif any(word in lower_message for word in ["family", "kids", "children"]):
-                matched = [p for p in matched if "Families" in str(p.get("suitable_for", []))]
-            elif any(word in lower_message for word in ["solo", "alone", "backpack"]):
-                matched = [p for p in matched if "Solo" in str(p.get("suitable_for", []))]
-        
-        # Filter by budget (₹ or INR)
-        import re
-        budget_match = re.search(r'(?:₹|rupees?|inr|under|budget|around|up to)\s*(\d+)', lower_message)
-        if budget_match:
-            budget = int(budget_match.group(1))
-            matched = [p for p in matched if p["price"] <= budget]
-        
-        return matched[:3]  # Return max 3 packages
-
-    def invoke_claude(self, message: str, conversation_history: List[Dict], kb_context: str, packages: List[Dict]) -> str:
+        snapshot = self.catalog.snapshot()
+        return [package.to_dict() for package in snapshot.matcher.match(features)]
+
+    def _build_prompt(self, features: MessageFeatures, conversation_history: List[Dict], kb_context: str, packages: List[Dict], intent: Optional[str]) -> PromptPlan:
+        """Bedrock request body within the prompt token budget, shared by the blocking and streaming Claude calls"""
+        plan = self.prompt_builder.build(features.text, conversation_history, kb_context, packages, intent)
+        PROMPT_TOKENS.observe(plan.prompt_tokens)
+        return plan
+
+    def invoke_claude(self, features: MessageFeatures, conversation_history: List[Dict], kb_context: str, packages: List[Dict], intent: Optional[str] = None) -> str:
         """Invoke Claude model via Bedrock"""
         if not self.aws_enabled:
-            return self._generate_fallback_response(message, packages)
-        
-        # Build package context
-        package_context = ""
-        if packages:
-            package_context = "\n\nAvailable packages:\n" + "\n".join([
-                f"- {p['name']} ({p['destination']}) - ${p['price']} - {p['dates']}: {p['description']}"
-                for p in packages
-            ])
+            return self._generate_fallback_response(features, packages)
         
-        # Build conversation context
-        conv_context = ""
-        if conversation_history:
-            conv_context = "\nConversation so far:\n" + "\n".join([
-                f"{msg['role']}: {msg['content']}" for msg in conversation_history[-4:]  # Last 4 messages
-            ])
-        
-        # System prompt
-        system_prompt = f"""You are Tripscape's AI Trip Guide, a friendly and knowledgeable travel assistant specializing in Indian and international packages. Your role is to:
-
-1. Help users plan their dream trips by understanding their preferences (destination, dates, travelers, budget in ₹, vibe).
-2. Suggest relevant packages from Tripscape's collection (Dubai, Bhutan, Ladakh, Kerala, Rajasthan, Himachal, Northeast India).
-3. All prices are per person (twin-sharing basis) in Indian Rupees (₹).
-4. Parse user messages to extract: destination, dates, number of travelers, budget, and preferences.
-5. Provide warm, personalized recommendations with enthusiasm.
-6. When suggesting packages, briefly highlight why they're a great fit (e.g., "Dubai Escape is perfect for families with city tours and desert safaris").
-7. If the user asks for an agent, offer to connect them to chat@tripscape.com.
-8. Keep responses concise and conversational (2-3 sentences max, unless listing packages).
-9. Packages range from ₹25,999 (Bhutan Bliss) to ₹95,999 (Dubai Escape).
-10. Mention key features like duration, inclusions (hotels, meals, tours), and suitability (couples, families, adventure seekers).
-
-Knowledge Base Context:
-{kb_context or "Tripscape offers 7 curated packages: Dubai Escape, Bhutan Bliss, Ladakh Adventure, Kerala Backwaters, Rajasthan Royals, Himachal Hill Retreat, Northeast Wonders."}
-{package_context}
-{conv_context}
-
-User's latest message: {message}
-
-Respond naturally as the AI Trip Guide. If suggesting packages, mention them by name with prices (e.g., "Exotic Dubai Escape - ₹95,999"). Be enthusiastic and helpful!"""
+        plan = self._build_prompt(features, conversation_history, kb_context, packages, intent)
         
-        try:
-            # Use Claude 3 Haiku - fast, cost-effective, and supports on-demand invocation
-            # Claude 3.5 Sonnet and Claude 4 require inference profiles
-            model_id = "anthropic.claude-3-haiku-20240307-v1:0"
-            
-            request_body = {
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 500,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": system_prompt
-                    }
-                ],
-                "temperature": 0.7,
-            }
-            
+        def invoke() -> Dict:
             response = self.bedrock_runtime.invoke_model(
-                modelId=model_id,
+                modelId=CLAUDE_MODEL_ID,
                 contentType="application/json",
                 accept="application/json",
-                body=json.dumps(request_body)
+                body=json.dumps(plan.body)
             )
-            
-            response_body = json.loads(response["body"].read())
+            return json.loads(response["body"].read())
+        
+        try:
+            response_body = self.llm_breaker.call(self._metered, "invoke_model", invoke)
             
             if "content" in response_body and len(response_body["content"]) > 0:
                 ai_response = response_body["content"][0].get("text", "")
-                print(f"✅ AWS Bedrock response received: {ai_response[:100]}...")
-                return ai_response if ai_response else self._generate_fallback_response(message, packages)
+                logger.debug("Bedrock response received", extra={
+                    "intent": intent, "prompt_tokens": plan.prompt_tokens, "max_tokens": plan.max_tokens, "chars": len(ai_response),
+                })
+                return ai_response if ai_response else self._generate_fallback_response(features, packages)
             
-        except ClientError as e:
-            print(f"❌ Bedrock invocation error: {e}")
-            import traceback
-            traceback.print_exc()
+        except CircuitOpenError:
+            BEDROCK_CALLS.inc("invoke_model", "short_circuited")
+            return self._generate_fallback_response(features, packages)
+        except BotoErrors.ClientError as e:
+            logger.error("Bedrock invocation error: %s", e, extra={"outcome": _bedrock_outcome(e)})
         except Exception as e:
-            print(f"❌ Unexpected error in invoke_claude: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("Unexpected error in invoke_claude: %s", e)
         
-        print("⚠️ Using fallback response (AWS Bedrock not available)")
-        return self._generate_fallback_response(message, packages)
+        logger.warning("Using fallback response (AWS Bedrock not available)")
+        return self._generate_fallback_response(features, packages)
 
-    def _generate_fallback_response(self, message: str, packages: List[Dict]) -> str:
+    def _stream_claude_blocking(self, request_body: Dict, emit, cancelled: threading.Event):
+        """Read Bedrock's response stream on an executor thread, handing each text delta to emit()"""
+        response = self.bedrock_runtime.invoke_model_with_response_stream(
+            modelId=CLAUDE_MODEL_ID,
+            contentType="application/json",
+            accept="application/json",
+            body=json.dumps(request_body)
+        )
+        stream = response["body"]
+        try:
+            for event in stream:
+                if cancelled.is_set():
+                    break
+                chunk = event.get("chunk")
+                if not chunk:
+                    continue
+                data = json.loads(chunk["bytes"])
+                if data.get("type") == "content_block_delta":
+                    text = data.get("delta", {}).get("text", "")
+                    if text:
+                        emit(text)
+        finally:
+            if hasattr(stream, "close"):
+                stream.close()
+
+    async def stream_claude(self, features: MessageFeatures, conversation_history: List[Dict], kb_context: str, packages: List[Dict], intent: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream Claude's reply as text chunks; falls back to the templated reply if nothing arrives"""
+        if not self.aws_enabled:
+            yield self._generate_fallback_response(features, packages)
+            return
+        
+        request_body = self._build_prompt(features, conversation_history, kb_context, packages, intent).body
+        if not self.llm_breaker.allow():
+            BEDROCK_CALLS.inc("invoke_model_with_response_stream", "short_circuited")
+            yield self._generate_fallback_response(features, packages)
+            return
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        cancelled = threading.Event()
+        
+        def emit(item):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        
+        def pump():
+            started = time.perf_counter()
+            first_token = []
+            
+            def emit_text(text):
+                if not first_token:
+                    first_token.append(True)
+                    BEDROCK_FIRST_TOKEN.observe(time.perf_counter() - started)
+                emit(text)
+            
+            outcome = "success"
+            try:
+                self._stream_claude_blocking(request_body, emit_text, cancelled)
+                self.llm_breaker.record_success()
+            except Exception as e:
+                outcome = _bedrock_outcome(e)
+                self.llm_breaker.record_failure()
+                emit(e)
+            finally:
+                BEDROCK_CALLS.inc("invoke_model_with_response_stream", outcome)
+                BEDROCK_SECONDS.observe(time.perf_counter() - started, "invoke_model_with_response_stream", outcome)
+                emit(_STREAM_END)
+        
+        loop.run_in_executor(self.bedrock_executor, contextvars.copy_context().run, pump)
+        received = False
+        try:
+            while True:
+                # The LLM budget applies to the gap between chunks, not the whole reply
+                try:
+                    item = await asyncio.wait_for(queue.get(), timeout=settings.llm_timeout_seconds)
+                except asyncio.TimeoutError:
+                    logger.warning("Bedrock stream stalled", extra={"seconds": settings.llm_timeout_seconds})
+                    break
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    logger.error("Bedrock streaming error: %s", item, extra={"outcome": _bedrock_outcome(item)})
+                    break
+                received = True
+                yield item
+        finally:
+            # Stop the reader thread if the client went away mid-stream
+            cancelled.set()
+        
+        if not received:
+            logger.warning("Using fallback response (AWS Bedrock stream not available)")
+            yield self._generate_fallback_response(features, packages)
+
+    def bedrock_stats(self) -> Dict:
+        return {
+            "circuit_breakers": {"llm": self.llm_breaker.stats(), "kb": self.kb_breaker.stats()},
+            "kb_hedging": {"after_ms": settings.kb_hedge_after_ms, **self.kb_hedges.stats()},
+            "prewarmed_connections": self.prewarmed,
+        }
+
+    def _generate_fallback_response(self, features: MessageFeatures, packages: List[Dict]) -> str:
         """Generate a fallback response when AWS is not available"""
-        lower_message = message.lower()
-        
-        if any(word in lower_message for word in ["agent", "help", "talk to someone", "human"]):
+        if features.has_topic("agent"):
             return "I'd be happy to connect you with one of our travel experts at chat@tripscape.com! They can provide personalized assistance. Would you like me to transfer you?"
         
         if packages:
@@ -317,75 +537,174 @@ Respond naturally as the AI Trip Guide. If suggesting packages, mention them by
             prices = " starting from ₹" + "{:,}".format(min(p["price"] for p in packages))
             return f"Perfect! I found {len(packages)} amazing package{'s' if len(packages) > 1 else ''} for you, including {pkg_names}{prices}. Check out the details below—each package is curated for an unforgettable experience! ✨"
         
-        if any(word in lower_message for word in ["dubai", "uae"]):
+        if features.has_topic("dubai"):
             return "Dubai is spectacular! ✨ Our Exotic Dubai Escape (₹95,999) includes desert safaris, Burj Khalifa, and luxury shopping. Perfect for families and couples. When are you planning to visit?"
         
-        if any(word in lower_message for word in ["beach", "water", "backwater"]):
+        if features.has_topic("water"):
             return "Love the water! �️ Kerala Backwaters package (₹28,500) offers houseboat cruises, Ayurvedic spas, and serene landscapes. Perfect for a romantic getaway. Interested?"
         
-        if any(word in lower_message for word in ["mountain", "adventure", "trek"]):
+        if features.has_topic("adventure"):
             return "Adventure awaits! 🏔️ We have Ladakh Adventure (₹45,000) for high-altitude thrills or Himachal Hill Retreat (₹35,000) for snow-capped beauty. Which sounds exciting to you?"
         
-        if any(word in lower_message for word in ["romantic", "honeymoon", "couple"]):
+        if features.has_topic("romantic"):
             return "How romantic! 💕 Kerala Backwaters (₹28,500) is perfect with houseboat stays, or try Himachal Hill Retreat (₹35,000) for mountain romance. What's your budget and preferred dates?"
         
-        if any(word in lower_message for word in ["cultural", "heritage", "history"]):
+        if features.has_topic("cultural"):
             return "History lover! 🏰 Rajasthan Royals (₹55,000) takes you through Jaipur's palaces, Udaipur's forts, and Jodhpur's heritage. Or explore Bhutan's serene culture (₹25,999). Which interests you?"
         
-        if any(word in lower_message for word in ["family", "kids"]):
+        if features.has_topic("family"):
             return "Family trip! 👨‍👩‍👧‍👦 Dubai Escape (₹95,999), Kerala Backwaters (₹28,500), or Rajasthan Royals (₹55,000) are all family-friendly. What's your budget and how many travelers?"
         
         return "Welcome to Tripscape! 🌍 I can help you find the perfect Indian or international holiday package. Tell me: What's your destination preference, budget (in ₹), travel dates, and group size? We have packages from ₹25,999 to ₹95,999!"
 
-    def extract_form_data(self, message: str) -> Optional[Dict[str, any]]:
+    def _template_response(self, decision: RouteDecision, features: MessageFeatures, packages: List[Dict]) -> str:
+        """Templated reply for an intent the router answered without the LLM"""
+        if decision.intent == "thanks":
+            return THANKS_RESPONSE
+        return self._generate_fallback_response(features, packages)
+
+    def extract_form_data(self, features: MessageFeatures) -> Optional[Dict[str, any]]:
         """Extract form data from user message"""
-        import re
-        lower_message = message.lower()
-        
-        form_data = {}
-        
-        # Extract destination
-        dest_match = re.search(r'(?:to|visit|go to|travel to|see)\s+([a-z\s]+?)(?:\s+in|\s+for|$)', lower_message)
-        if dest_match:
-            form_data["dest"] = dest_match.group(1).strip()
-        
-        # Extract dates
-        date_match = re.search(r'(?:in|on|during)\s+(january|february|march|april|may|june|july|august|september|october|november|december|[\d\/\-]+)', lower_message)
-        if date_match:
-            form_data["date"] = date_match.group(1)
-        
-        # Extract travelers
-        travelers_match = re.search(r'(\d+)\s*(?:people|person|travelers|guests)', lower_message)
-        if travelers_match:
-            form_data["travelers"] = int(travelers_match.group(1))
-        else:
-            form_data["travelers"] = 1
-        
-        return form_data if form_data else None
+        return features.form_data() or None
+
+    def _context_stages(self, features: MessageFeatures, conversation_history: List[Dict]) -> List[Stage]:
+        """Stages that prepare everything the LLM call needs"""
+        # Package matching, routing and form extraction run on the loop in
+        # microseconds; the KB lookup starts at once and falls back to no context
+        # when over budget. Templated intents don't wait for it.
+        return [
+            Stage("packages", lambda: self.match_packages(features)),
+            Stage(
+                "route",
+                lambda packages: self.intent_router.route(features, packages, bool(conversation_history)),
+                depends_on=["packages"],
+            ),
+            # Needs only the message, so it runs alongside matching and routing
+            Stage(
+                "kb_context",
+                lambda: self._kb_context(features.text),
+                timeout=settings.kb_timeout_seconds,
+                fallback=lambda: "",
+            ),
+            Stage("form_data", lambda: self.extract_form_data(features)),
+        ]
 
     async def process_message(self, message: str, conversation_history: List[Dict]) -> Dict:
         """Main method to process chat message"""
-        # Step 1: Retrieve from Knowledge Base
-        kb_context = self.retrieve_from_kb(message)
-        
-        # Step 2: Match packages
-        matched_packages = self.match_packages(message)
-        
-        # Step 3: Invoke Claude
-        response_message = self.invoke_claude(message, conversation_history, kb_context, matched_packages)
-        
-        # Step 4: Extract form data
-        form_data = self.extract_form_data(message)
-        
-        # Step 5: Build response
+        if conversation_history:
+            stages = await self._run_pipeline(analyze_message(message), conversation_history)
+            return self._build_result(stages)
+        
+        # First-turn messages don't depend on any state, so identical ones can
+        # share a cached response or a single in-flight pipeline run
+        cache_key = normalize_query(message)
+        cached = await self._response_cache_call(self.response_cache.get, cache_key)
+        if cached is not None:
+            return dict(cached)
+        
+        result = await self.coalescer.do(cache_key, lambda: self._process_and_cache(cache_key, message))
+        return dict(result)
+
+    async def _process_and_cache(self, cache_key: str, message: str) -> Dict:
+        features = analyze_message(message)
+        stages = await self._run_pipeline(features, [])
+        result = self._build_result(stages)
+        # Templated answers are final; a fallback standing in for the LLM is not
+        degraded = (
+            not stages["route"].templated
+            and result["message"] == self._generate_fallback_response(features, stages["packages"])
+        )
+        ttl = (
+            settings.response_cache_fallback_ttl_seconds
+            if degraded
+            else settings.response_cache_ttl_seconds
+        )
+        await self._response_cache_call(self.response_cache.set, cache_key, result, ttl)
+        return result
+    
+    async def _response_cache_call(self, func, *args):
+        """A response cache lookup or store; SQLite I/O (and its commits) runs off the event loop"""
+        if self.response_cache.backend == "sqlite":
+            return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+        return func(*args)
+
+    def _respond(self, features: MessageFeatures, conversation_history: List[Dict], route: RouteDecision, packages: List[Dict], kb_task: asyncio.Task):
+        """Templated reply for high-confidence deterministic intents, otherwise the LLM"""
+        if route.templated:
+            # Nothing needs the KB lookup started alongside routing
+            kb_task.cancel()
+            return self._template_response(route, features, packages)
+        return self._llm_reply(features, conversation_history, route, packages, kb_task)
+
+    async def _llm_reply(self, features: MessageFeatures, conversation_history: List[Dict], route: RouteDecision, packages: List[Dict], kb_task: asyncio.Task) -> str:
+        kb_context = await kb_task
+        return await self._run_blocking(self.invoke_claude, features, conversation_history, kb_context, packages, route.intent)
+
+    async def _run_pipeline(self, features: MessageFeatures, conversation_history: List[Dict]) -> Dict:
+        """Run the full chat pipeline for one analyzed message and return every stage's result"""
+        # The response waits on the KB lookup only when it calls the LLM; it gets
+        # its own budget with the templated response as fallback.
+        graph = StageGraph(self._context_stages(features, conversation_history) + [
+            Stage(
+                "response",
+                lambda route, packages: self._respond(
+                    features, conversation_history, route, packages, tasks["kb_context"]
+                ),
+                depends_on=["route", "packages"],
+                timeout=settings.llm_timeout_seconds,
+                fallback=lambda route, packages: self._generate_fallback_response(features, packages),
+            ),
+        ], observe=_observe_stage)
+        tasks = graph.start()
+        return await graph.gather(tasks)
+
+    def _build_result(self, stages: Dict) -> Dict:
+        """Build the API response from the pipeline's stage results"""
         result = {
-            "message": response_message,
+            "message": stages["response"],
         }
         
-        if matched_packages:
-            result["packages"] = matched_packages
+        if stages["packages"]:
+            result["packages"] = stages["packages"]
         
-        if form_data:
-            result["formData"] = form_data
+        if stages["form_data"]:
+            result["formData"] = stages["form_data"]
         
         return result
+
+    async def stream_message(self, message: str, conversation_history: List[Dict]) -> AsyncIterator[Tuple[str, Dict]]:
+        """Process a chat message as a stream of (event, data) pairs.
+
+        Matched packages and form data are sent as soon as they are known, before
+        the KB lookup finishes; the reply then follows as "token" events and a
+        final "done" event carrying the full message.
+        """
+        features = analyze_message(message)
+        tasks = StageGraph(self._context_stages(features, conversation_history), observe=_observe_stage).start()
+        try:
+            packages = await tasks["packages"]
+            if packages:
+                yield "packages", {"packages": packages}
+            
+            form_data = await tasks["form_data"]
+            if form_data:
+                yield "formData", {"formData": form_data}
+            
+            route = await tasks["route"]
+            kb_context = "" if route.templated else await tasks["kb_context"]
+        finally:
+            for task in tasks.values():
+                task.cancel()
+        
+        if route.templated:
+            text = self._template_response(route, features, packages)
+            yield "token", {"text": text}
+            yield "done", {"message": text}
+            return
+        
+        chunks = []
+        async for text in self.stream_claude(features, conversation_history, kb_context, packages, route.intent):
+            chunks.append(text)
+            yield "token", {"text": text}
+        
+        yield "done", {"message": "".join(chunks)}
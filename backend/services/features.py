@@ -0,0 +1,111 @@
+"""
+Per-message feature extraction.
+
+Each chat message is analyzed once: lowercased, tokenized and scanned with a
+single keyword automaton covering the package-matching rules and the
+fallback-reply topics, with budget, dates, traveler count and destination
+pulled out by precompiled patterns. Package matching, form extraction and
+the fallback replies all consume the resulting ``MessageFeatures``.
+"""
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+
+from services.matching import (
+    BUDGET_PATTERN,
+    DESTINATION_RULES,
+    GENERIC_MESSAGES,
+    PACKAGE_INTENT_KEYWORDS,
+    VIBE_RULES,
+    KeywordAutomaton,
+)
+
+# Topics the templated (non-LLM) replies react to, checked in this order
+REPLY_TOPICS = (
+    ("agent", ("agent", "help", "talk to someone", "human")),
+    ("dubai", ("dubai", "uae")),
+    ("water", ("beach", "water", "backwater")),
+    ("adventure", ("mountain", "adventure", "trek")),
+    ("romantic", ("romantic", "honeymoon", "couple")),
+    ("cultural", ("cultural", "heritage", "history")),
+    ("family", ("family", "kids")),
+)
+
+TOKEN_PATTERN = re.compile(r"[\w₹'-]+")
+DESTINATION_PATTERN = re.compile(r'(?:to|visit|go to|travel to|see)\s+([a-z\s]+?)(?:\s+in|\s+for|$)')
+DATE_PATTERN = re.compile(r'(?:in|on|during)\s+(january|february|march|april|may|june|july|august|september|october|november|december|[\d\/\-]+)')
+TRAVELERS_PATTERN = re.compile(r'(\d+)\s*(?:people|person|travelers|guests)')
+
+
+def _labelled_keywords():
+    keywords = [(kw, ("intent", 0)) for kw in PACKAGE_INTENT_KEYWORDS]
+    for i, rule in enumerate(DESTINATION_RULES):
+        keywords += [(kw, ("dest", i)) for kw in rule.keywords]
+    for i, rule in enumerate(VIBE_RULES):
+        keywords += [(kw, ("vibe", i)) for kw in rule.keywords]
+    for topic, words in REPLY_TOPICS:
+        keywords += [(kw, ("topic", topic)) for kw in words]
+    return keywords
+
+
+# Compiled once at import
+KEYWORDS = KeywordAutomaton(_labelled_keywords())
+
+
+def _first_rule(hits: Set[Tuple[str, object]], kind: str) -> Optional[int]:
+    """Lowest-numbered (first-listed) rule of ``kind`` that fired"""
+    return min((i for hit_kind, i in hits if hit_kind == kind), default=None)
+
+
+@dataclass(slots=True)
+class MessageFeatures:
+    """Everything downstream stages need to know about one user message"""
+    text: str
+    lower: str
+    tokens: Tuple[str, ...]
+    hits: Set[Tuple[str, object]]
+    is_generic: bool
+    has_package_intent: bool
+    destination_rule: Optional[int]
+    vibe_rule: Optional[int]
+    budget: Optional[int]
+    destination: Optional[str]
+    date: Optional[str]
+    travelers: Optional[int]
+
+    def has_topic(self, topic: str) -> bool:
+        return ("topic", topic) in self.hits
+
+    def form_data(self) -> Dict:
+        """Form fields detected in the message (travelers defaults to 1)"""
+        form_data = {}
+        if self.destination is not None:
+            form_data["dest"] = self.destination
+        if self.date is not None:
+            form_data["date"] = self.date
+        form_data["travelers"] = self.travelers if self.travelers is not None else 1
+        return form_data
+
+
+def analyze_message(message: str) -> MessageFeatures:
+    """Lowercase, tokenize and scan a message once"""
+    lower = message.lower()
+    hits = KEYWORDS.scan(lower)
+    budget_match = BUDGET_PATTERN.search(lower)
+    dest_match = DESTINATION_PATTERN.search(lower)
+    date_match = DATE_PATTERN.search(lower)
+    travelers_match = TRAVELERS_PATTERN.search(lower)
+    return MessageFeatures(
+        text=message,
+        lower=lower,
+        tokens=tuple(TOKEN_PATTERN.findall(lower)),
+        hits=hits,
+        is_generic=lower.strip() in GENERIC_MESSAGES,
+        has_package_intent=("intent", 0) in hits,
+        destination_rule=_first_rule(hits, "dest"),
+        vibe_rule=_first_rule(hits, "vibe"),
+        budget=int(budget_match.group(1)) if budget_match else None,
+        destination=dest_match.group(1).strip() if dest_match else None,
+        date=date_match.group(1) if date_match else None,
+        travelers=int(travelers_match.group(1)) if travelers_match else None,
+    )
@@ -0,0 +1,104 @@
+"""
+Confidence-scored intent routing in front of the LLM.
+
+Deterministic intents (greetings, thanks, agent handoff, plain "show me X
+packages" requests) are answered from templates; everything else goes to the
+model. Every decision is counted by intent and confidence bucket so the
+threshold can be tuned against the latency and cost saved.
+"""
+import threading
+from dataclasses import dataclass
+from typing import Dict, List
+
+GREETING_WORDS = frozenset({"hi", "hello", "hey", "hiya", "namaste", "greetings"})
+GREETING_FILLER = frozenset({"there", "good", "morning", "afternoon", "evening", "team", "tripscape"})
+THANKS_WORDS = frozenset({"thanks", "thank", "thx", "ty"})
+THANKS_FILLER = frozenset({"you", "so", "much", "a", "lot", "ok", "okay", "great", "cool", "very"})
+ABOUT_MESSAGES = frozenset({"what are you", "who are you", "help", "what can you do"})
+HANDOFF_PHRASES = ("agent", "human", "talk to someone", "real person", "representative")
+QUESTION_WORDS = frozenset({
+    "why", "how", "which", "what", "when", "where", "should", "can", "could", "would",
+    "compare", "difference", "better", "best", "vs", "versus", "explain", "tell",
+})
+LISTING_WORDS = frozenset({"show", "list", "see", "packages", "package", "trips", "tours", "options"})
+
+
+@dataclass(slots=True)
+class RouteDecision:
+    intent: str
+    confidence: float
+    templated: bool
+
+
+class IntentRouter:
+    """Scores a message's intent and decides whether the LLM is needed"""
+
+    def __init__(self, threshold: float = 0.8, enabled: bool = True):
+        self.threshold = threshold
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._by_intent: Dict[str, Dict[str, int]] = {}
+        self._by_confidence: Dict[str, Dict[str, int]] = {}
+
+    def classify(self, features, packages: List[Dict], has_history: bool) -> RouteDecision:
+        """Best-guess intent and confidence, before applying the threshold"""
+        tokens = features.tokens
+        words = set(tokens)
+        stripped = features.lower.strip().rstrip("?!. ")
+
+        if words and words & GREETING_WORDS and words <= GREETING_WORDS | GREETING_FILLER:
+            return RouteDecision("greeting", 0.97, False)
+        if words and words & THANKS_WORDS and words <= THANKS_WORDS | THANKS_FILLER:
+            return RouteDecision("thanks", 0.97, False)
+        if stripped in ABOUT_MESSAGES:
+            return RouteDecision("about", 0.9, False)
+
+        if features.has_topic("agent"):
+            if any(phrase in features.lower for phrase in HANDOFF_PHRASES):
+                return RouteDecision("agent_handoff", 0.92 if len(tokens) <= 10 else 0.7, False)
+            # "help" inside a longer question is usually not a handoff request
+            return RouteDecision("agent_handoff", 0.5, False)
+
+        if packages and features.has_package_intent:
+            confidence = 0.9
+            if "?" in features.lower or words & QUESTION_WORDS:
+                confidence -= 0.45
+            if len(tokens) > 10:
+                confidence -= 0.2
+            if not words & LISTING_WORDS:
+                confidence -= 0.15
+            if has_history:
+                # Follow-ups ("show me cheaper ones there") lean on context
+                confidence -= 0.2
+            return RouteDecision("package_listing", round(max(confidence, 0.0), 2), False)
+
+        return RouteDecision("open_question", 0.0, False)
+
+    def route(self, features, packages: List[Dict], has_history: bool) -> RouteDecision:
+        """Classify, apply the threshold and count the decision"""
+        decision = self.classify(features, packages, has_history)
+        decision.templated = self.enabled and decision.confidence >= self.threshold
+        self._count(decision)
+        return decision
+
+    def _count(self, decision: RouteDecision):
+        route = "template" if decision.templated else "model"
+        bucket = f"{min(int(decision.confidence * 10), 9) / 10:.1f}"
+        with self._lock:
+            intent_counts = self._by_intent.setdefault(decision.intent, {"template": 0, "model": 0})
+            intent_counts[route] += 1
+            bucket_counts = self._by_confidence.setdefault(bucket, {"template": 0, "model": 0})
+            bucket_counts[route] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            by_intent = {intent: dict(counts) for intent, counts in self._by_intent.items()}
+            by_confidence = {bucket: dict(counts) for bucket, counts in sorted(self._by_confidence.items())}
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "template": sum(c["template"] for c in by_intent.values()),
+            "model": sum(c["model"] for c in by_intent.values()),
+            "by_intent": by_intent,
+            "by_confidence": by_confidence,
+        }
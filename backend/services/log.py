@@ -0,0 +1,169 @@
+"""
+Non-blocking structured logging.
+
+Code logs through ``get_logger(__name__)``. A record is only put on a bounded
+queue (never waiting), and a background thread formats and writes it to
+stdout, so a slow log collector can't stall the event loop. If the queue is
+full the record is dropped and counted (``log_records_dropped_total``).
+
+Each record is one JSON line: ``ts``, ``level``, ``logger``, ``msg``, the
+``request_id`` of the HTTP request or WebSocket being handled (set by
+middleware.request_id) and any ``extra`` fields. ``LOG_FORMAT=text`` writes
+the same as readable lines for local development.
+
+Warnings and errors are rate-limited per call site: at most ``burst`` records
+per ``interval`` seconds get through, and the next one that does carries
+``suppressed`` (the count skipped since). Tracebacks are formatted on the
+writer thread and only for records that get through, so a Bedrock outage
+logs a few tracebacks, not one per request.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueListener
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from services.metrics import registry
+
+# Id of the request or WebSocket being handled, copied onto every record logged under it
+request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="")
+
+DROPPED = registry.counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+SUPPRESSED = registry.counter("log_records_suppressed_total", "Warnings and errors suppressed by rate limiting", ("level",))
+
+# Attributes every LogRecord has; any others came from ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "suppressed"}
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most ``burst`` WARNING-or-worse records per call site per ``interval`` seconds"""
+
+    def __init__(self, burst: int, interval: float):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # (file, line) -> [window start, records let through, records suppressed since the last one]
+        self._sites: Dict[Tuple[str, int], List] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING or self.burst <= 0:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._sites.get(site)
+            if window is None:
+                window = self._sites[site] = [now, 0, 0]
+            elif now - window[0] >= self.interval:
+                window[0], window[1] = now, 0
+            if window[1] >= self.burst:
+                window[2] += 1
+                SUPPRESSED.inc(record.levelname)
+                return False
+            window[1] += 1
+            if window[2]:
+                record.suppressed, window[2] = window[2], 0
+        return True
+
+
+class QueueHandler(logging.Handler):
+    """Hands records to the writer thread without ever blocking; drops them when the queue is full"""
+
+    def __init__(self, records: queue.Queue):
+        super().__init__()
+        self.records = records
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            # Resolve what depends on the caller before the record changes threads;
+            # tracebacks stay as exc_info and are formatted by the writer
+            record.msg = record.getMessage()
+            record.args = None
+            record.request_id = request_id.get()
+            self.records.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+        except Exception:
+            self.handleError(record)
+
+
+def _fields(record: logging.LogRecord) -> Dict:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS and not key.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", ""):
+            entry["request_id"] = record.request_id
+        entry.update(_fields(record))
+        if getattr(record, "suppressed", 0):
+            entry["suppressed"] = record.suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        fields = _fields(record)
+        if getattr(record, "request_id", ""):
+            fields["request_id"] = record.request_id
+        if getattr(record, "suppressed", 0):
+            fields["suppressed"] = record.suppressed
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+
+_listener: Optional[QueueListener] = None
+_lock = threading.Lock()
+
+
+def _stop():
+    try:
+        _listener.stop()
+    except queue.Full:
+        pass  # the writer is stuck; what it still holds is lost
+
+
+def configure():
+    """Attach the queue handler and start the writer thread (idempotent)"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        records: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+        handler = QueueHandler(records)
+        handler.addFilter(RateLimitFilter(settings.log_error_burst, settings.log_error_interval_seconds))
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(TextFormatter() if settings.log_format.lower() == "text" else JsonFormatter())
+
+        root = logging.getLogger("tripscape")
+        root.setLevel(settings.log_level.upper())
+        root.addHandler(handler)
+        root.propagate = False
+        _listener = QueueListener(records, output)
+        _listener.start()
+        atexit.register(_stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure()
+    return logging.getLogger(f"tripscape.{name}")
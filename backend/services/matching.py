@@ -0,0 +1,170 @@
+"""
+Precompiled package matching engine.
+
+The keyword rules here are compiled once into a single multi-pattern matcher
+(see ``services.features``), and packages are indexed by destination, vibe
+and suitability rule when the matcher is built, so matching a message is
+set intersections over its precomputed features instead of repeated
+substring scans over every package.
+"""
+import heapq
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+# Words that mean the user is asking about packages/travel at all
+PACKAGE_INTENT_KEYWORDS = (
+    "package", "packages", "show", "suggest", "recommend", "looking for",
+    "want to", "planning", "trip", "tour", "vacation", "holiday",
+    "destination", "travel", "visit", "going to", "budget",
+)
+
+# Whole-message greetings/questions that never get packages
+GENERIC_QUERIES = ("hi", "hello", "hey", "what are you", "who are you", "help", "thanks", "thank you")
+GENERIC_MESSAGES = frozenset(GENERIC_QUERIES) | frozenset(q + "?" for q in GENERIC_QUERIES)
+
+BUDGET_PATTERN = re.compile(r"(?:₹|rupees?|inr|under|budget|around|up to)\s*(\d+)")
+
+
+@dataclass(frozen=True)
+class DestinationRule:
+    """Message keywords that select packages whose destination contains ``destination``"""
+    keywords: Tuple[str, ...]
+    destination: str
+
+
+@dataclass(frozen=True)
+class VibeRule:
+    """Message keywords that select packages by description keyword or suitability tag"""
+    keywords: Tuple[str, ...]
+    description_keywords: Tuple[str, ...] = ()
+    suitable_for: Optional[str] = None
+
+    def applies_to(self, package) -> bool:
+        if self.suitable_for is not None:
+            return any(self.suitable_for in tag for tag in package.suitable_for)
+        description = package.description.lower()
+        return any(kw in description for kw in self.description_keywords)
+
+
+# Checked in order; the first rule whose keywords appear wins
+DESTINATION_RULES = (
+    DestinationRule(("dubai", "uae", "emirates"), "dubai"),
+    DestinationRule(("bhutan", "himalayan"), "bhutan"),
+    DestinationRule(("ladakh", "leh"), "ladakh"),
+    DestinationRule(("kerala", "backwater", "houseboat"), "kerala"),
+    DestinationRule(("rajasthan", "jaipur", "udaipur", "jodhpur", "palace", "fort"), "rajasthan"),
+    DestinationRule(("himachal", "manali", "shimla", "dharamshala"), "himachal"),
+    DestinationRule(("northeast", "assam", "meghalaya", "arunachal"), "northeast"),
+)
+
+# Only consulted when no destination narrowed the results; first match wins
+VIBE_RULES = (
+    VibeRule(("beach", "water", "backwater", "cruise"), ("backwater", "cruise", "houseboat")),
+    VibeRule(("city", "urban", "luxury", "shopping"), ("city", "luxury", "shopping", "dubai")),
+    VibeRule(("adventure", "mountain", "trek", "high-altitude"), ("adventure", "mountain", "trek", "high-altitude")),
+    VibeRule(("romantic", "honeymoon", "couple"), suitable_for="Couples"),
+    VibeRule(("cultural", "heritage", "history"), ("cultural", "heritage", "history", "palace", "fort")),
+    VibeRule(("nature", "serene", "peaceful"), ("serene", "nature", "peaceful")),
+    VibeRule(("family", "kids", "children"), suitable_for="Families"),
+    VibeRule(("solo", "alone", "backpack"), suitable_for="Solo"),
+)
+
+
+class KeywordAutomaton:
+    """Finds every labelled keyword occurring anywhere in a text in a single pass.
+
+    The keywords compile into one regex shaped as a character trie inside a
+    lookahead, so the C regex engine walks the trie from each position and
+    reports the longest keyword starting there. Every keyword that is a prefix
+    of that match also occurs there, so each keyword carries the labels of all
+    its prefixes too, and together the hits cover every overlapping occurrence.
+    """
+
+    def __init__(self, keywords: Iterable[Tuple[str, Hashable]]):
+        labels: Dict[str, Set[Hashable]] = {}
+        for keyword, label in keywords:
+            labels.setdefault(keyword, set()).add(label)
+        self._labels: Dict[str, FrozenSet[Hashable]] = {
+            keyword: frozenset().union(*(labels[k] for k in labels if keyword.startswith(k)))
+            for keyword in labels
+        }
+        self._pattern = re.compile(f"(?=({self._trie_pattern(labels)}))")
+
+    @staticmethod
+    def _trie_pattern(words: Iterable[str]) -> str:
+        trie: Dict = {}
+        for word in words:
+            node = trie
+            for ch in word:
+                node = node.setdefault(ch, {})
+            node[""] = {}
+
+        def build(node: Dict) -> str:
+            branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+            if not branches:
+                return ""
+            if len(branches) == 1 and "" not in node:
+                return branches[0]
+            # Greedy optional group: prefer the longer keyword when a shorter one ends here
+            return f"(?:{'|'.join(branches)})" + ("?" if "" in node else "")
+
+        return build(trie)
+
+    def scan(self, text: str) -> Set[Hashable]:
+        """Return the labels of all keywords found in ``text``"""
+        found: Set[Hashable] = set()
+        for keyword in set(self._pattern.findall(text)):
+            found |= self._labels[keyword]
+        return found
+
+
+class PackageMatcher:
+    """Inverted indexes from destination/vibe rules to package positions.
+
+    ``packages`` are catalog records; ``price_range(min, max)`` returns the
+    positions priced within a range from the catalog's price-sorted index.
+    """
+
+    def __init__(self, packages: Sequence, price_range: Callable[[Optional[int], Optional[int]], Sequence[int]]):
+        self.packages = packages
+        self.price_range = price_range
+        self.all_ids: FrozenSet[int] = frozenset(range(len(self.packages)))
+        self.by_destination: List[FrozenSet[int]] = [
+            frozenset(i for i, p in enumerate(self.packages) if rule.destination in p.destination.lower())
+            for rule in DESTINATION_RULES
+        ]
+        self.by_vibe: List[FrozenSet[int]] = [
+            frozenset(i for i, p in enumerate(self.packages) if rule.applies_to(p))
+            for rule in VIBE_RULES
+        ]
+
+    def match(self, features, limit: int = 3) -> List:
+        """Match packages for an analyzed message - only return if explicitly requested"""
+        # Don't show packages for generic greetings or questions
+        if features.is_generic:
+            return []
+
+        if not features.has_package_intent:
+            return []  # No packages if not asking about travel
+
+        candidates = self.all_ids
+        narrowed = False
+        if features.destination_rule is not None:
+            candidates = self.by_destination[features.destination_rule]
+            narrowed = len(candidates) != len(self.all_ids)
+
+        # Filter by vibe/type if no destination narrowed the results
+        if not narrowed and features.vibe_rule is not None:
+            candidates = self.by_vibe[features.vibe_rule]
+            narrowed = True
+
+        # Filter by budget (₹ or INR): a slice of the price index when nothing
+        # else narrowed the results, otherwise a check on the few candidates left
+        if features.budget is not None:
+            if narrowed:
+                candidates = [i for i in candidates if self.packages[i].price <= features.budget]
+            else:
+                candidates = self.price_range(None, features.budget)
+
+        return [self.packages[i] for i in heapq.nsmallest(limit, candidates)]
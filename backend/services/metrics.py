@@ -0,0 +1,333 @@
+"""
+In-process metrics with Prometheus text exposition, merged across workers.
+
+Three instrument types, all cheap enough to stay on in production (a lock,
+a dict lookup and an add per observation; histograms add a bisect):
+
+- ``Counter``: monotonically increasing count, e.g. Bedrock calls by outcome
+- ``Histogram``: fixed buckets plus sum and count, e.g. stage latency
+- callback gauges/counters: read only at scrape time from state the code
+  already keeps (open sockets, queue depth), so they cost nothing per request
+
+Label values are passed positionally in ``labelnames`` order and must come
+from small fixed sets (stage names, outcomes), never from ids.
+
+Every gunicorn worker has its own registry. With ``metrics_dir`` set, each
+worker writes a JSON snapshot to ``<metrics_dir>/<pid>.json`` every
+``publish_interval`` seconds, and ``/api/metrics`` (served by any worker)
+merges its live registry with the other workers' latest snapshots: counters
+and histograms are summed, gauges summed or maxed per gauge (host-wide state
+every worker replicates, like the waiting queue, uses max). Snapshots of
+workers that have exited are deleted at scrape time.
+"""
+import asyncio
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# services.log counts dropped records here, so this module uses the logger directly
+logger = logging.getLogger("tripscape.services.metrics")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FAST_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.aggregate = "sum"
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List:
+        with self._lock:
+            return [[list(labels), value] for labels, value in self._values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.aggregate = "sum"
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._values: Dict[Labels, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels: str) -> "_Timer":
+        """Context manager observing the elapsed time of its block"""
+        return _Timer(self, labels)
+
+    def samples(self) -> List:
+        with self._lock:
+            return [[list(labels), list(counts), total, count] for labels, (counts, total, count) in self._values.items()]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram: Histogram, labels: Labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class CallbackMetric:
+    """A gauge or counter whose value is read from existing state at scrape time"""
+
+    def __init__(self, name: str, help: str, kind: str, func: Callable[[], Union[float, Dict[Labels, float]]],
+                 labelnames: Sequence[str] = (), aggregate: str = "sum"):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.func = func
+        self.labelnames = tuple(labelnames)
+        self.aggregate = aggregate
+
+    def samples(self) -> List:
+        try:
+            value = self.func()
+        except Exception as e:
+            logger.warning("Metric %s failed: %s", self.name, e)
+            return []
+        if isinstance(value, dict):
+            return [[list(labels), float(v)] for labels, v in value.items()]
+        return [[[], float(value)]]
+
+
+Metric = Union[Counter, Histogram, CallbackMetric]
+
+
+class MetricsRegistry:
+    """Named metrics for one process; instruments are created once and shared"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self.metrics_dir: Optional[Path] = None
+        self.publish_interval = 5.0
+        self._publisher: Optional[asyncio.Task] = None
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None and not isinstance(metric, CallbackMetric):
+                return existing
+            # Callbacks are replaced, so a recreated owner (tests, benchmarks) reports its own state
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge_callback(self, name: str, help: str, func, labelnames: Sequence[str] = (), aggregate: str = "sum") -> CallbackMetric:
+        return self._register(CallbackMetric(name, help, "gauge", func, labelnames, aggregate))
+
+    def counter_callback(self, name: str, help: str, func, labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help, "counter", func, labelnames))
+
+    def snapshot(self) -> Dict:
+        """Every metric's current samples, as JSON-serializable data"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        snapshot = {}
+        for metric in metrics:
+            entry = {
+                "kind": metric.kind,
+                "help": metric.help,
+                "labelnames": list(metric.labelnames),
+                "aggregate": metric.aggregate,
+                "samples": metric.samples(),
+            }
+            if isinstance(metric, Histogram):
+                entry["buckets"] = list(metric.buckets)
+            snapshot[metric.name] = entry
+        return snapshot
+
+    # Cross-worker aggregation
+
+    def configure(self, metrics_dir: str, publish_interval: float):
+        if metrics_dir:
+            path = Path(metrics_dir)
+            self.metrics_dir = path if path.is_absolute() else BASE_DIR / path
+            self.metrics_dir.mkdir(parents=True, exist_ok=True)
+        self.publish_interval = publish_interval
+
+    def _snapshot_path(self, pid: int) -> Path:
+        return self.metrics_dir / f"{pid}.json"
+
+    def publish(self, snapshot: Optional[Dict] = None):
+        """Write this worker's snapshot for the other workers to merge (blocking)"""
+        if self.metrics_dir is None:
+            return
+        path = self._snapshot_path(os.getpid())
+        staging = path.with_suffix(".tmp")
+        payload = {"pid": os.getpid(), "ts": time.time(), "metrics": snapshot or self.snapshot()}
+        staging.write_text(json.dumps(payload))
+        os.replace(staging, path)
+
+    async def _publish_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.publish_interval)
+            try:
+                # Callbacks read event-loop state, so the snapshot is taken here;
+                # only the file write goes to a thread
+                snapshot = self.snapshot()
+                await loop.run_in_executor(None, self.publish, snapshot)
+            except Exception as e:
+                logger.warning("Metrics publish failed: %s", e)
+
+    def start(self):
+        if self.metrics_dir is not None and self._publisher is None:
+            self._publisher = asyncio.get_running_loop().create_task(self._publish_loop(), name="metrics-publisher")
+
+    def stop(self):
+        if self._publisher is not None:
+            self._publisher.cancel()
+            self._publisher = None
+        if self.metrics_dir is not None:
+            try:
+                self._snapshot_path(os.getpid()).unlink()
+            except OSError:
+                pass
+
+    def other_snapshots(self) -> List[Dict]:
+        """The latest snapshots of the other live workers (blocking); those of exited workers are deleted"""
+        snapshots = []
+        if self.metrics_dir is None:
+            return snapshots
+        for path in self.metrics_dir.glob("*.json"):
+            try:
+                pid = int(path.stem)
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                path.unlink(missing_ok=True)
+                continue
+            except PermissionError:
+                pass
+            try:
+                snapshots.append(json.loads(path.read_text())["metrics"])
+            except (OSError, ValueError, KeyError):
+                continue
+        return snapshots
+
+
+def merge(snapshots: Iterable[Dict]) -> Dict:
+    merged: Dict[str, Dict] = {}
+    for snapshot in snapshots:
+        for name, entry in snapshot.items():
+            target = merged.get(name)
+            if target is None:
+                target = merged[name] = {**entry, "series": {}}
+            series = target["series"]
+            histogram = entry["kind"] == "histogram"
+            for sample in entry["samples"]:
+                labels = tuple(sample[0])
+                current = series.get(labels)
+                if histogram:
+                    if current is None or len(current[0]) != len(sample[1]):
+                        series[labels] = [list(sample[1]), sample[2], sample[3]]
+                    else:
+                        current[0] = [a + b for a, b in zip(current[0], sample[1])]
+                        current[1] += sample[2]
+                        current[2] += sample[3]
+                elif current is None:
+                    series[labels] = sample[1]
+                elif entry["aggregate"] == "max":
+                    series[labels] = max(current, sample[1])
+                else:
+                    series[labels] = current + sample[1]
+    return merged
+
+
+def render(metrics: Dict, workers: int = 1) -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = [
+        "# HELP tripscape_workers Workers whose metrics are included",
+        "# TYPE tripscape_workers gauge",
+        f"tripscape_workers {workers}",
+    ]
+    for name in sorted(metrics):
+        entry = metrics[name]
+        names = entry["labelnames"]
+        lines.append(f"# HELP {name} {entry['help']}")
+        lines.append(f"# TYPE {name} {entry['kind']}")
+        for labels, value in sorted(entry["series"].items()):
+            if entry["kind"] != "histogram":
+                lines.append(f"{name}{_label_text(names, labels)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip(list(entry["buckets"]) + [float("inf")], counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{name}_bucket{_label_text(names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(names, labels)} {_number(total)}")
+            lines.append(f"{name}_count{_label_text(names, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by every module that records metrics
+registry = MetricsRegistry()
@@ -0,0 +1,209 @@
+"""
+Per-connection outbound queues for WebSocket fan-out.
+
+Every socket gets a bounded queue drained by its own writer task, so
+broadcasting is a non-blocking enqueue per connection and one slow or
+half-dead client never delays the others. When a client falls behind, the
+channel applies its overflow policy:
+
+- ``drop_oldest``: discard the oldest queued message to make room
+- ``coalesce``: a message sent with a ``coalesce_key`` replaces the queued
+  one with the same key (e.g. queue-size updates); otherwise drop oldest
+- ``disconnect``: close the connection once the queue is full or its oldest
+  message has waited longer than ``max_lag_ms``
+
+Messages are JSON-encoded when queued, so ``queued_bytes`` tracks what the
+channel is holding. The channel also records when its client was last heard
+from (``touch``), for the heartbeat and idle reaper.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Union
+
+from fastapi import WebSocket
+
+from services.log import get_logger
+from services.metrics import FAST_BUCKETS, registry
+
+POLICIES = ("drop_oldest", "coalesce", "disconnect")
+
+logger = get_logger(__name__)
+
+# "Try again later": the server closed the connection because it fell behind
+SLOW_CONSUMER_CLOSE_CODE = 1013
+# "Going away": the client stopped answering heartbeats
+IDLE_CLOSE_CODE = 1001
+# "Internal error": a send to the client failed
+SEND_FAILED_CLOSE_CODE = 1011
+
+FANOUT_SECONDS = registry.histogram(
+    "ws_fanout_seconds", "Time to queue one message for every recipient socket on this worker", ("kind",),
+    buckets=FAST_BUCKETS,
+)
+SEND_DELAY = registry.histogram(
+    "ws_send_delay_seconds", "Time from queueing a WebSocket message to finishing its send (queue wait plus write)"
+)
+
+
+class OutboundChannel:
+    """Bounded outbound queue plus writer task for one WebSocket"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        name: str,
+        max_queue: int = 256,
+        policy: str = "drop_oldest",
+        max_lag_ms: int = 5000,
+        on_close: Optional[Callable[["OutboundChannel"], None]] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown outbound policy: {policy}")
+        self.websocket = websocket
+        self.name = name
+        self.max_queue = max_queue
+        self.policy = policy
+        self.max_lag = max_lag_ms / 1000
+        self.on_close = on_close
+        # Entries are [text, coalesce_key, enqueued_at]; lists so coalescing can replace in place
+        self._queue: Deque[List] = deque()
+        self._pending: Dict[Hashable, List] = {}
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.slow_disconnect = False
+        self.idle_evicted = False
+        self.queued_bytes = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.connected_at = self.last_seen = time.monotonic()
+        self.pinged_at: Optional[float] = None
+        self._writer = asyncio.create_task(self._write_loop(), name=f"outbound-{name}")
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def touch(self, nbytes: int = 0):
+        """The client sent something: it is alive"""
+        self.last_seen = time.monotonic()
+        self.pinged_at = None
+        self.bytes_received += nbytes
+
+    def send(self, message: Union[dict, str], coalesce_key: Optional[Hashable] = None) -> bool:
+        """Queue a message (a dict, or pre-encoded JSON text) without waiting; returns False if it was not queued"""
+        if self.closed:
+            return False
+        now = time.monotonic()
+        if not isinstance(message, str):
+            message = json.dumps(message, separators=(",", ":"))
+
+        if self.policy == "coalesce" and coalesce_key is not None:
+            entry = self._pending.get(coalesce_key)
+            if entry is not None:
+                self.queued_bytes += len(message) - len(entry[0])
+                entry[0] = message
+                self.coalesced += 1
+                return True
+
+        if self.policy == "disconnect" and self._queue and (
+            len(self._queue) >= self.max_queue or now - self._queue[0][2] > self.max_lag
+        ):
+            self._disconnect_slow()
+            return False
+
+        if len(self._queue) >= self.max_queue:
+            dropped = self._queue.popleft()
+            self._forget(dropped)
+            self.queued_bytes -= len(dropped[0])
+            self.dropped += 1
+
+        entry = [message, coalesce_key, now]
+        self._queue.append(entry)
+        self.queued_bytes += len(message)
+        if self.policy == "coalesce" and coalesce_key is not None:
+            self._pending[coalesce_key] = entry
+        self._ready.set()
+        return True
+
+    def _forget(self, entry: List):
+        key = entry[1]
+        if key is not None and self._pending.get(key) is entry:
+            del self._pending[key]
+
+    async def _write_loop(self):
+        try:
+            while True:
+                if not self._queue:
+                    self._ready.clear()
+                    await self._ready.wait()
+                    continue
+                entry = self._queue.popleft()
+                self._forget(entry)
+                message = entry[0]
+                self.queued_bytes -= len(message)
+                send = self.websocket.send_text(message)
+                if self.policy == "disconnect":
+                    # A send stuck on a half-dead socket counts as backlog too
+                    await asyncio.wait_for(send, timeout=self.max_lag)
+                else:
+                    await send
+                self.sent += 1
+                self.bytes_sent += len(message)
+                SEND_DELAY.observe(time.monotonic() - entry[2])
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self._disconnect_slow()
+        except Exception as e:
+            logger.warning("Error sending to %s: %s", self.name, e)
+            self.close()
+            # Ends the endpoint's receive loop too; its disconnect cleanup finds
+            # the connection already removed by on_close
+            await self._close_socket(SEND_FAILED_CLOSE_CODE, "Send failed")
+
+    def _disconnect_slow(self):
+        logger.warning("Disconnecting slow consumer %s", self.name, extra={"queued": len(self._queue)})
+        self.slow_disconnect = True
+        self.close()
+        asyncio.create_task(self._close_socket(SLOW_CONSUMER_CLOSE_CODE, "Too slow to keep up"))
+
+    def evict_idle(self):
+        """Close a connection whose client stopped answering heartbeats"""
+        logger.warning("Evicting idle connection %s", self.name, extra={"silent_seconds": round(time.monotonic() - self.last_seen)})
+        self.idle_evicted = True
+        self.close()
+        asyncio.create_task(self._close_socket(IDLE_CLOSE_CODE, "Idle timeout"))
+
+    async def _close_socket(self, code: int, reason: str):
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), timeout=1.0)
+        except Exception:
+            pass
+
+    def close(self):
+        """Stop the writer and discard anything still queued"""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._pending.clear()
+        self.queued_bytes = 0
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        if self.on_close is not None:
+            self.on_close(self)
+
+    def stats(self) -> Dict:
+        return {
+            "queued": len(self._queue),
+            "queued_bytes": self.queued_bytes,
+            "sent": self.sent,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
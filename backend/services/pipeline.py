@@ -0,0 +1,114 @@
+"""Small dependency-driven stage graph used by the chat pipeline"""
+import asyncio
+import inspect
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+from services.log import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class Stage:
+    """A unit of work in a StageGraph.
+
+    ``func`` is called with the results of ``depends_on`` as keyword arguments and
+    may be sync (local CPU work) or async (network calls). ``timeout`` is the
+    stage's own budget, counted from the moment its dependencies are ready. When
+    the stage times out or raises, ``fallback`` is called with the same arguments
+    and its value is used instead; without a fallback the error propagates.
+    """
+    name: str
+    func: Callable[..., Any]
+    depends_on: List[str] = field(default_factory=list)
+    timeout: Optional[float] = None
+    fallback: Optional[Callable[..., Any]] = None
+
+
+class StageGraph:
+    """Runs stages concurrently, starting each one as soon as its dependencies finish.
+
+    ``observe``, if given, is called as ``observe(stage name, seconds, outcome)``
+    when each stage finishes, with outcome "ok" or "fallback"; the time runs from
+    the moment the stage's dependencies were ready.
+    """
+
+    def __init__(self, stages: List[Stage], observe: Optional[Callable[[str, float, str], None]] = None):
+        self.stages = self._order(stages)
+        self.observe = observe
+
+    @staticmethod
+    def _order(stages: List[Stage]) -> List[Stage]:
+        """Topologically sort stages so every dependency is scheduled before its dependents"""
+        by_name = {stage.name: stage for stage in stages}
+        ordered: List[Stage] = []
+        state: Dict[str, str] = {}
+
+        def visit(stage: Stage):
+            if state.get(stage.name) == "done":
+                return
+            if state.get(stage.name) == "visiting":
+                raise ValueError(f"Cycle in stage graph at '{stage.name}'")
+            state[stage.name] = "visiting"
+            for dep in stage.depends_on:
+                if dep not in by_name:
+                    raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+                visit(by_name[dep])
+            state[stage.name] = "done"
+            ordered.append(stage)
+
+        for stage in stages:
+            visit(stage)
+        return ordered
+
+    async def _run_stage(self, stage: Stage, tasks: Dict[str, asyncio.Task]) -> Any:
+        deps = {dep: await tasks[dep] for dep in stage.depends_on}
+        started = time.perf_counter()
+        try:
+            result = stage.func(**deps)
+            if inspect.isawaitable(result):
+                result = await asyncio.wait_for(result, timeout=stage.timeout)
+            if self.observe is not None:
+                self.observe(stage.name, time.perf_counter() - started, "ok")
+            return result
+        except asyncio.TimeoutError:
+            if stage.fallback is None:
+                raise
+            logger.warning("Stage exceeded its budget, using fallback", extra={"stage": stage.name, "timeout": stage.timeout})
+        except Exception as e:
+            if stage.fallback is None:
+                raise
+            logger.warning("Stage failed, using fallback: %s", e, extra={"stage": stage.name})
+        result = stage.fallback(**deps)
+        if self.observe is not None:
+            self.observe(stage.name, time.perf_counter() - started, "fallback")
+        return result
+
+    def start(self) -> Dict[str, asyncio.Task]:
+        """Schedule every stage and return their tasks, for callers that consume results as they land"""
+        tasks: Dict[str, asyncio.Task] = {}
+        for stage in self.stages:
+            tasks[stage.name] = asyncio.create_task(self._run_stage(stage, tasks))
+        return tasks
+
+    async def gather(self, tasks: Dict[str, asyncio.Task]) -> Dict[str, Any]:
+        """Wait for started stages and return their results keyed by stage name.
+
+        A stage another stage cancelled because its result wasn't needed yields None.
+        """
+        outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for name, outcome in zip(tasks.keys(), outcomes):
+            if isinstance(outcome, asyncio.CancelledError) and tasks[name].cancelled():
+                continue
+            if isinstance(outcome, BaseException):
+                raise outcome
+        return {
+            name: None if isinstance(outcome, asyncio.CancelledError) else outcome
+            for name, outcome in zip(tasks.keys(), outcomes)
+        }
+
+    async def run(self) -> Dict[str, Any]:
+        """Run every stage and return their results keyed by stage name"""
+        return await self.gather(self.start())
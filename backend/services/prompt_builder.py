@@ -0,0 +1,273 @@
+"""
+Token-budgeted prompt assembly for the Claude calls.
+
+The instructions never change, so they are compiled once into the request's
+``system`` field and only the per-request parts are built per message:
+recent history as real user/assistant turns, then one user turn holding the
+KB context, matched packages and the latest message.
+
+Everything the model reads is fitted to ``budget_tokens`` (estimated at
+about four characters per token, which is close for English and errs high
+on short words):
+
+1. the system prompt and the message itself (the message is cut if it alone
+   would take more than a quarter of the budget)
+2. KB chunks, in retrieval (relevance) order, up to ``kb_max_tokens``; the
+   first chunk that doesn't fit is cut at a word boundary if a useful part
+   of it still fits, and the rest are dropped
+3. matched packages, in match order, up to ``packages_max_tokens``
+4. history, newest first, from whatever is left, at most ``history_messages``
+
+``max_tokens`` for the reply comes from the routed intent, so a greeting
+doesn't reserve room for a package comparison. Every plan records what it
+used per section; ``stats()`` aggregates them.
+"""
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+ANTHROPIC_VERSION = "bedrock-2023-05-31"
+
+# A chunk is only cut to fit if at least this many tokens of it would remain
+MIN_CHUNK_TOKENS = 24
+
+DEFAULT_KB_CONTEXT = (
+    "Tripscape offers 7 curated packages: Dubai Escape, Bhutan Bliss, Ladakh Adventure, "
+    "Kerala Backwaters, Rajasthan Royals, Himachal Hill Retreat, Northeast Wonders."
+)
+
+SYSTEM_PROMPT = """You are Tripscape's AI Trip Guide, a friendly and knowledgeable travel assistant specializing in Indian and international packages. Your role is to:
+
+1. Help users plan their dream trips by understanding their preferences (destination, dates, travelers, budget in ₹, vibe).
+2. Suggest relevant packages from Tripscape's collection (Dubai, Bhutan, Ladakh, Kerala, Rajasthan, Himachal, Northeast India).
+3. All prices are per person (twin-sharing basis) in Indian Rupees (₹).
+4. Parse user messages to extract: destination, dates, number of travelers, budget, and preferences.
+5. Provide warm, personalized recommendations with enthusiasm.
+6. When suggesting packages, briefly highlight why they're a great fit (e.g., "Dubai Escape is perfect for families with city tours and desert safaris").
+7. If the user asks for an agent, offer to connect them to chat@tripscape.com.
+8. Keep responses concise and conversational (2-3 sentences max, unless listing packages).
+9. Packages range from ₹25,999 (Bhutan Bliss) to ₹95,999 (Dubai Escape).
+10. Mention key features like duration, inclusions (hotels, meals, tours), and suitability (couples, families, adventure seekers).
+
+Each user turn starts with Knowledge Base context and any matching packages; use them when relevant. Respond naturally as the AI Trip Guide. If suggesting packages, mention them by name with prices (e.g., "Exotic Dubai Escape - ₹95,999"). Be enthusiastic and helpful!"""
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cut text to about ``tokens`` tokens, at a word boundary"""
+    limit = tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    if space > limit // 2:
+        cut = cut[:space]
+    return cut.rstrip() + " …"
+
+
+@dataclass
+class PromptPlan:
+    body: Dict
+    max_tokens: int
+    system_tokens: int
+    message_tokens: int
+    kb_tokens: int
+    package_tokens: int
+    history_tokens: int
+    kb_chunks: int = 0
+    kb_chunks_dropped: int = 0
+    packages_dropped: int = 0
+    history_dropped: int = 0
+    truncated: List[str] = field(default_factory=list)
+
+    @property
+    def prompt_tokens(self) -> int:
+        return self.system_tokens + self.message_tokens + self.kb_tokens + self.package_tokens + self.history_tokens
+
+
+class PromptBuilder:
+    """Builds Bedrock request bodies within a prompt token budget"""
+
+    def __init__(
+        self,
+        budget_tokens: int = 1500,
+        kb_max_tokens: int = 600,
+        packages_max_tokens: int = 300,
+        history_messages: int = 4,
+        max_tokens_by_intent: Optional[Dict[str, int]] = None,
+        default_max_tokens: int = 500,
+        temperature: float = 0.7,
+    ):
+        self.budget_tokens = budget_tokens
+        self.kb_max_tokens = kb_max_tokens
+        self.packages_max_tokens = packages_max_tokens
+        self.history_messages = history_messages
+        self.max_tokens_by_intent = max_tokens_by_intent or {}
+        self.default_max_tokens = default_max_tokens
+        self.temperature = temperature
+        self.system_prompt = SYSTEM_PROMPT
+        self.system_tokens = estimate_tokens(SYSTEM_PROMPT)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._totals = {"prompt_tokens": 0, "kb_tokens": 0, "package_tokens": 0, "history_tokens": 0, "max_tokens": 0}
+        self._max_prompt = 0
+        self._truncated: Dict[str, int] = {}
+        self._by_intent: Dict[str, int] = {}
+
+    def max_tokens_for(self, intent: Optional[str]) -> int:
+        return self.max_tokens_by_intent.get(intent or "", self.default_max_tokens)
+
+    def _fit_kb(self, kb_context: str, budget: int) -> Tuple[str, int, int, bool]:
+        """KB chunks that fit the budget: (text, chunks kept, chunks dropped, cut)"""
+        chunks, seen = [], set()
+        for chunk in kb_context.split("\n\n"):
+            chunk = chunk.strip()
+            if chunk and chunk not in seen:
+                seen.add(chunk)
+                chunks.append(chunk)
+        kept, used, cut = [], 0, False
+        for chunk in chunks:
+            cost = estimate_tokens(chunk) + 1
+            if used + cost <= budget:
+                kept.append(chunk)
+                used += cost
+                continue
+            if budget - used >= MIN_CHUNK_TOKENS:
+                kept.append(truncate_to_tokens(chunk, budget - used - 1))
+                cut = True
+            break
+        return "\n\n".join(kept), len(kept), len(chunks) - len(kept), cut
+
+    @staticmethod
+    def _package_line(package: Dict) -> str:
+        return (
+            f"- {package['name']} ({package['destination']}) - ₹{package['price']:,} - "
+            f"{package['dates']}: {package['description']}"
+        )
+
+    def _fit_packages(self, packages: List[Dict], budget: int) -> Tuple[List[str], int]:
+        lines, used = [], 0
+        for package in packages:
+            line = self._package_line(package)
+            cost = estimate_tokens(line) + 1
+            if used + cost > budget:
+                break
+            lines.append(line)
+            used += cost
+        return lines, len(packages) - len(lines)
+
+    def _fit_history(self, history: List[Dict], budget: int) -> Tuple[List[Dict], int]:
+        """Newest messages that fit (and how many of the window didn't), as alternating turns"""
+        window = history[-self.history_messages:] if self.history_messages else []
+        picked, used, empty = [], 0, 0
+        for message in reversed(window):
+            content = (message.get("content") or "").strip()
+            if not content:
+                empty += 1
+                continue
+            cost = estimate_tokens(content) + 2
+            if used + cost > budget:
+                break
+            picked.append({"role": "user" if message.get("role") == "user" else "assistant", "content": content})
+            used += cost
+        picked.reverse()
+        # Claude needs alternating roles that start with the user and end before
+        # the new user turn, so merge repeats and trim the ends
+        turns: List[Dict] = []
+        for message in picked:
+            if turns and turns[-1]["role"] == message["role"]:
+                turns[-1]["content"] += "\n" + message["content"]
+            else:
+                turns.append(dict(message))
+        while turns and turns[0]["role"] != "user":
+            turns.pop(0)
+        while turns and turns[-1]["role"] != "assistant":
+            turns.pop()
+        return turns, len(window) - empty - len(picked)
+
+    def build(self, message: str, history: List[Dict], kb_context: str, packages: List[Dict], intent: Optional[str] = None) -> PromptPlan:
+        """Request body and token accounting for one Claude call"""
+        truncated = []
+        message_budget = max(self.budget_tokens // 4, MIN_CHUNK_TOKENS)
+        if estimate_tokens(message) > message_budget:
+            message = truncate_to_tokens(message, message_budget)
+            truncated.append("message")
+        remaining = self.budget_tokens - self.system_tokens - estimate_tokens(message) - 16
+
+        kb_text, kb_chunks, kb_dropped, kb_cut = self._fit_kb(kb_context or "", max(0, min(self.kb_max_tokens, remaining)))
+        if kb_cut or kb_dropped:
+            truncated.append("kb")
+        kb_text = kb_text or DEFAULT_KB_CONTEXT
+        kb_tokens = estimate_tokens(kb_text)
+        remaining -= kb_tokens
+
+        package_lines, packages_dropped = self._fit_packages(packages, max(0, min(self.packages_max_tokens, remaining)))
+        if packages_dropped:
+            truncated.append("packages")
+        package_text = "\n".join(package_lines)
+        package_tokens = estimate_tokens(package_text)
+        remaining -= package_tokens
+
+        turns, history_dropped = self._fit_history(history, max(0, remaining))
+        if history_dropped:
+            truncated.append("history")
+        history_tokens = sum(estimate_tokens(turn["content"]) + 2 for turn in turns)
+
+        sections = [f"Knowledge Base Context:\n{kb_text}"]
+        if package_text:
+            sections.append(f"Available packages:\n{package_text}")
+        sections.append(f"User's latest message: {message}")
+        max_tokens = self.max_tokens_for(intent)
+        plan = PromptPlan(
+            body={
+                "anthropic_version": ANTHROPIC_VERSION,
+                "max_tokens": max_tokens,
+                "system": self.system_prompt,
+                "messages": turns + [{"role": "user", "content": "\n\n".join(sections)}],
+                "temperature": self.temperature,
+            },
+            max_tokens=max_tokens,
+            system_tokens=self.system_tokens,
+            message_tokens=estimate_tokens(message),
+            kb_tokens=kb_tokens,
+            package_tokens=package_tokens,
+            history_tokens=history_tokens,
+            kb_chunks=kb_chunks,
+            kb_chunks_dropped=kb_dropped,
+            packages_dropped=packages_dropped,
+            history_dropped=history_dropped,
+            truncated=truncated,
+        )
+        self._count(plan, intent)
+        return plan
+
+    def _count(self, plan: PromptPlan, intent: Optional[str]):
+        with self._lock:
+            self._requests += 1
+            for name in self._totals:
+                self._totals[name] += getattr(plan, name)
+            self._max_prompt = max(self._max_prompt, plan.prompt_tokens)
+            for section in plan.truncated:
+                self._truncated[section] = self._truncated.get(section, 0) + 1
+            key = intent or "unknown"
+            self._by_intent[key] = self._by_intent.get(key, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            requests = self._requests
+            averages = {
+                f"avg_{name}": round(total / requests, 1) if requests else 0
+                for name, total in self._totals.items()
+            }
+            return {
+                "budget_tokens": self.budget_tokens,
+                "system_tokens": self.system_tokens,
+                "requests": requests,
+                **averages,
+                "max_prompt_tokens": self._max_prompt,
+                "truncated": dict(self._truncated),
+                "by_intent": dict(self._by_intent),
+            }
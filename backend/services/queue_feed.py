@@ -0,0 +1,132 @@
+"""
+Batched, sequence-numbered waiting-queue updates for agent consoles.
+
+Queue changes are collected for a short window and net out (a customer who
+joins and leaves inside one window never appears). At the end of the window
+each agent connected to this worker gets at most one message:
+
+- ``queue_delta``: ``seq``, ``removed`` ids and ``added`` ``[id, index]``
+  pairs; drop every id listed in either, then insert ``added`` at their
+  indices in the listed order (this also makes it safe to apply on top of a
+  snapshot taken mid-window)
+- ``queue_snapshot``: ``seq`` and the full ``queue``, sent instead when the
+  agent is new, missed a message (its outbound channel dropped something),
+  or the delta would be larger than the queue itself
+
+Clients that see a gap in ``seq`` send ``get_queue`` for a fresh snapshot.
+Each message is serialized once per window, whatever the number of agents.
+"""
+import asyncio
+import json
+import time
+from typing import Callable, Dict, Mapping, Optional, Set, Tuple
+
+from services.outbound import FANOUT_SECONDS, OutboundChannel
+
+
+class QueueFeed:
+    """Coalesces queue changes into one delta (or snapshot) per agent per window"""
+
+    def __init__(
+        self,
+        interval_ms: int,
+        waiting: Callable[[], Mapping],
+        channels: Callable[[], Dict[str, OutboundChannel]],
+    ):
+        self.interval = interval_ms / 1000
+        self._waiting = waiting
+        self._channels = channels
+        self.seq = 0
+        self._added: Dict[str, None] = {}
+        self._removed: Set[str] = set()
+        self._resync = False
+        self._scheduled = False
+        # agent_id -> (seq last sent, channel drop count at that time)
+        self._sent: Dict[str, Tuple[int, int]] = {}
+        self.deltas_sent = 0
+        self.snapshots_sent = 0
+
+    def added(self, customer_id: str):
+        self._added[customer_id] = None
+        self._schedule()
+
+    def removed(self, customer_id: str):
+        if customer_id in self._added:
+            # Joined inside this window: agents never saw it
+            del self._added[customer_id]
+        else:
+            self._removed.add(customer_id)
+        self._schedule()
+
+    def resync(self):
+        """The queue was replaced wholesale (bus rejoin): everyone gets a snapshot"""
+        self._resync = True
+        self._schedule()
+
+    def _schedule(self):
+        if self._scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._scheduled = True
+        loop.call_later(self.interval, self.flush)
+
+    def _snapshot_frame(self) -> str:
+        queue = list(self._waiting())
+        return json.dumps({"type": "queue_snapshot", "seq": self.seq, "queue": queue, "queue_size": len(queue)})
+
+    def send_snapshot(self, agent_id: str, channel: OutboundChannel, frame: Optional[str] = None):
+        """Full queue for one agent (on connect, on get_queue, or when it fell behind)"""
+        channel.send(frame or self._snapshot_frame())
+        self._sent[agent_id] = (self.seq, channel.dropped)
+        self.snapshots_sent += 1
+
+    def flush(self):
+        self._scheduled = False
+        if not (self._added or self._removed or self._resync):
+            return
+        waiting = self._waiting()
+        self.seq += 1
+        changes = len(self._added) + len(self._removed)
+        delta_frame = None
+        if not self._resync and changes < len(waiting):
+            added = self._added
+            positions = [[customer_id, index] for index, customer_id in enumerate(waiting) if customer_id in added] if added else []
+            delta_frame = json.dumps({
+                "type": "queue_delta",
+                "seq": self.seq,
+                "removed": sorted(self._removed),
+                "added": positions,
+                "queue_size": len(waiting),
+            })
+        snapshot_frame = None
+
+        started = time.perf_counter()
+        channels = self._channels()
+        for agent_id, channel in channels.items():
+            last = self._sent.get(agent_id)
+            if delta_frame is not None and last == (self.seq - 1, channel.dropped):
+                channel.send(delta_frame)
+                self._sent[agent_id] = (self.seq, channel.dropped)
+                self.deltas_sent += 1
+            else:
+                snapshot_frame = snapshot_frame or self._snapshot_frame()
+                self.send_snapshot(agent_id, channel, snapshot_frame)
+
+        FANOUT_SECONDS.observe(time.perf_counter() - started, "queue_update")
+
+        for agent_id in [a for a in self._sent if a not in channels]:
+            del self._sent[agent_id]
+        self._added = {}
+        self._removed = set()
+        self._resync = False
+
+    def stats(self) -> Dict:
+        return {
+            "seq": self.seq,
+            "interval_ms": int(self.interval * 1000),
+            "deltas_sent": self.deltas_sent,
+            "snapshots_sent": self.snapshots_sent,
+        }
@@ -0,0 +1,163 @@
+"""
+Failure handling for the Bedrock calls: a circuit breaker and hedged calls.
+
+``CircuitBreaker`` tracks the outcome of the last ``window`` calls. Once at
+least ``min_calls`` have been seen and the failure rate reaches
+``failure_rate`` it opens, and callers go straight to their fallback instead
+of waiting out timeouts and retries against a degraded service. After
+``open_seconds`` one probe call is let through (half-open): success closes
+the breaker, failure opens it again.
+
+``hedged_call`` runs a call and, if it hasn't succeeded within ``delay``
+seconds, starts an identical second one; whichever succeeds first wins. It
+is only for idempotent reads (KB retrieval), and trades a few extra requests
+for a shorter tail.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, wait
+from typing import Callable, Deque, Dict
+
+from services.log import get_logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+logger = get_logger(__name__)
+
+
+class CircuitBreaker:
+    """Error-rate circuit breaker over a sliding window of calls (thread-safe)"""
+
+    def __init__(self, name: str, failure_rate: float = 0.5, window: int = 20, min_calls: int = 10, open_seconds: float = 30):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.short_circuited = 0
+        self.successes = 0
+        self.failures = 0
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; False means use the fallback"""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            if self.state == HALF_OPEN:
+                logger.info("Circuit closed", extra={"circuit": self.name})
+                self.state = CLOSED
+                self._outcomes.clear()
+                self._probing = False
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                self._open()
+                return
+            self._outcomes.append(False)
+            failed = self._outcomes.count(False)
+            if (
+                self.state == CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and failed / len(self._outcomes) >= self.failure_rate
+            ):
+                self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._probing = False
+        self.opened += 1
+        logger.warning("Circuit opened; using fallbacks", extra={"circuit": self.name, "open_seconds": self.open_seconds})
+
+    def call(self, func: Callable, *args, **kwargs):
+        """Run func under the breaker; raises CircuitOpenError when short-circuited"""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            window = len(self._outcomes)
+            return {
+                "state": self.state,
+                "window_calls": window,
+                "window_failure_rate": round(self._outcomes.count(False) / window, 3) if window else 0,
+                "successes": self.successes,
+                "failures": self.failures,
+                "opened": self.opened,
+                "short_circuited": self.short_circuited,
+            }
+
+
+class CircuitOpenError(Exception):
+    """Raised by CircuitBreaker.call while the circuit is open"""
+
+    def __init__(self, name: str):
+        super().__init__(f"circuit '{name}' is open")
+        self.name = name
+
+
+class HedgeStats:
+    """Counts how often hedged calls needed, and were won by, the second request"""
+
+    def __init__(self):
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def stats(self) -> Dict:
+        return {"calls": self.calls, "hedged": self.hedged, "hedge_wins": self.hedge_wins}
+
+
+def hedged_call(executor: Executor, func: Callable, delay: float, stats: HedgeStats = None):
+    """Result of the first successful of func() and a second func() started after delay"""
+    primary = executor.submit(func)
+    if stats:
+        stats.calls += 1
+    done, _ = wait([primary], timeout=delay)
+    if done and primary.exception() is None:
+        return primary.result()
+
+    hedge = executor.submit(func)
+    if stats:
+        stats.hedged += 1
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if stats and future is hedge:
+                    stats.hedge_wins += 1
+                return future.result()
+            error = future.exception()
+    raise error
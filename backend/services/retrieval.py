@@ -0,0 +1,353 @@
+"""
+Local BM25 retrieval over the package catalog and a documents directory.
+
+An offline alternative to the Bedrock Knowledge Base. Sources are the
+catalog's packages (one passage each) and the ``.md``/``.txt`` files under
+``kb_documents_dir``, split into paragraph-sized passages. The index is an
+inverted index held in flat NumPy arrays, with each posting's BM25 weight
+precomputed at build time:
+
+- ``terms``: sorted vocabulary (a query term is found by binary search)
+- ``offsets``: where each term's postings start in ``docs``/``weights``
+- ``docs`` / ``weights``: passage ids and their BM25 term weights
+- ``text`` / ``text_offsets``: UTF-8 passage text, sliced out for the top k
+
+A query sums its terms' posting weights into a dense score array and takes
+the top k with ``argpartition``, all in NumPy. The arrays are saved as
+``.npy`` files under ``kb_index_path`` and opened memory-mapped, so a worker
+starts serving without parsing or rebuilding anything. The index records a
+fingerprint of its sources and is rebuilt (under a file lock, so one worker
+builds while the others wait and then load it) when the catalog or the
+documents change; sources are rechecked in the background at most every
+``check_interval_seconds``, and the old index serves until the new one is open.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from services.catalog import CatalogSnapshot, get_catalog
+from services.log import get_logger
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+logger = get_logger(__name__)
+
+INDEX_FORMAT = 1
+MAX_TERM_LENGTH = 32
+# Passages longer than this many words are split
+MAX_PASSAGE_WORDS = 160
+DOCUMENT_SUFFIXES = (".md", ".txt")
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i in is it its me my of on or our "
+    "please so that the their there this to us was we what when where which who will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [
+        token[:MAX_TERM_LENGTH]
+        for token in _TOKEN.findall(text.lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+def _resolve(path: str) -> Path:
+    path = Path(path)
+    return path if path.is_absolute() else BASE_DIR / path
+
+
+def _package_passage(package) -> str:
+    lines = [
+        f"{package.name} ({package.destination}) - ₹{package.price:,} per person",
+        package.description,
+    ]
+    if package.duration:
+        lines.append(f"Duration: {package.duration}. Dates: {package.dates}")
+    if package.inclusions:
+        lines.append("Includes: " + ", ".join(package.inclusions))
+    if package.suitable_for:
+        lines.append("Suitable for: " + ", ".join(package.suitable_for))
+    return "\n".join(lines)
+
+
+def _document_passages(path: Path) -> List[str]:
+    """Paragraphs of a document, each prefixed with the nearest heading, split if long"""
+    passages, heading = [], ""
+    for block in re.split(r"\n\s*\n", path.read_text(encoding="utf-8")):
+        block = block.strip()
+        if not block:
+            continue
+        if block.startswith("#") and "\n" not in block:
+            heading = block.lstrip("#").strip()
+            continue
+        words = block.split()
+        for start in range(0, len(words), MAX_PASSAGE_WORDS):
+            body = " ".join(words[start:start + MAX_PASSAGE_WORDS])
+            passages.append(f"{heading}\n{body}" if heading else body)
+    return passages
+
+
+@dataclass(frozen=True)
+class OpenIndex:
+    """One build's memory-mapped arrays and metadata, swapped in as a single reference"""
+    arrays: Dict[str, np.ndarray]
+    meta: Dict
+
+
+class LocalKnowledgeBase:
+    """Memory-mapped BM25 index over the catalog and the documents directory"""
+
+    def __init__(self, index_path: str, documents_dir: str, check_interval_seconds: float = 30, k1: float = 1.2, b: float = 0.75):
+        self.index_path = _resolve(index_path)
+        self.documents_dir = _resolve(documents_dir)
+        self.check_interval = check_interval_seconds
+        self.k1 = k1
+        self.b = b
+        self._index: Optional[OpenIndex] = None
+        self._catalog_fingerprint: Optional[str] = None
+        self._checked_at = 0.0
+        self._load_lock = threading.Lock()
+        self._rebuilding = False
+        self.queries = 0
+        self.builds = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    # Sources
+
+    def _document_files(self) -> List[Path]:
+        if not self.documents_dir.is_dir():
+            return []
+        return sorted(p for p in self.documents_dir.rglob("*") if p.suffix.lower() in DOCUMENT_SUFFIXES and p.is_file())
+
+    def _fingerprint(self, snapshot: CatalogSnapshot) -> str:
+        digest = hashlib.sha1(f"{INDEX_FORMAT}:{self.k1}:{self.b}:{snapshot.fingerprint}".encode())
+        for path in self._document_files():
+            stat = path.stat()
+            digest.update(f"|{path.relative_to(self.documents_dir)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return digest.hexdigest()[:16]
+
+    # Build
+
+    def _build(self, snapshot: CatalogSnapshot, fingerprint: str):
+        started = time.perf_counter()
+        passages = [_package_passage(package) for package in snapshot.packages]
+        for path in self._document_files():
+            passages.extend(_document_passages(path))
+
+        term_ids: Dict[str, int] = {}
+        rows, cols, counts = [], [], []
+        lengths = np.zeros(len(passages), dtype=np.float32)
+        for doc, passage in enumerate(passages):
+            tokens = tokenize(passage)
+            lengths[doc] = len(tokens)
+            tf: Dict[int, int] = {}
+            for token in tokens:
+                term = term_ids.setdefault(token, len(term_ids))
+                tf[term] = tf.get(term, 0) + 1
+            for term, count in tf.items():
+                rows.append(term)
+                cols.append(doc)
+                counts.append(count)
+
+        # Vocabulary in sorted order; postings grouped by term, then by passage
+        vocabulary = sorted(term_ids)
+        remap = np.empty(len(vocabulary), dtype=np.int64)
+        for new_id, term in enumerate(vocabulary):
+            remap[term_ids[term]] = new_id
+        terms = remap[np.asarray(rows, dtype=np.int64)] if rows else np.zeros(0, dtype=np.int64)
+        docs = np.asarray(cols, dtype=np.int32)
+        tf = np.asarray(counts, dtype=np.float32)
+        order = np.lexsort((docs, terms))
+        terms, docs, tf = terms[order], docs[order], tf[order]
+
+        n = max(len(passages), 1)
+        df = np.bincount(terms, minlength=len(vocabulary)).astype(np.float32)
+        idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+        avgdl = float(lengths.mean()) if len(passages) else 0.0
+        norm = self.k1 * (1 - self.b + self.b * lengths[docs] / max(avgdl, 1e-9))
+        weights = (idf[terms] * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(df.astype(np.int64), out=offsets[1:])
+
+        encoded = [passage.encode("utf-8") for passage in passages]
+        text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=text_offsets[1:])
+
+        arrays = {
+            "terms": np.asarray(vocabulary, dtype=f"<U{MAX_TERM_LENGTH}"),
+            "offsets": offsets,
+            "docs": docs,
+            "weights": weights,
+            "text": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "text_offsets": text_offsets,
+        }
+        meta = {
+            "format": INDEX_FORMAT,
+            "fingerprint": fingerprint,
+            "passages": len(passages),
+            "packages": len(snapshot.packages),
+            "terms": len(vocabulary),
+            "postings": int(len(docs)),
+            "avgdl": avgdl,
+            "built_at": time.time(),
+        }
+
+        # Write beside the live index, then swap directories
+        staging = self.index_path.with_name(self.index_path.name + f".building-{os.getpid()}")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir(parents=True)
+        for name, array in arrays.items():
+            np.save(staging / f"{name}.npy", array)
+        (staging / "meta.json").write_text(json.dumps(meta))
+        retired = self.index_path.with_name(self.index_path.name + f".old-{os.getpid()}")
+        if self.index_path.exists():
+            self.index_path.rename(retired)
+        staging.rename(self.index_path)
+        shutil.rmtree(retired, ignore_errors=True)
+        self.builds += 1
+        logger.info("Local KB index built", extra={
+            "passages": meta["passages"], "terms": meta["terms"], "ms": round((time.perf_counter() - started) * 1000),
+        })
+
+    def _read_meta(self) -> Dict:
+        try:
+            return json.loads((self.index_path / "meta.json").read_text())
+        except (OSError, ValueError):
+            return {}
+
+    def _open(self, meta: Dict):
+        arrays = {
+            name: np.load(self.index_path / f"{name}.npy", mmap_mode="r")
+            for name in ("terms", "offsets", "docs", "weights", "text", "text_offsets")
+        }
+        # One assignment, so a search never sees one build's arrays with another's meta
+        self._index = OpenIndex(arrays, meta)
+
+    def load(self):
+        """Open the index, building it first if it is missing or its sources changed (blocking)"""
+        snapshot = get_catalog().snapshot()
+        with self._load_lock:
+            fingerprint = self._fingerprint(snapshot)
+            self._catalog_fingerprint = snapshot.fingerprint
+            self._checked_at = time.monotonic()
+            if self._index is not None and self._index.meta.get("fingerprint") == fingerprint:
+                return
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            lock_path = self.index_path.with_name(self.index_path.name + ".lock")
+            with open(lock_path, "w") as lock:
+                # One worker builds while the others wait, then find the index current;
+                # opening under the lock also keeps readers out of a directory swap
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                meta = self._read_meta()
+                if meta.get("fingerprint") != fingerprint:
+                    self._build(snapshot, fingerprint)
+                    meta = self._read_meta()
+                self._open(meta)
+
+    def _refresh_if_stale(self):
+        """Recheck sources after a catalog reload or every check interval, on a background thread"""
+        if self._rebuilding:
+            return
+        if (
+            get_catalog().snapshot().fingerprint == self._catalog_fingerprint
+            and time.monotonic() - self._checked_at < self.check_interval
+        ):
+            return
+        self._rebuilding = True
+
+        def rebuild():
+            try:
+                self.load()
+            except Exception as e:
+                logger.exception("Local KB rebuild failed: %s", e)
+            finally:
+                self._rebuilding = False
+
+        threading.Thread(target=rebuild, name="kb-index-rebuild", daemon=True).start()
+
+    # Query
+
+    def search(self, query: str, k: int = 3) -> List[Tuple[float, str]]:
+        """Top-k (score, passage) for a query, best first"""
+        if self._index is None:
+            self.load()
+        else:
+            self._refresh_if_stale()
+        # Everything below reads this one build, even if a rebuild swaps in another meanwhile
+        index = self._index
+        arrays = index.arrays
+        self.queries += 1
+        terms = arrays["terms"]
+        if not len(terms):
+            return []
+        scores = np.zeros(int(index.meta["passages"]), dtype=np.float32)
+        offsets, docs, weights = arrays["offsets"], arrays["docs"], arrays["weights"]
+        matched = False
+        for token in set(tokenize(query)):
+            position = int(np.searchsorted(terms, token))
+            if position < len(terms) and terms[position] == token:
+                start, end = offsets[position], offsets[position + 1]
+                # A term's postings hold each passage once, so fancy-index add is safe
+                scores[docs[start:end]] += weights[start:end]
+                matched = True
+        if not matched:
+            return []
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        text, text_offsets = arrays["text"], arrays["text_offsets"]
+        return [
+            (float(scores[doc]), bytes(text[text_offsets[doc]:text_offsets[doc + 1]]).decode("utf-8"))
+            for doc in top
+            if scores[doc] > 0
+        ]
+
+    def retrieve(self, query: str, k: int = 3) -> str:
+        """Context for the prompt, in the same shape as a Knowledge Base retrieval"""
+        return "\n\n".join(passage for _, passage in self.search(query, k))
+
+    def stats(self) -> Dict:
+        meta = self._index.meta if self._index is not None else {}
+        return {
+            "backend": "local",
+            "ready": self.ready,
+            "queries": self.queries,
+            "builds": self.builds,
+            "passages": meta.get("passages"),
+            "terms": meta.get("terms"),
+            "postings": meta.get("postings"),
+        }
+
+
+_local_kb: Optional[LocalKnowledgeBase] = None
+_local_kb_lock = threading.Lock()
+
+
+def get_local_kb() -> LocalKnowledgeBase:
+    """Process-wide local index; opened (or built) on first search"""
+    global _local_kb
+    if _local_kb is None:
+        with _local_kb_lock:
+            if _local_kb is None:
+                _local_kb = LocalKnowledgeBase(
+                    settings.kb_index_path,
+                    settings.kb_documents_dir,
+                    check_interval_seconds=settings.catalog_reload_interval_seconds,
+                )
+    return _local_kb
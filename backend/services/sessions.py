@@ -0,0 +1,170 @@
+"""
+Server-side chat sessions, so clients send only the new message.
+
+Each session keeps its latest ``max_messages`` messages in a ring buffer of
+``(role, content)`` tuples (the model only ever sees the last few), and
+sessions idle for ``ttl_seconds`` or beyond ``max_sessions`` are evicted in
+LRU order. Every turn is also appended to the transcript store, so a session
+this worker doesn't hold (evicted, or started on another worker) is rebuilt
+from the transcript tail.
+
+Session ids are issued and signed by the server (``services.auth``); an id the
+server didn't issue starts a new session. While ``SECRET_KEY`` is the shipped
+placeholder, signatures prove nothing, so an id is only continued if this
+worker holds the session or the transcripts have it.
+
+Responses carry the session's ``turn`` count, and every transcript row records
+the turn it belongs to. A client that sends the count back lets a worker detect
+that its cached copy missed turns served by another worker and reload the
+session. The transcript tail itself can be up to one writer batch behind, so a
+reload that finds fewer turns than the client has seen re-reads it for up to
+``stale_wait_seconds`` and then raises ``StaleSessionError`` rather than answer
+from a history with turns missing.
+"""
+import asyncio
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+from services.auth import new_session_id, session_id_valid
+from services.transcripts import TranscriptStore
+
+# Pause between transcript re-reads while a session's stored turns catch up
+REREAD_INTERVAL = 0.05
+
+
+class StaleSessionError(Exception):
+    """The stored history is still behind the turn the client has already seen"""
+
+
+class ChatSession:
+    """Bounded recent history for one conversation"""
+    __slots__ = ("session_id", "messages", "turn", "last_access")
+
+    def __init__(self, session_id: str, max_messages: int, messages: Iterable[Tuple[str, str]] = (), turn: int = 0):
+        self.session_id = session_id
+        self.messages: Deque[Tuple[str, str]] = deque(messages, maxlen=max_messages)
+        self.turn = turn
+        self.last_access = time.monotonic()
+
+    def history(self) -> List[Dict]:
+        return [{"role": role, "content": content} for role, content in self.messages]
+
+
+class SessionStore:
+    """Per-worker LRU of chat sessions with idle TTL, backed by the transcript store"""
+
+    def __init__(self, transcripts: TranscriptStore, max_messages: int = 8, ttl_seconds: float = 1800,
+                 max_sessions: int = 10000, stale_wait_seconds: float = 0.5):
+        self.transcripts = transcripts
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.stale_wait_seconds = stale_wait_seconds
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.created = 0
+        self.hydrated = 0
+        self.rejected = 0
+        self.stale_reloads = 0
+        self.stale_rereads = 0
+        self.stale_errors = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _expire(self, now: float):
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_access < self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            self.expired += 1
+
+    async def _read(self, session_id: str, turn: Optional[int]) -> Tuple[List[Tuple[str, str]], Optional[int]]:
+        """A session's stored messages and turn, re-read until they reach ``turn``"""
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.stale_wait_seconds
+        while True:
+            rows = await loop.run_in_executor(
+                None, self.transcripts.tail, f"chat:{session_id}", self.max_messages
+            )
+            messages = [(row["role"], row["content"]) for row in rows]
+            # Rows written before turns were recorded carry none; those trust the client
+            stored_turn = rows[-1].get("meta", {}).get("turn") if rows else 0
+            if turn is None or stored_turn is None or stored_turn >= turn:
+                return messages, stored_turn
+            if time.monotonic() >= deadline:
+                self.stale_errors += 1
+                raise StaleSessionError(f"session {session_id} is stored at turn {stored_turn}, client has seen {turn}")
+            self.stale_rereads += 1
+            await asyncio.sleep(REREAD_INTERVAL)
+
+    async def load(self, session_id: Optional[str], turn: Optional[int] = None, seed: Iterable[Tuple[str, str]] = ()) -> ChatSession:
+        """The session for a request, created (optionally seeded with client-sent history) if unknown"""
+        now = time.monotonic()
+        self._expire(now)
+        if session_id and not session_id_valid(session_id):
+            self.rejected += 1
+            session_id = None
+        session = self._sessions.get(session_id) if session_id else None
+        durable = self.transcripts.backend != "none"
+        if session is not None and (turn is None or turn == session.turn or not durable):
+            session.last_access = now
+            self._sessions.move_to_end(session_id)
+            return session
+        if session is not None:
+            self.stale_reloads += 1
+
+        messages: List[Tuple[str, str]] = []
+        stored_turn = None
+        if session_id and durable:
+            messages, stored_turn = await self._read(session_id, turn)
+        if messages:
+            self.hydrated += 1
+        elif session_id and not settings.secret_key_configured:
+            # Anyone can sign with the placeholder key: only continue sessions that exist
+            self.rejected += 1
+            session_id = None
+        if not session_id:
+            session_id = new_session_id()
+        if not messages:
+            messages = list(seed)
+            stored_turn = len(messages) // 2
+            self.created += 1
+        session = ChatSession(session_id, self.max_messages, messages, turn if stored_turn is None else stored_turn)
+
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def record(self, session: ChatSession, message: str, reply: str):
+        """Add a completed turn to the session and queue it for the transcript store"""
+        session.messages.append(("user", message))
+        session.messages.append(("assistant", reply))
+        session.turn += 1
+        session.last_access = time.monotonic()
+        transcript_id = f"chat:{session.session_id}"
+        meta = {"turn": session.turn}
+        self.transcripts.append(transcript_id, "user", message, meta=meta)
+        self.transcripts.append(transcript_id, "assistant", reply, meta=meta)
+
+    def stats(self) -> Dict:
+        return {
+            "sessions": len(self._sessions),
+            "max_messages": self.max_messages,
+            "ttl_seconds": self.ttl_seconds,
+            "created": self.created,
+            "hydrated": self.hydrated,
+            "rejected": self.rejected,
+            "stale_reloads": self.stale_reloads,
+            "stale_rereads": self.stale_rereads,
+            "stale_errors": self.stale_errors,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
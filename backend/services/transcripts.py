@@ -0,0 +1,240 @@
+"""
+Append-only conversation transcripts with a batched background writer.
+
+``append`` only puts the row on an in-memory queue, so WebSocket relays and
+chat requests never wait on disk. A writer thread wakes every
+``flush_interval_ms`` (or as soon as ``batch_size`` rows are pending) and
+commits everything queued in one transaction: one group commit per batch
+instead of one per message. The database runs in WAL mode with
+``synchronous=NORMAL``, so commits don't fsync; only WAL checkpoints do, and
+those happen on the writer thread too.
+
+If the writer falls ``max_pending`` rows behind, the oldest pending rows are
+dropped (and counted) rather than letting memory grow without bound.
+
+``tail`` reads a session's latest messages through an index on
+``(session_id, id)`` and adds rows this worker has queued but not yet
+committed, so a worker always sees its own writes. Every gunicorn worker on
+the host appends to the same SQLite file.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import settings
+from services.log import get_logger
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+logger = get_logger(__name__)
+
+# (session_id, ts, role, sender, content, meta)
+Row = Tuple[str, float, str, str, str, Optional[str]]
+
+
+def _as_message(row: Row) -> Dict:
+    session_id, ts, role, sender, content, meta = row
+    message = {"session_id": session_id, "ts": ts, "role": role, "sender": sender, "content": content}
+    if meta:
+        message["meta"] = json.loads(meta)
+    return message
+
+
+class TranscriptStore:
+    """Interface shared by transcript stores; this one keeps nothing"""
+    backend = "none"
+
+    def __init__(self):
+        self.appended = 0
+
+    def append(self, session_id: str, role: str, content: str, sender: str = "", meta: Optional[Dict] = None):
+        """Record one message without blocking"""
+        self.appended += 1
+
+    def tail(self, session_id: str, limit: int = 50) -> List[Dict]:
+        """A session's latest messages, oldest first (blocking; use an executor from async code)"""
+        return []
+
+    def flush(self, timeout: float = 5.0):
+        pass
+
+    def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend, "appended": self.appended}
+
+
+class SQLiteTranscriptStore(TranscriptStore):
+    """Transcripts in a local SQLite file, written in batches by a background thread"""
+    backend = "sqlite"
+
+    def __init__(self, path: str, batch_size: int = 512, flush_interval_ms: int = 50, max_pending: int = 100000):
+        super().__init__()
+        path = Path(path)
+        self.path = path if path.is_absolute() else BASE_DIR / path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_pending = max_pending
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._pending: Deque[Row] = deque(maxlen=max_pending)
+        self._wake = threading.Event()
+        self._flushed = threading.Condition()
+        self._written_seq = 0  # rows taken off the queue and committed (or failed)
+        self._queued_seq = 0
+        self._closed = False
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.max_batch = 0
+        self.commit_seconds = 0.0
+
+        self._read_lock = threading.Lock()
+        self._reader = self._connect()
+        self._reader.execute(
+            "CREATE TABLE IF NOT EXISTS transcripts ("
+            "id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, ts REAL NOT NULL, "
+            "role TEXT NOT NULL, sender TEXT NOT NULL, content TEXT NOT NULL, meta TEXT)"
+        )
+        self._reader.execute("CREATE INDEX IF NOT EXISTS transcripts_session ON transcripts (session_id, id)")
+        self._writer = threading.Thread(target=self._write_loop, name="transcript-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def append(self, session_id: str, role: str, content: str, sender: str = "", meta: Optional[Dict] = None):
+        if self._closed:
+            return
+        if len(self._pending) >= self.max_pending:
+            # deque(maxlen) discards the oldest row on append
+            self.dropped += 1
+        self._pending.append((
+            session_id, time.time(), role, sender, content,
+            json.dumps(meta, ensure_ascii=False) if meta else None,
+        ))
+        self.appended += 1
+        self._queued_seq += 1
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            closing = self._closed
+            while self._pending:
+                self._write_batch(conn)
+            if closing:
+                conn.close()
+                return
+
+    def _write_batch(self, conn: sqlite3.Connection):
+        # The queued count is read before draining, so waiters in flush() are
+        # never released for rows that are still queued
+        queued_seq = self._queued_seq
+        rows = []
+        while self._pending and len(rows) < self.batch_size:
+            rows.append(self._pending.popleft())
+        started = time.perf_counter()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO transcripts (session_id, ts, role, sender, content, meta) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+            self.written += len(rows)
+        except sqlite3.Error as e:
+            logger.error("Transcript batch failed: %s", e, extra={"rows": len(rows)})
+            self.failed += len(rows)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        self.commit_seconds += time.perf_counter() - started
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(rows))
+        if not self._pending:
+            with self._flushed:
+                self._written_seq = queued_seq
+                self._flushed.notify_all()
+
+    def tail(self, session_id: str, limit: int = 50) -> List[Dict]:
+        pending = [row for row in list(self._pending) if row[0] == session_id]
+        stored = []
+        if len(pending) < limit:
+            with self._read_lock:
+                stored = self._reader.execute(
+                    "SELECT session_id, ts, role, sender, content, meta FROM transcripts "
+                    "WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                    (session_id, limit - len(pending)),
+                ).fetchall()
+            stored.reverse()
+        return [_as_message(row) for row in (stored + pending)[-limit:]]
+
+    def flush(self, timeout: float = 5.0):
+        """Wait until everything appended so far is committed (shutdown, benchmarks)"""
+        target = self._queued_seq
+        self._wake.set()
+        with self._flushed:
+            self._flushed.wait_for(lambda: self._written_seq >= target or not self._writer.is_alive(), timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._writer.join(timeout=5)
+        with self._read_lock:
+            self._reader.close()
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "appended": self.appended,
+            "written": self.written,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "avg_batch": round(self.written / self.batches, 1) if self.batches else 0,
+            "max_batch": self.max_batch,
+            "avg_commit_ms": round(self.commit_seconds / self.batches * 1000, 3) if self.batches else 0,
+        }
+
+
+def create_transcript_store(backend: str, path: str) -> TranscriptStore:
+    """Build the store named by the TRANSCRIPT_BACKEND setting"""
+    backend = (backend or "none").lower()
+    if backend == "sqlite":
+        return SQLiteTranscriptStore(
+            path,
+            batch_size=settings.transcript_batch_size,
+            flush_interval_ms=settings.transcript_flush_interval_ms,
+            max_pending=settings.transcript_max_pending,
+        )
+    if backend == "none":
+        return TranscriptStore()
+    raise ValueError(f"Unknown transcript backend: {backend!r}")
+
+
+_store: Optional[TranscriptStore] = None
+_store_lock = threading.Lock()
+
+
+def get_transcript_store() -> TranscriptStore:
+    """Process-wide transcript store, created on first use"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_transcript_store(settings.transcript_backend, settings.transcript_path)
+    return _store
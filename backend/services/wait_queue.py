@@ -0,0 +1,119 @@
+"""
+Priority wait queue for customers waiting on a live agent.
+
+Each waiting customer gets a static key: the time they started waiting minus
+their priority class's head start (seconds). The smallest key is served
+first, so a higher class jumps ahead of recent arrivals, but anyone who has
+waited longer than that head start still goes before it: waiting ages every
+customer at the same rate and nobody starves. Because keys never change,
+the order is a plain min-heap; ties go to whoever was queued first.
+
+- push: O(log n)
+- pop (next customer to serve): O(log n) amortized
+- remove (disconnect, claim of a specific customer): O(1), with a lazy
+  tombstone in the heap that is compacted once tombstones outnumber entries
+- iteration in service order (queue snapshots): sorted once, cached until
+  the next change
+"""
+import heapq
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+# Messages kept per waiting customer until an agent picks them up
+MAX_BACKLOG = 20
+
+
+@dataclass
+class WaitEntry:
+    customer_id: str
+    priority: str
+    key: float
+    seq: int
+    since: float  # when this wait started (wall clock of the event that queued it)
+    backlog: Deque[Dict] = field(default_factory=lambda: deque(maxlen=MAX_BACKLOG))
+
+
+class WaitQueue:
+    """Waiting customers ordered by (key, seq), indexed by customer id"""
+
+    def __init__(self):
+        self._entries: Dict[str, WaitEntry] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = 0
+        self._order: Optional[List[str]] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, customer_id: str) -> bool:
+        return customer_id in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        """Customer ids in service order"""
+        if self._order is None:
+            self._order = [
+                entry.customer_id
+                for entry in sorted(self._entries.values(), key=lambda entry: (entry.key, entry.seq))
+            ]
+        return iter(self._order)
+
+    def get(self, customer_id: str) -> Optional[WaitEntry]:
+        return self._entries.get(customer_id)
+
+    def values(self):
+        return self._entries.values()
+
+    def push(self, customer_id: str, priority: str, key: float, since: float, backlog=()) -> WaitEntry:
+        if customer_id in self._entries:
+            self.remove(customer_id)
+        self._seq += 1
+        entry = WaitEntry(customer_id, priority, key, self._seq, since, deque(backlog, maxlen=MAX_BACKLOG))
+        self._entries[customer_id] = entry
+        heapq.heappush(self._heap, (key, self._seq, customer_id))
+        self._order = None
+        return entry
+
+    def _live(self, item: Tuple[float, int, str]) -> bool:
+        entry = self._entries.get(item[2])
+        return entry is not None and entry.seq == item[1]
+
+    def peek(self) -> Optional[str]:
+        while self._heap and not self._live(self._heap[0]):
+            heapq.heappop(self._heap)
+        return self._heap[0][2] if self._heap else None
+
+    def pop(self) -> Optional[WaitEntry]:
+        customer_id = self.peek()
+        if customer_id is None:
+            return None
+        heapq.heappop(self._heap)
+        self._order = None
+        return self._entries.pop(customer_id)
+
+    def remove(self, customer_id: str) -> Optional[WaitEntry]:
+        entry = self._entries.pop(customer_id, None)
+        if entry is None:
+            return None
+        self._order = None
+        if len(self._heap) > 2 * len(self._entries) + 16:
+            self._heap = [item for item in self._heap if self._live(item)]
+            heapq.heapify(self._heap)
+        return entry
+
+    def snapshot(self) -> List[List]:
+        return [
+            [entry.customer_id, list(entry.backlog), entry.priority, entry.key, entry.since, entry.seq]
+            for entry in sorted(self._entries.values(), key=lambda entry: entry.seq)
+        ]
+
+    @classmethod
+    def restore(cls, rows: List[List]) -> "WaitQueue":
+        queue = cls()
+        for customer_id, backlog, priority, key, since, seq in rows:
+            entry = WaitEntry(customer_id, priority, key, seq, since, deque(backlog, maxlen=MAX_BACKLOG))
+            queue._entries[customer_id] = entry
+            queue._heap.append((key, seq, customer_id))
+            queue._seq = max(queue._seq, seq)
+        heapq.heapify(queue._heap)
+        return queue
@@ -23,6 +23,9 @@ if [ ! -f ".env" ]; then
     exit 1
 fi
 
+# Workers share agent/customer WebSocket state over a local Unix socket bus
+export AGENT_BUS_BACKEND=${AGENT_BUS_BACKEND:-unix}
+
 # Run with gunicorn for production
 echo "Starting server with Gunicorn..."
 gunicorn main:app \
@@ -0,0 +1,20 @@
+"""
+Shared test setup: run from the backend directory with ``python -m pytest``.
+
+Settings are read once at import, so the environment is pinned here before any
+app module loads: the in-process Bedrock stub instead of AWS, no transcript
+database, no metrics files and quiet logs.
+"""
+import os
+import sys
+from pathlib import Path
+
+os.environ.update(
+    BEDROCK_STUB="true",
+    TRANSCRIPT_BACKEND="none",
+    METRICS_DIR="",
+    LOG_LEVEL="WARNING",
+    RESPONSE_CACHE_BACKEND="none",
+    KB_CACHE_BACKEND="memory",
+)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
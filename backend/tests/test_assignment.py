@@ -0,0 +1,120 @@
+"""AssignmentEngine routing, claims and replication"""
+from services.assignment import PAIR_HOLD_SECONDS, AssignmentEngine
+
+PRIORITIES = {"standard": 0.0, "vip": 180.0}
+
+
+def engine(**kwargs) -> AssignmentEngine:
+    kwargs.setdefault("priorities", PRIORITIES)
+    return AssignmentEngine(**kwargs)
+
+
+def test_routes_to_least_loaded_agent_in_priority_order():
+    e = engine(capacity=2)
+    e.tick(1000.0)
+    for customer_id, priority in (("c1", None), ("c2", None), ("c3", "vip"), ("c4", "unknown")):
+        assert e.add_customer(customer_id, "w1", priority) == []
+    assert list(e.waiting) == ["c3", "c1", "c2", "c4"]
+    assert e.customer_priority["c4"] == "standard"
+
+    made = e.add_agent("a1", "w1") + e.add_agent("a2", "w1")
+    assert [(a.customer_id, a.agent_id) for a in made] == [("c3", "a1"), ("c1", "a1"), ("c2", "a2"), ("c4", "a2")]
+    assert e.least_loaded_agent() is None
+
+
+def test_backlog_is_handed_over_and_release_requeues_at_the_front():
+    e = engine(capacity=1, auto_assign=False)
+    e.tick(1000.0)
+    e.add_agent("a1", "w1")
+    e.add_customer("c1", "w1")
+    e.tick(1001.0)
+    e.add_customer("c2", "w1")
+    assert e.customer_message("c2", {"content": "hello"}) is None
+
+    assignment, reason = e.claim("a1", "c2")
+    assert reason == "" and assignment.backlog == [{"content": "hello"}]
+    assert e.claim("a1", "c1") == (None, "at_capacity")
+    assert e.claim("a1", "c2") == (None, "already_yours")
+    assert e.customer_message("c2", {"content": "again"}) == "a1"
+
+    e.tick(2000.0)
+    e.add_customer("c3", "w1")
+    e.release("a1", "c2")
+    # c2 keeps the key from its first connect: behind c1, ahead of c3
+    assert list(e.waiting) == ["c1", "c2", "c3"]
+
+
+def test_remove_agent_requeues_its_customers():
+    e = engine(capacity=1)
+    e.add_agent("a1", "w1")
+    e.add_customer("c1", "w1")
+    assert e.assignments == {"c1": "a1"}
+    assert e.remove_agent("a1") == []
+    assert list(e.waiting) == ["c1"]
+    assert [(a.customer_id, a.agent_id) for a in e.add_agent("a2", "w2")] == [("c1", "a2")]
+
+
+def test_sync_worker_restores_places_and_assignments():
+    source = engine(capacity=1)
+    source.tick(1000.0)
+    source.add_agent("a1", "w1")
+    for customer_id, priority in (("c1", None), ("c2", None), ("c3", "vip")):
+        source.tick(source.now + 1)
+        source.add_customer(customer_id, "w1", priority)
+    rows = source.describe_customers(["c1", "c2", "c3"])
+
+    e = engine(capacity=1)
+    e.tick(5000.0)
+    e.add_customer("other", "w2")
+    assert e.sync_worker("w1", ["a1"], rows, dict(source.assignments)) == []
+    assert e.assignments == {"c1": "a1"}
+    assert list(e.waiting) == ["c3", "c2", "other"]
+    assert e.customer_priority["c3"] == "vip"
+
+
+def test_sync_worker_holds_a_customer_for_its_agents_worker():
+    e = engine()
+    e.tick(1000.0)
+    # w1 rejoins first: its customer was with a2, whose worker hasn't rejoined yet
+    e.sync_worker("w1", ["a1"], [["c1", "standard", 900.0, None]], {"c1": "a2"})
+    assert "c1" in e.waiting and e.held["c1"][0] == "a2"
+    assert e.load("a1") == 0
+    assert e.sync_worker("w2", ["a2"], [], {"c1": "a2"}) == []
+    assert e.assignments == {"c1": "a2"} and e.held == {}
+
+
+def test_held_customer_is_routed_once_the_hold_lapses():
+    e = engine()
+    e.tick(1000.0)
+    e.sync_worker("w1", ["a1"], [["c1", "standard", 900.0, None]], {"c1": "gone"})
+    e.tick(1000.0 + PAIR_HOLD_SECONDS)
+    assert [(a.customer_id, a.agent_id) for a in e.route()] == [("c1", "a1")]
+    assert e.held == {}
+
+
+def test_snapshot_restore_round_trip():
+    e = engine(capacity=1)
+    e.tick(1000.0)
+    e.add_agent("a1", "w1")
+    e.add_agent("a2", "w2")
+    for customer_id in ("c1", "c2", "c3", "c4"):
+        e.add_customer(customer_id, "w1")
+    replica = engine(capacity=1)
+    replica.restore(e.snapshot())
+    assert replica.snapshot() == e.snapshot()
+    # Both replicas make the same next decision
+    assert e.remove_customer("c1")[2][0].customer_id == replica.remove_customer("c1")[2][0].customer_id == "c3"
+
+
+def test_forget_worker_drops_its_connections():
+    e = engine(capacity=1)
+    e.add_agent("a1", "w1")
+    e.add_agent("a2", "w2")
+    e.add_customer("c1", "w1")
+    e.add_customer("c2", "w2")
+    e.add_customer("c3", "w2")
+    removed, made = e.forget_worker("w1")
+    # a1 goes first, so its customer is back in the queue when it is dropped
+    assert removed == [("c1", True, None)]
+    assert "a1" not in e.agents and e.assignments == {"c2": "a2"}
+    assert made == [] and list(e.waiting) == ["c3"]
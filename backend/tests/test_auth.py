@@ -0,0 +1,53 @@
+"""Signed customer priority tokens"""
+import pytest
+
+from config import settings
+from services.auth import priority_from_token, sign_priority
+
+
+@pytest.fixture(autouse=True)
+def secret_key(monkeypatch):
+    monkeypatch.setattr(settings, "secret_key", "test-secret")
+
+
+def test_valid_token_grants_its_class():
+    assert priority_from_token("C1", sign_priority("C1", "vip")) == "vip"
+
+
+def test_missing_or_unsigned_class_is_rejected():
+    assert priority_from_token("C1", None) is None
+    assert priority_from_token("C1", "vip") is None
+    assert priority_from_token("C1", "vip.9999999999.deadbeef") is None
+    assert priority_from_token("C1", "vip.9999999999.déadbeef") is None
+
+
+def test_token_is_bound_to_customer_class_and_expiry():
+    token = sign_priority("C1", "priority")
+    assert priority_from_token("C2", token) is None
+    _, expires_at, signature = token.split(".")
+    assert priority_from_token("C1", f"vip.{expires_at}.{signature}") is None
+    assert priority_from_token("C1", f"priority.{int(expires_at) + 60}.{signature}") is None
+    assert priority_from_token("C1", sign_priority("C1", "vip", ttl_seconds=-1)) is None
+
+
+def test_placeholder_secret_refuses_every_token(monkeypatch):
+    monkeypatch.setattr(settings, "secret_key", "your-secret-key-change-in-production")
+    assert priority_from_token("C1", sign_priority("C1", "vip")) is None
+
+
+def test_transcripts_need_the_agent_key(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from main import app
+
+    path = "/api/agent/transcripts/customer-1"
+    with TestClient(app) as client:
+        monkeypatch.setattr(settings, "api_key", "")
+        assert client.get(path, headers={"X-API-Key": ""}).status_code == 403
+        monkeypatch.setattr(settings, "api_key", "agent-secret")
+        assert client.get(path).status_code == 401
+        assert client.get(path, headers={"X-API-Key": "wrong"}).status_code == 401
+        assert client.get(path, headers={"X-API-Key": "wrông".encode("latin-1")}).status_code == 401
+        response = client.get(path, headers={"X-API-Key": "agent-secret"})
+        assert response.status_code == 200
+        assert response.json() == {"customer_id": "customer-1", "messages": []}
@@ -0,0 +1,159 @@
+"""Hub failover on the Unix socket bus keeps assignments, queue order and priority classes"""
+import asyncio
+
+import pytest
+
+from routers.agent import ConnectionManager
+from services.bus import BusPublishError, UnixSocketBus
+from services.transcripts import TranscriptStore
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        self.sent.append(text)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+def make_manager(path, worker: str, capacity: int = 5) -> ConnectionManager:
+    bus = UnixSocketBus(str(path), publish_timeout=1.0)
+    # All workers share this process (and its pid) here
+    bus.worker_id = worker
+    manager = ConnectionManager(bus, TranscriptStore())
+    manager.engine.capacity = capacity
+    return manager
+
+
+async def until(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "replicas did not converge"
+        await asyncio.sleep(0.01)
+
+
+async def fail_over(hub: ConnectionManager, workers):
+    """Kill the hub and wait until the survivors agree on a state that includes all their sockets"""
+    await hub.stop()
+
+    def converged():
+        if sorted(m.bus.role for m in workers) != ["client", "hub"]:
+            return False
+        states = [m.engine.snapshot() for m in workers]
+        agents = {a for m in workers for a in m.active_agents}
+        customers = {c for m in workers for c in m.active_customers}
+        return all(
+            set(s["agents"]) == agents and set(s["customers"]) == customers
+            and s["assignments"] == states[0]["assignments"] and s["waiting"] == states[0]["waiting"]
+            for s in states
+        )
+
+    await until(converged)
+
+
+def test_failover_keeps_cross_worker_assignment(tmp_path):
+    async def scenario():
+        hub, w2, w3 = (make_manager(tmp_path / "bus.sock", name) for name in ("w1", "w2", "w3"))
+        for manager in (hub, w2, w3):
+            await manager.start()
+        assert hub.bus.role == "hub"
+
+        await w3.connect_agent("A2", FakeWebSocket())
+        await w2.connect_customer("C1", FakeWebSocket())
+        await w2.connect_agent("A1", FakeWebSocket())
+        await until(lambda: w3.engine.assignments == {"C1": "A2"} and "A1" in w3.engine.agents)
+
+        await fail_over(hub, [w2, w3])
+        for manager in (w2, w3):
+            # C1 stays with A2 whichever survivor became the hub, even though A1 is free
+            assert manager.engine.assignments == {"C1": "A2"}
+            assert manager.engine.load("A1") == 0
+        for manager in (w2, w3):
+            await manager.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failover_keeps_queue_order_and_priority(tmp_path):
+    async def scenario():
+        hub, w2, w3 = (make_manager(tmp_path / "bus.sock", name, capacity=1) for name in ("w1", "w2", "w3"))
+        for manager in (hub, w2, w3):
+            await manager.start()
+
+        await w2.connect_agent("A1", FakeWebSocket())
+        await w3.connect_agent("A2", FakeWebSocket())
+        await w2.connect_customer("C1", FakeWebSocket())
+        await w3.connect_customer("C2", FakeWebSocket())
+        await w3.connect_customer("C3", FakeWebSocket())
+        await w2.connect_customer("C4", FakeWebSocket(), "vip")
+        await w3.connect_customer("C5", FakeWebSocket())
+        await until(lambda: len(w2.engine.waiting) == 3 and len(w3.engine.waiting) == 3)
+        assignments = dict(w2.engine.assignments)
+        order = list(w2.engine.waiting)
+        assert order == ["C4", "C3", "C5"]
+        assert set(assignments) == {"C1", "C2"}
+
+        await fail_over(hub, [w2, w3])
+        for manager in (w2, w3):
+            assert manager.engine.assignments == assignments
+            assert list(manager.engine.waiting) == order
+            assert manager.engine.customer_priority["C4"] == "vip"
+        for manager in (w2, w3):
+            await manager.stop()
+
+    asyncio.run(scenario())
+
+
+def test_hub_dying_mid_snapshot_triggers_re_election(tmp_path):
+    async def scenario():
+        import fcntl
+        import os
+
+        path = tmp_path / "bus.sock"
+        lock_fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+        async def dying_hub(reader, writer):
+            # Half a snapshot, then the hub goes away and releases its lock
+            writer.write(b'{"seq": 7, "sta')
+            await writer.drain()
+            writer.close()
+            os.close(lock_fd)
+
+        server = await asyncio.start_unix_server(dying_hub, path=str(path))
+        worker = make_manager(path, "w1")
+        await asyncio.wait_for(worker.start(), timeout=5)
+        server.close()
+        assert worker.bus.role == "hub"
+        await worker.stop()
+
+    asyncio.run(scenario())
+
+
+def test_unconfirmed_publish_is_reported_and_not_replayed(tmp_path):
+    async def scenario():
+        bus = UnixSocketBus(str(tmp_path / "bus.sock"), publish_timeout=0.05)
+        bus.role = "rejoining"  # no hub connection: the frame waits in the outbox
+        with pytest.raises(BusPublishError):
+            await bus.publish({"op": "customer_message", "customer_id": "C1"})
+        assert bus._outbox == [] and bus.stats()["unconfirmed"] == 1
+
+        class Channel:
+            def __init__(self):
+                self.sent = []
+
+            def send(self, message, coalesce_key=None):
+                self.sent.append(message)
+
+        manager = ConnectionManager(bus, TranscriptStore())
+        channel = Channel()
+        assert not await manager.relay(channel, {"op": "claim", "agent_id": "A1", "customer_id": "C1"})
+        assert channel.sent == [{"type": "error", "customer_id": "C1", "reason": "not_delivered", "op": "claim"}]
+
+    asyncio.run(scenario())
@@ -0,0 +1,15 @@
+"""Services are built by the app lifespan, not at import, and shut down when it exits"""
+from fastapi.testclient import TestClient
+
+
+def test_services_live_only_inside_the_lifespan():
+    from main import app
+
+    with TestClient(app) as client:
+        service = app.state.chatbot
+        assert service.wait_ready(10)
+        assert client.get("/api/ready").status_code == 200
+        assert app.state.agents.bus.stats()["backend"]
+    assert service.bedrock_executor._shutdown
+    with TestClient(app):
+        assert app.state.chatbot is not service
@@ -0,0 +1,30 @@
+"""OutboundChannel closing its socket when a send fails"""
+import asyncio
+
+from services.outbound import SEND_FAILED_CLOSE_CODE, OutboundChannel
+
+
+class BrokenSocket:
+    def __init__(self):
+        self.closed_with = []
+
+    async def send_text(self, text):
+        raise RuntimeError("connection reset")
+
+    async def close(self, code=1000, reason=""):
+        self.closed_with.append(code)
+
+
+def test_failed_send_closes_the_socket_once():
+    async def scenario():
+        socket = BrokenSocket()
+        closed = []
+        channel = OutboundChannel(socket, "test", on_close=closed.append)
+        assert channel.send({"type": "hello"})
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert channel.closed and closed == [channel]
+        assert socket.closed_with == [SEND_FAILED_CLOSE_CODE]
+        assert not channel.send({"type": "again"})
+
+    asyncio.run(scenario())
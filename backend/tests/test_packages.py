@@ -0,0 +1,82 @@
+"""/api/packages cursors and ETags across workers and catalog reloads"""
+import base64
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+import routers.packages as packages
+from main import app
+from services.catalog import PackageCatalog
+
+DATA = Path(__file__).resolve().parent.parent / "data" / "packages.json"
+
+
+@pytest.fixture
+def catalogs(tmp_path, monkeypatch):
+    """Two workers' catalogs over the same file; the second has reloaded it, so its version differs"""
+    path = tmp_path / "packages.json"
+    shutil.copy(DATA, path)
+    first, second = PackageCatalog(str(path)), PackageCatalog(str(path))
+    second.reload()
+    assert first.snapshot().version != second.snapshot().version
+    serving = {"catalog": first}
+    monkeypatch.setattr(packages, "get_catalog", lambda: serving["catalog"])
+
+    def use(catalog):
+        serving["catalog"] = catalog
+        packages.response_cache.clear()
+
+    use(first)
+    yield path, first, second, use
+    packages.response_cache.clear()
+
+
+def cursor(fingerprint: str, position, package_id) -> str:
+    raw = json.dumps({"v": fingerprint, "p": position, "id": package_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def test_etag_and_cursor_match_across_workers(catalogs):
+    _, first, second, use = catalogs
+    client = TestClient(app)
+    page = client.get("/api/packages?limit=2")
+    body = page.json()
+    assert body["catalog_version"] == first.snapshot().fingerprint
+    assert [p["id"] for p in body["packages"]] == [p.id for p in first.snapshot().packages[:2]]
+
+    use(second)
+    again = client.get("/api/packages?limit=2")
+    assert again.headers["etag"] == page.headers["etag"]
+    assert client.get("/api/packages?limit=2", headers={"If-None-Match": page.headers["etag"]}).status_code == 304
+    following = client.get(f"/api/packages?limit=2&cursor={body['next_cursor']}").json()
+    assert [p["id"] for p in following["packages"]] == [p.id for p in first.snapshot().packages[2:4]]
+
+
+def test_cursor_position_must_match_its_package(catalogs):
+    _, first, _, _ = catalogs
+    client = TestClient(app)
+    snapshot = first.snapshot()
+    # A forged position is ignored in favour of the package id it names
+    forged = cursor(snapshot.fingerprint, 0, snapshot.packages[2].id)
+    page = client.get(f"/api/packages?limit=2&cursor={forged}").json()
+    assert [p["id"] for p in page["packages"]] == [p.id for p in snapshot.packages[3:5]]
+    assert client.get(f"/api/packages?cursor={cursor(snapshot.fingerprint, 10**6, 'nope')}").status_code == 400
+    assert client.get(f"/api/packages?cursor={cursor(snapshot.fingerprint, 'x', [])}").status_code == 400
+    assert client.get("/api/packages?cursor=not-base64!").status_code == 400
+
+
+def test_cursor_survives_a_catalog_change(catalogs):
+    path, first, _, use = catalogs
+    client = TestClient(app)
+    body = client.get("/api/packages?limit=2").json()
+    rows = json.loads(path.read_text())
+    del rows[0]
+    path.write_text(json.dumps(rows))
+    first.reload()
+    use(first)
+    after = client.get(f"/api/packages?limit=2&cursor={body['next_cursor']}").json()
+    assert after["catalog_version"] != body["catalog_version"]
+    assert [p["id"] for p in after["packages"]] == [row["id"] for row in rows[1:3]]
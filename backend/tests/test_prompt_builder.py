@@ -0,0 +1,20 @@
+"""PromptBuilder history fitting and reply limits"""
+from services.prompt_builder import PromptBuilder
+
+
+def test_empty_history_entry_does_not_drop_older_turns():
+    builder = PromptBuilder(history_messages=6)
+    history = [
+        {"role": "user", "content": "Kerala trips?"},
+        {"role": "assistant", "content": "Here are three."},
+        {"role": "user", "content": "Cheaper ones?"},
+        {"role": "assistant", "content": ""},
+    ]
+    turns, dropped = builder._fit_history(history, 1000)
+    assert [t["content"] for t in turns] == ["Kerala trips?", "Here are three."]
+    assert dropped == 0
+
+
+def test_default_reply_limit():
+    plan = PromptBuilder().build("Hello", [], "", [])
+    assert plan.body["max_tokens"] == 500
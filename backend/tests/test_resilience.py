@@ -0,0 +1,102 @@
+"""CircuitBreaker state changes, hedged calls and stage budgets"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.resilience import CircuitBreaker, CircuitOpenError, HedgeStats, hedged_call
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+def test_opens_at_the_failure_rate_and_short_circuits():
+    breaker = CircuitBreaker("test", failure_rate=0.5, window=4, min_calls=4, open_seconds=60)
+    breaker.call(lambda: 1)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            breaker.call(fail)
+    assert breaker.state == "closed"  # fewer than min_calls so far
+    with pytest.raises(RuntimeError):
+        breaker.call(fail)
+    assert breaker.state == "open" and breaker.opened == 1
+    called = []
+    with pytest.raises(CircuitOpenError):
+        breaker.call(called.append, 1)
+    assert called == [] and breaker.stats()["short_circuited"] == 1
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("test", failure_rate=0.5, window=2, min_calls=2, open_seconds=0.05)
+    for _ in range(2):
+        breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()  # only one probe at a time
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opened == 2
+
+    time.sleep(0.06)
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+    assert breaker.stats()["window_calls"] == 1
+
+
+def test_hedge_wins_when_the_first_call_is_slow():
+    calls = []
+    first_started = threading.Event()
+
+    def call():
+        calls.append(None)
+        if len(calls) == 1:
+            first_started.set()
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    stats = HedgeStats()
+    with ThreadPoolExecutor(2) as executor:
+        assert hedged_call(executor, call, 0.02, stats) == "fast"
+    assert stats.stats() == {"calls": 1, "hedged": 1, "hedge_wins": 1}
+
+
+def test_no_hedge_for_a_fast_call_and_errors_propagate():
+    stats = HedgeStats()
+    with ThreadPoolExecutor(2) as executor:
+        assert hedged_call(executor, lambda: 42, 1.0, stats) == 42
+        with pytest.raises(RuntimeError):
+            hedged_call(executor, fail, 0.01, stats)
+    assert stats.stats() == {"calls": 2, "hedged": 1, "hedge_wins": 0}
+
+
+@pytest.mark.parametrize("budget", [0.5, 1.5, 12.0, 60.0])
+def test_bedrock_call_limits_fit_the_stage_budget(budget):
+    from services.chatbot_service import bedrock_call_limits
+
+    limits = bedrock_call_limits(budget)
+    attempts = limits["retries"]["total_max_attempts"]
+    assert attempts >= 1
+    assert attempts * (limits["connect_timeout"] + limits["read_timeout"]) <= budget
+
+
+def test_cancelled_stage_does_not_fail_the_graph():
+    import asyncio
+
+    from services.pipeline import Stage, StageGraph
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def main():
+        graph = StageGraph([
+            Stage("kb", slow),
+            Stage("reply", lambda: tasks["kb"].cancel() and "templated"),
+        ])
+        tasks = graph.start()
+        return await graph.gather(tasks)
+
+    assert asyncio.run(main()) == {"kb": None, "reply": "templated"}
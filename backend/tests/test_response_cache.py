@@ -0,0 +1,33 @@
+"""Response cache I/O stays off the event loop for the SQLite backend"""
+import asyncio
+import threading
+
+from services.cache import SQLiteCache
+from services.chatbot_service import ChatbotService
+
+
+class RecordingCache(SQLiteCache):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.current_thread())
+        return super().get(key)
+
+    def set(self, key, value, ttl_seconds=None):
+        self.threads.append(threading.current_thread())
+        super().set(key, value, ttl_seconds)
+
+
+def test_sqlite_response_cache_runs_on_an_executor(tmp_path):
+    async def scenario():
+        service = ChatbotService()
+        service.response_cache = cache = RecordingCache(str(tmp_path / "cache.db"), "chat_responses", 60, 10, 0)
+        first = await service.process_message("Hello there", [])
+        assert await service.process_message("hello there!", []) == first
+        assert cache.hits == 1 and len(cache.threads) == 3
+        assert threading.main_thread() not in cache.threads
+        service.bedrock_executor.shutdown()
+
+    asyncio.run(scenario())
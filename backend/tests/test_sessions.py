@@ -0,0 +1,139 @@
+"""SessionStore eviction and reloads, and server-side history through /api/chat on the Bedrock stub"""
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from config import settings
+from services.auth import new_session_id
+from services.sessions import SessionStore, StaleSessionError
+from services.transcripts import SQLiteTranscriptStore, TranscriptStore
+
+
+def test_keeps_recent_messages_and_evicts_least_recently_used():
+    async def scenario():
+        store = SessionStore(TranscriptStore(), max_messages=4, max_sessions=2)
+        first = await store.load(None)
+        for i in range(3):
+            store.record(first, f"q{i}", f"a{i}")
+        assert first.turn == 3
+        assert [m["content"] for m in first.history()] == ["q1", "a1", "q2", "a2"]
+
+        second = await store.load(None)
+        assert await store.load(first.session_id, first.turn) is first  # now most recent
+        await store.load(None)
+        assert len(store) == 2 and store.evicted == 1
+        assert second.session_id not in store._sessions
+
+    asyncio.run(scenario())
+
+
+def test_idle_sessions_expire():
+    async def scenario():
+        store = SessionStore(TranscriptStore(), ttl_seconds=60)
+        session = await store.load(None, seed=[("user", "hi"), ("assistant", "hello")])
+        assert session.turn == 1 and store.created == 1
+        session.last_access = time.monotonic() - 61
+        await store.load(None)
+        assert store.expired == 1 and session.session_id not in store._sessions
+
+    asyncio.run(scenario())
+
+
+def test_reloads_from_transcripts_when_evicted_or_behind(tmp_path):
+    async def scenario():
+        transcripts = SQLiteTranscriptStore(str(tmp_path / "transcripts.db"))
+        try:
+            worker_a = SessionStore(transcripts, max_messages=4)
+            worker_b = SessionStore(transcripts, max_messages=4)
+            session = await worker_a.load(None)
+            worker_a.record(session, "q0", "a0")
+            transcripts.flush()
+
+            # Another worker has never seen the session: rebuilt from the transcript tail
+            on_b = await worker_b.load(session.session_id, session.turn)
+            assert [m["content"] for m in on_b.history()] == ["q0", "a0"]
+            assert worker_b.hydrated == 1
+
+            worker_b.record(on_b, "q1", "a1")
+            transcripts.flush()
+            # Worker A's copy missed that turn: the client's turn count gives it away
+            reloaded = await worker_a.load(session.session_id, on_b.turn)
+            assert worker_a.stale_reloads == 1
+            assert [m["content"] for m in reloaded.history()] == ["q0", "a0", "q1", "a1"]
+        finally:
+            transcripts.close()
+
+    asyncio.run(scenario())
+
+
+def test_only_issued_ids_are_continued(monkeypatch):
+    async def scenario():
+        store = SessionStore(TranscriptStore())
+        assert (await store.load("abc-é")).session_id != "abc-é"
+        made_up = await store.load("my-own-id", 3)
+        assert made_up.session_id != "my-own-id" and made_up.turn == 0
+        # With the placeholder secret a correctly signed id must also exist
+        unknown = await store.load(new_session_id(), 3)
+        assert unknown.turn == 0 and store.rejected == 3
+
+        monkeypatch.setattr(settings, "secret_key", "test-secret")
+        issued = new_session_id()
+        assert (await store.load(issued)).session_id == issued
+
+    asyncio.run(scenario())
+
+
+def test_transcript_behind_the_client_is_rejected(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "transcripts.db")
+        on_a = SQLiteTranscriptStore(path, flush_interval_ms=60000)
+        on_b = SQLiteTranscriptStore(path)
+        try:
+            worker_a = SessionStore(on_a)
+            worker_b = SessionStore(on_b, stale_wait_seconds=0.1)
+            session = await worker_a.load(None)
+            worker_a.record(session, "q0", "a0")
+            on_a.flush()
+            # Still queued on worker A, so worker B's tail is one turn short of the client
+            worker_a.record(session, "q1", "a1")
+            with pytest.raises(StaleSessionError):
+                await worker_b.load(session.session_id, session.turn)
+            assert worker_b.stale_errors == 1 and worker_b.stale_rereads >= 1
+
+            on_a.flush()
+            reloaded = await worker_b.load(session.session_id, session.turn)
+            assert reloaded.turn == 2 and len(reloaded.history()) == 4
+        finally:
+            on_a.close()
+            on_b.close()
+
+    asyncio.run(scenario())
+
+
+def test_session_reads_need_the_agent_key(monkeypatch):
+    from main import app
+
+    monkeypatch.setattr(settings, "api_key", "agent-secret")
+    path = f"/api/chat/sessions/{new_session_id()}"
+    with TestClient(app) as client:
+        assert client.get(path).status_code == 401
+        assert client.get(path, headers={"X-API-Key": "agent-secret"}).status_code == 200
+
+
+def test_chat_keeps_history_server_side():
+    from main import app
+
+    with TestClient(app) as client:
+        chatbot_service = app.state.chatbot
+        assert chatbot_service.wait_ready(10)
+        assert chatbot_service.aws_enabled  # the in-process stub
+        first = client.post("/api/chat", json={"message": "Show me packages for Kerala"}).json()
+        assert first["turn"] == 1 and first["message"]
+        second = client.post("/api/chat", json={
+            "message": "What about Ladakh?", "sessionId": first["sessionId"], "turn": first["turn"],
+        }).json()
+        assert second["sessionId"] == first["sessionId"] and second["turn"] == 2
+        assert client.post("/api/chat/stream", json={"message": "Hi", "sessionId": "abc-é"}).status_code == 422
+        assert client.get("/api/ready").status_code == 200
@@ -0,0 +1,43 @@
+"""WaitQueue ordering, removal and snapshots"""
+from services.wait_queue import MAX_BACKLOG, WaitQueue
+
+
+def test_serves_smallest_key_then_first_queued():
+    queue = WaitQueue()
+    queue.push("late", "standard", key=100.0, since=100.0)
+    queue.push("vip", "vip", key=100.0 - 180, since=110.0)
+    queue.push("early", "standard", key=50.0, since=50.0)
+    queue.push("tie", "standard", key=50.0, since=50.0)
+    assert list(queue) == ["vip", "early", "tie", "late"]
+    assert [queue.pop().customer_id for _ in range(4)] == ["vip", "early", "tie", "late"]
+    assert queue.pop() is None and len(queue) == 0
+
+
+def test_remove_and_requeue():
+    queue = WaitQueue()
+    for i in range(50):
+        queue.push(f"c{i}", "standard", key=float(i), since=float(i))
+    for i in range(0, 50, 2):
+        assert queue.remove(f"c{i}").customer_id == f"c{i}"
+    assert queue.remove("c0") is None
+    assert "c0" not in queue and "c1" in queue
+    assert queue.peek() == "c1"
+    # Pushing again replaces the entry rather than duplicating it
+    queue.push("c1", "standard", key=99.0, since=1.0)
+    assert len(queue) == 25
+    assert list(queue)[-1] == "c1"
+    assert queue.peek() == "c3"
+
+
+def test_snapshot_round_trip_keeps_order_and_backlog():
+    queue = WaitQueue()
+    queue.push("a", "standard", key=10.0, since=10.0, backlog=[{"content": str(i)} for i in range(MAX_BACKLOG + 5)])
+    queue.push("b", "vip", key=-170.0, since=10.0)
+    queue.push("c", "standard", key=10.0, since=10.0)
+    restored = WaitQueue.restore(queue.snapshot())
+    assert list(restored) == list(queue) == ["b", "a", "c"]
+    assert len(restored.get("a").backlog) == MAX_BACKLOG
+    assert restored.get("a").backlog[-1] == {"content": str(MAX_BACKLOG + 4)}
+    # New entries still go behind existing ties
+    restored.push("d", "standard", key=10.0, since=11.0)
+    assert list(restored) == ["b", "a", "c", "d"]
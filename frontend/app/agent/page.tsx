@@ -36,6 +36,7 @@ export default function AgentDashboard() {
   const [messageInput, setMessageInput] = useState("")
   const [stats, setStats] = useState({ waiting: 0, active: 0 })
   const wsRef = useRef<WebSocket | null>(null)
+  const queueSeqRef = useRef(0)
   const messagesEndRef = useRef<HTMLDivElement>(null)
 
   useEffect(() => {
@@ -44,9 +45,33 @@ export default function AgentDashboard() {
     ws.onopen = () => setConnected(true)
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data)
-      if (data.type === "initial_state") {
+      if (data.type === "ping") {
+        // Server heartbeat: silent consoles are disconnected
+        ws.send(JSON.stringify({ type: "pong" }))
+      } else if (data.type === "initial_state") {
         setWaitingCustomers(data.waiting_customers || [])
         setStats({ waiting: data.waiting_customers?.length || 0, active: data.active_sessions?.length || 0 })
+      } else if (data.type === "queue_snapshot") {
+        queueSeqRef.current = data.seq
+        setWaitingCustomers(data.queue.map((id: string) => ({ customer_id: id, customer_name: id, created_at: "", status: "waiting" })))
+        setStats((prev) => ({ ...prev, waiting: data.queue_size }))
+      } else if (data.type === "queue_delta") {
+        if (data.seq <= queueSeqRef.current) return
+        if (data.seq !== queueSeqRef.current + 1) {
+          // Missed an update: ask for a fresh snapshot
+          ws.send(JSON.stringify({ action: "get_queue" }))
+          return
+        }
+        queueSeqRef.current = data.seq
+        setWaitingCustomers((prev) => {
+          const touched = new Set<string>([...data.removed, ...data.added.map(([id]: [string, number]) => id)])
+          const next = prev.filter((c) => !touched.has(c.customer_id))
+          for (const [id, index] of data.added) {
+            next.splice(index, 0, { customer_id: id, customer_name: id, created_at: "", status: "waiting" })
+          }
+          return next
+        })
+        setStats((prev) => ({ ...prev, waiting: data.queue_size }))
       } else if (data.type === "new_customer") {
         setWaitingCustomers((prev) => [...prev, { customer_id: data.customer_id, customer_name: data.customer_name, created_at: data.created_at, status: "waiting" }])
         setStats((prev) => ({ ...prev, waiting: prev.waiting + 1 }))
@@ -66,6 +91,45 @@ export default function AgentDashboard() {
           newChats.set(data.customer_id, chat)
           return newChats
         })
+      } else if (data.type === "customer_assigned") {
+        // Routed to this agent (auto-assign or a won accept), with anything sent while waiting
+        setActiveChats((prev) => {
+          const newChats = new Map(prev)
+          const chat = newChats.get(data.customer_id)
+          const backlog: Message[] = (data.messages || []).map((m: { message?: string; content?: string; timestamp: string }) => ({
+            sender: "customer",
+            message: m.message ?? m.content ?? "",
+            timestamp: m.timestamp
+          }))
+          newChats.set(data.customer_id, {
+            customer_id: data.customer_id,
+            customer_name: chat?.customer_name || data.customer_name || data.customer_id,
+            messages: [...(chat?.messages || []), ...backlog]
+          })
+          return newChats
+        })
+        setStats((prev) => ({ ...prev, waiting: data.queue_size }))
+        setWaitingCustomers((prev) => prev.filter((c) => c.customer_id !== data.customer_id))
+        setSelectedCustomer((prev) => prev ?? data.customer_id)
+      } else if (data.type === "accept_failed") {
+        // Another agent got there first (or we are full): undo the optimistic accept
+        if (data.reason === "already_yours") return
+        setActiveChats((prev) => {
+          const newChats = new Map(prev)
+          newChats.delete(data.customer_id)
+          return newChats
+        })
+        setSelectedCustomer((prev) => (prev === data.customer_id ? null : prev))
+        ws.send(JSON.stringify({ action: "get_queue" }))
+      } else if (data.type === "customer_disconnected" || data.type === "agent_left") {
+        // The chat is over: the customer left, or it was taken off this agent
+        setActiveChats((prev) => {
+          const newChats = new Map(prev)
+          newChats.delete(data.customer_id)
+          return newChats
+        })
+        if (data.queue_size !== undefined) setStats((prev) => ({ ...prev, waiting: data.queue_size }))
+        setSelectedCustomer((prev) => (prev === data.customer_id ? null : prev))
       }
     }
     ws.onerror = () => setConnected(false)
@@ -74,6 +138,11 @@ export default function AgentDashboard() {
     return () => ws.close()
   }, [])
 
+  useEffect(() => {
+    // Chats come and go from several message types; count them in one place
+    setStats((prev) => ({ ...prev, active: activeChats.size }))
+  }, [activeChats])
+
   const acceptCustomer = (customerId: string) => {
     if (wsRef.current?.readyState === WebSocket.OPEN) {
       wsRef.current.send(JSON.stringify({ action: "accept_customer", customer_id: customerId }))
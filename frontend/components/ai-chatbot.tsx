@@ -39,6 +39,8 @@ export default function AIChatbot({ onFormFill }: AIChatbotProps) {
   const [conversationCount, setConversationCount] = useState(0)
   const scrollRef = useRef<HTMLDivElement>(null)
   const inactivityTimeoutRef = useRef<NodeJS.Timeout>()
+  // Server-side session: only the new message is sent each turn
+  const sessionRef = useRef<{ id?: string; turn?: number }>({})
   const inputRef = useRef<HTMLInputElement>(null)
 
   // Show bubble immediately on mount
@@ -120,10 +122,8 @@ export default function AIChatbot({ onFormFill }: AIChatbotProps) {
         },
         body: JSON.stringify({
           message: inputValue,
-          conversationHistory: messages.map((m) => ({
-            role: m.sender === "user" ? "user" : "assistant",
-            content: m.text,
-          })),
+          sessionId: sessionRef.current.id,
+          turn: sessionRef.current.turn,
         }),
       })
 
@@ -132,6 +132,9 @@ export default function AIChatbot({ onFormFill }: AIChatbotProps) {
       }
 
       const data = await response.json()
+      if (data.sessionId) {
+        sessionRef.current = { id: data.sessionId, turn: data.turn }
+      }
 
       const botMessage: Message = {
         id: (Date.now() + 1).toString(),
@@ -210,7 +213,10 @@ export default function AIChatbot({ onFormFill }: AIChatbotProps) {
     
     ws.onmessage = (event) => {
       const data = JSON.parse(event.data)
-      if (data.type === "agent_message") {
+      if (data.type === "ping") {
+        // Server heartbeat: silent connections are dropped from the agent queue
+        ws.send(JSON.stringify({ type: "pong" }))
+      } else if (data.type === "agent_message") {
         const agentMsg: Message = {
           id: Date.now().toString(),
           text: data.message,